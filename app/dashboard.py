@@ -178,6 +178,22 @@ def main_dashboard():
                 st.metric("严重故障", health['critical_count'], delta="需关注", delta_color="inverse")
             with col_d3:
                 st.metric("需要维护", health['maintenance_needed'])
+            
+            # 区域 × 设备类型健康热力图（前端绘制）
+            heatmap_data = fetch_api("devices/health-heatmap?days=7")
+            if heatmap_data and heatmap_data['status'] == 'success' and heatmap_data['data']['index']:
+                heatmap = heatmap_data['data']
+                fig = px.imshow(
+                    heatmap['values'],
+                    x=heatmap['columns'],
+                    y=heatmap['index'],
+                    color_continuous_scale='RdYlGn',
+                    zmin=0,
+                    zmax=100,
+                    text_auto='.1f',
+                    labels={'x': '设备类型', 'y': '区域', 'color': '健康评分'}
+                )
+                st.plotly_chart(fig, use_container_width=True)
     
     with col_right:
         # 风险警报列表
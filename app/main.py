@@ -6,7 +6,8 @@ FastAPI主应用
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, List, Dict
 from datetime import datetime, timedelta
@@ -18,8 +19,10 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from modules.alarm_analysis.alarm_analyzer import AlarmAnalyzer
+from modules.alarm_analysis.alarm_stream import AlarmStreamProcessor
 from modules.anomaly_detection.vision_detector import VisionDetector
 from modules.device_management.device_monitor import DeviceMonitor
+from modules.device_management.health_heatmap import ARROW_MEDIA_TYPE, heatmap_to_arrow, heatmap_to_dict
 from modules.risk_assessment.risk_analyzer import RiskAnalyzer
 from modules.llm_adapter import get_llm
 # CrewAI暂时禁用（可选功能，需要单独安装: pip install crewai）
@@ -48,6 +51,22 @@ alarm_analyzer = AlarmAnalyzer()
 vision_detector = VisionDetector()
 device_monitor = DeviceMonitor()
 risk_analyzer = RiskAnalyzer()
+alarm_stream = AlarmStreamProcessor(alarm_analyzer.thresholds,
+                                    log_dir=str(alarm_analyzer.data_dir / 'stream'))
+
+
+@app.on_event("startup")
+async def start_alarm_stream():
+    """启动实时报警流消费者"""
+    alarm_stream.start()
+
+
+@app.on_event("startup")
+async def start_device_telemetry():
+    """配置了DEVICE_TELEMETRY_UDP_PORT时启动设备心跳UDP监听"""
+    port = os.getenv('DEVICE_TELEMETRY_UDP_PORT')
+    if port:
+        await device_monitor.telemetry.start_udp_listener(port=int(port))
 
 
 # ========== 数据模型 ==========
@@ -57,6 +76,25 @@ class AlarmQueryRequest(BaseModel):
     end_date: Optional[str] = None
     alarm_types: Optional[List[str]] = None
     include_charts: bool = True
+    include_incidents: bool = True
+
+
+class AlarmEvent(BaseModel):
+    device_id: str
+    alarm_type: str
+    timestamp: Optional[str] = None
+    location: Optional[str] = None
+    area: Optional[str] = None
+    severity: Optional[str] = None
+    description: Optional[str] = None
+
+
+class DeviceTelemetryEvent(BaseModel):
+    device_id: str
+    timestamp: Optional[str] = None
+    status: Optional[str] = None
+    event_type: Optional[str] = None
+    response_time_ms: Optional[float] = None
 
 
 class RiskAssessmentRequest(BaseModel):
@@ -120,12 +158,26 @@ async def query_alarms(request: AlarmQueryRequest):
     """查询报警数据和趋势分析"""
     try:
         date = request.end_date or datetime.now().strftime('%Y-%m-%d')
-        report = alarm_analyzer.analyze(date=date, days=30)
+        
+        # 统计指标由日聚合合并得到，只有当天数据会重新计算
+        days = 30
+        if request.start_date:
+            days = (datetime.strptime(date, '%Y-%m-%d') - datetime.strptime(request.start_date, '%Y-%m-%d')).days + 1
+            if days <= 0:
+                raise HTTPException(status_code=400, detail="start_date不能晚于end_date")
+        
+        # 图表在后台进程池渲染，报告先返回，chart_urls在图表就绪后可访问；
+        # 分析（含事件关联、报警量基线）在线程池中执行，不阻塞事件循环
+        report = await run_in_threadpool(alarm_analyzer.analyze, date=date, days=days,
+                                         include_charts=request.include_charts, wait_for_charts=False,
+                                         include_incidents=request.include_incidents)
         
         return {
             "status": "success",
             "data": report
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"分析失败: {str(e)}")
 
@@ -134,23 +186,144 @@ async def query_alarms(request: AlarmQueryRequest):
 async def get_alarm_trends(days: int = 7):
     """获取报警趋势数据（用于图表）"""
     try:
-        df = alarm_analyzer.load_alarm_data(days=days)
+        # 直接读取日聚合，无需加载明细数据
+        daily_data = alarm_analyzer.get_daily_trends(days=days)
         
-        if df.empty:
+        if not daily_data:
             return {"status": "no_data", "data": []}
         
-        # 按日期聚合
-        daily_data = df.groupby(df['timestamp'].dt.date).agg({
-            'alarm_type': 'count',
-            'response_time': 'mean'
-        }).reset_index()
+        return {
+            "status": "success",
+            "data": daily_data
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/v1/alarms/events")
+async def ingest_alarm_event(event: AlarmEvent):
+    """接收实时报警事件（写入事件日志并进入滑动窗口处理队列）"""
+    try:
+        await alarm_stream.publish(event.dict())
+        
+        return {
+            "status": "accepted",
+            "queued": alarm_stream.queue.qsize()
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/v1/alarms/stream/alerts")
+async def get_stream_alerts(limit: int = 50):
+    """获取实时流触发的最近警报"""
+    alerts = list(alarm_stream.recent_alerts)[-limit:]
+    
+    return {
+        "status": "success",
+        "events_processed": alarm_stream.events_processed,
+        "data": list(reversed(alerts))
+    }
+
+
+@app.get("/api/v1/alarms/stream/counters")
+async def get_stream_counters(scope: str = "device", key: Optional[str] = None):
+    """获取滑动窗口计数（scope: global/device/area）"""
+    if scope not in ('global', 'device', 'area'):
+        raise HTTPException(status_code=400, detail=f"不支持的范围: {scope}")
+    
+    return {
+        "status": "success",
+        "data": alarm_stream.snapshot(scope, key)
+    }
+
+
+@app.get("/api/v1/charts/{filename}")
+async def get_chart(filename: str):
+    """获取报警图表（渲染中返回202）"""
+    chart_service = alarm_analyzer.chart_service
+    status = chart_service.status(filename)
+    
+    if status == 'ready':
+        return FileResponse(path=str(chart_service.output_dir / Path(filename).name), media_type='image/png')
+    if status == 'pending':
+        return JSONResponse(status_code=202, content={"status": "pending", "message": "图表渲染中，请稍后重试"})
+    if status == 'failed':
+        raise HTTPException(status_code=500, detail="图表渲染失败")
+    raise HTTPException(status_code=404, detail="图表不存在")
+
+
+@app.get("/api/v1/alarms/counts")
+async def get_alarm_counts(group_by: str = "device", start: Optional[str] = None,
+                           end: Optional[str] = None, device_id: Optional[str] = None,
+                           alarm_type: Optional[str] = None):
+    """按设备/小时/日期等维度统计报警（查询SQLite数据仓库）"""
+    try:
+        data = await run_in_threadpool(alarm_analyzer.query_alarm_counts, group_by, start, end,
+                                       device_id, alarm_type)
         
-        daily_data.columns = ['date', 'alarm_count', 'avg_response_time']
+        return {
+            "status": "success",
+            "data": data
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/v1/alarms/cube")
+async def get_alarm_cube(rows: str = "day_of_week", columns: Optional[str] = "hour",
+                         start: Optional[str] = None, end: Optional[str] = None,
+                         area: Optional[str] = None, alarm_type: Optional[str] = None,
+                         severity: Optional[str] = None, device_id: Optional[str] = None,
+                         hour: Optional[int] = None, day_of_week: Optional[int] = None):
+    """报警数多维透视（任意两个维度，默认星期×小时热力图）"""
+    try:
+        filters = {'area': area, 'alarm_type': alarm_type, 'severity': severity, 'device_id': device_id,
+                   'hour': hour, 'day_of_week': day_of_week}
+        data = await run_in_threadpool(alarm_analyzer.query_cube, rows, columns or None, filters, start, end)
         
         return {
             "status": "success",
-            "data": daily_data.to_dict('records')
+            "data": data
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/v1/alarms/forecast")
+async def get_alarm_forecast(by: str = "area", horizon: int = 7, refit: bool = False):
+    """预测各区域/设备未来几天的报警数（含95%预测区间）"""
+    try:
+        data = await run_in_threadpool(alarm_analyzer.forecast_alarms, by=by, horizon=horizon, refit=refit)
+        
+        return {
+            "status": "success",
+            "data": data
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/v1/alarms/response-times")
+async def get_response_time_percentiles(days: int = 30, by: Optional[str] = None):
+    """获取响应时间p50/p90/p99（可按设备或区域分组）"""
+    try:
+        data = alarm_analyzer.get_response_time_percentiles(days=days, by=by)
+        
+        return {
+            "status": "success",
+            "data": data
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -201,11 +374,40 @@ async def get_risk_alerts(hours: int = 24):
 
 # ========== 设备管理API ==========
 
+@app.post("/api/v1/devices/telemetry")
+async def ingest_device_telemetry(events: List[DeviceTelemetryEvent]):
+    """接收设备心跳/状态事件（批量），写入实时遥测缓冲区"""
+    accepted, errors = device_monitor.telemetry.record_many(e.dict() for e in events)
+    
+    if errors and not accepted:
+        raise HTTPException(status_code=400, detail="; ".join(errors[:10]))
+    
+    return {
+        "status": "accepted",
+        "accepted": accepted,
+        "rejected": len(errors),
+        "errors": errors[:10]
+    }
+
+
 @app.get("/api/v1/devices/status")
-async def get_device_status(device_ids: Optional[str] = None):
-    """查询设备健康状态"""
+async def get_device_status(device_ids: Optional[str] = None, source: str = "auto"):
+    """
+    查询设备健康状态
+    
+    source: live（实时遥测）/ batch（最近7天日志）/ auto（有遥测数据的设备用实时遥测，其余设备用最近7天日志）
+    """
+    if source not in ('auto', 'live', 'batch'):
+        raise HTTPException(status_code=400, detail=f"不支持的数据来源: {source}")
+    
     try:
-        report = device_monitor.monitor_all_devices(days=7)
+        # 在线程池中执行（备件检查可能读取库存并预测需求），批处理报告在并发请求间共享（不能原地修改）
+        if source == 'live':
+            report = await run_in_threadpool(device_monitor.monitor_live_devices)
+        else:
+            report = await run_in_threadpool(device_monitor.get_monitor_report, 7)
+            if source == 'auto' and device_monitor.telemetry.device_ids:
+                report = await run_in_threadpool(device_monitor.monitor_live_devices, report)
         
         if device_ids:
             device_list = device_ids.split(',')
@@ -213,7 +415,7 @@ async def get_device_status(device_ids: Optional[str] = None):
                 d for d in report['device_health']
                 if d['device_id'] in device_list
             ]
-            report['device_health'] = filtered_devices
+            report = {**report, 'device_health': filtered_devices}
         
         return {
             "status": "success",
@@ -227,7 +429,7 @@ async def get_device_status(device_ids: Optional[str] = None):
 async def get_device_health_summary():
     """获取设备健康状态摘要（用于仪表盘）"""
     try:
-        report = device_monitor.monitor_all_devices(days=7)
+        report = await run_in_threadpool(device_monitor.get_monitor_report, 7)
         
         return {
             "status": "success",
@@ -256,6 +458,100 @@ async def get_device_health_summary():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/v1/devices/maintenance-schedule")
+async def get_maintenance_schedule(days: int = 5):
+    """生成未来N天的维修班组排程"""
+    if not 1 <= days <= 30:
+        raise HTTPException(status_code=400, detail="days需在1-30之间")
+    
+    try:
+        plan = await run_in_threadpool(device_monitor.plan_maintenance, days)
+        if plan['status'] != 'success':
+            raise HTTPException(status_code=404, detail=plan['message'])
+        
+        return {
+            "status": "success",
+            "data": plan
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/v1/devices/health-heatmap")
+async def get_device_health_heatmap(days: int = 7, by_area: bool = True, format: str = "json"):
+    """
+    设备健康热力图（区域 × 设备类型平均健康评分）
+    
+    format: json（透视矩阵）/ arrow（Arrow IPC流，供仪表盘交互式绘制）/ png（服务端渲染的图片）
+    """
+    if format not in ('json', 'arrow', 'png'):
+        raise HTTPException(status_code=400, detail=f"不支持的格式: {format}")
+    
+    try:
+        if format == 'png':
+            path = await run_in_threadpool(device_monitor.get_health_heatmap_image, days, by_area)
+            if path is None:
+                raise HTTPException(status_code=404, detail="无设备健康数据")
+            return FileResponse(path=path, media_type='image/png')
+        
+        table = await run_in_threadpool(device_monitor.get_health_heatmap, days, by_area)
+        if format == 'arrow':
+            return Response(content=heatmap_to_arrow(table), media_type=ARROW_MEDIA_TYPE)
+        
+        return {
+            "status": "success",
+            "data": heatmap_to_dict(table)
+        }
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/v1/devices/health-history")
+async def get_device_health_history(
+    device_id: Optional[str] = None,
+    area: Optional[str] = None,
+    last: Optional[int] = None,
+    days: int = 30
+):
+    """
+    设备健康评分历史：指定device_id返回该设备的评分序列，指定area返回区域平均/最低评分序列，
+    都不指定时返回检测到评分骤降的设备
+    """
+    if days not in device_monitor.health_history_days:
+        raise HTTPException(status_code=400,
+                            detail=f"days可选: {', '.join(map(str, device_monitor.health_history_days))}")
+    
+    try:
+        history = device_monitor.health_history(days)
+        if device_id:
+            data = history.device_series(device_id, last=last)
+        elif area:
+            data = {
+                **history.area_series(area, last=last),
+                'score_drops': history.changes(since_run=history.recent_run(last) if last else 0, area=area)
+            }
+        else:
+            data = {
+                'runs': history.n_runs,
+                'score_drops': history.changes(since_run=history.recent_run(last) if last else 0)
+            }
+    
+        return {
+            "status": "success",
+            "data": data
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ========== 视觉分析API ==========
 
 @app.post("/api/v1/vision/analyze")
@@ -0,0 +1,301 @@
+"""
+报警日聚合模块
+按天预先计算可合并的统计量（计数、响应时间求和、类型/设备/区域计数器、响应时间分位数草图），
+7/30/90天报告只需合并日聚合，无需重新扫描原始记录
+"""
+
+import json
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from modules.alarm_analysis.alarm_dedup import collapse_alarm_bursts
+from modules.alarm_analysis.quantile_sketch import KLLSketch, merge_sketch_dicts
+
+
+# 聚合格式版本，字段变化时递增以使旧缓存失效
+AGGREGATE_VERSION = 5
+
+# 计算日聚合需要的列
+AGGREGATE_COLUMNS = ['timestamp', 'alarm_type', 'device_id', 'area', 'response_time', 'is_false_alarm']
+
+
+def empty_aggregate() -> Dict:
+    """空聚合（合并的单位元）"""
+    return {
+        'total_alarms': 0,
+        'raw_total_alarms': 0,
+        'suppressed_by_device': {},
+        'false_alarms': 0,
+        'response_time_sum': 0.0,
+        'response_time_count': 0,
+        'response_time_sketch': None,
+        'device_response_sketches': {},
+        'area_response_sketches': {},
+        'alarm_type_counts': {},
+        'device_counts': {},
+        'area_counts': {},
+        'hour_of_week_counts': [0] * (7 * 24),
+        'device_hour_counts': {},
+    }
+
+
+def _value_counts(df: pd.DataFrame, column: str) -> Dict[str, int]:
+    """列计数（忽略缺失列和零计数类别）"""
+    if column not in df.columns:
+        return {}
+    counts = df[column].value_counts()
+    return {str(k): int(v) for k, v in counts.items() if v > 0}
+
+
+def _group_sketches(response: pd.Series, keys: pd.Series) -> Dict[str, Dict]:
+    """按设备/区域分组构建响应时间草图"""
+    sketches = {}
+    for key, values in response.groupby(keys.loc[response.index], observed=True):
+        sketches[str(key)] = KLLSketch.from_values(values.to_numpy()).to_dict()
+    return sketches
+
+
+def aggregate_frame(df: pd.DataFrame, dedup_gap_seconds: Optional[float] = None) -> Dict:
+    """
+    计算一批报警记录的聚合
+
+    Args:
+        df: 报警记录（单日或任意分块）
+        dedup_gap_seconds: 报警风暴合并间隔（秒），None表示不合并
+
+    Returns:
+        可JSON序列化、可合并的聚合字典；total_alarms等指标基于合并后的事件段，
+        raw_total_alarms为原始报警数
+    """
+    agg = empty_aggregate()
+    if df.empty:
+        return agg
+
+    agg['raw_total_alarms'] = int(len(df))
+
+    if dedup_gap_seconds is not None:
+        raw_device_counts = _value_counts(df, 'device_id')
+        df = collapse_alarm_bursts(df, dedup_gap_seconds)
+        collapsed_device_counts = _value_counts(df, 'device_id')
+        agg['suppressed_by_device'] = {
+            device: n - collapsed_device_counts.get(device, 0)
+            for device, n in raw_device_counts.items()
+            if n > collapsed_device_counts.get(device, 0)
+        }
+
+    agg['total_alarms'] = int(len(df))
+
+    if 'is_false_alarm' in df.columns:
+        agg['false_alarms'] = int((df['is_false_alarm'] == True).sum())
+
+    if 'response_time' in df.columns:
+        response = pd.to_numeric(df['response_time'], errors='coerce').dropna()
+        agg['response_time_sum'] = float(response.sum())
+        agg['response_time_count'] = int(len(response))
+        agg['response_time_sketch'] = KLLSketch.from_values(response.to_numpy()).to_dict()
+
+        if 'device_id' in df.columns:
+            agg['device_response_sketches'] = _group_sketches(response, df['device_id'])
+        if 'area' in df.columns:
+            agg['area_response_sketches'] = _group_sketches(response, df['area'])
+
+    agg['alarm_type_counts'] = _value_counts(df, 'alarm_type')
+    agg['device_counts'] = _value_counts(df, 'device_id')
+    agg['area_counts'] = _value_counts(df, 'area')
+    agg['hour_of_week_counts'] = hour_of_week_counts(df).ravel().tolist()
+    agg['device_hour_counts'] = device_hour_counts(df)
+
+    return agg
+
+
+def hour_of_week_counts(df: pd.DataFrame) -> np.ndarray:
+    """
+    报警时间分布（星期 x 小时）
+
+    Returns:
+        7x24计数矩阵，行为周一至周日
+    """
+    counts = np.zeros((7, 24), dtype=np.int64)
+    if df.empty or 'timestamp' not in df.columns:
+        return counts
+
+    timestamps = df['timestamp'].dropna()
+    slots = timestamps.dt.dayofweek.to_numpy() * 24 + timestamps.dt.hour.to_numpy()
+    counts += np.bincount(slots, minlength=7 * 24).reshape(7, 24)
+    return counts
+
+
+def device_hour_counts(df: pd.DataFrame) -> Dict[str, List[int]]:
+    """
+    各设备每小时报警数
+
+    Returns:
+        {设备ID: 24个小时的计数}，只包含有报警的设备
+    """
+    if df.empty or 'timestamp' not in df.columns or 'device_id' not in df.columns:
+        return {}
+
+    valid = df[df['timestamp'].notna() & df['device_id'].notna()]
+    codes, devices = pd.factorize(valid['device_id'])
+    slots = codes * 24 + valid['timestamp'].dt.hour.to_numpy()
+    counts = np.bincount(slots, minlength=len(devices) * 24).reshape(len(devices), 24)
+
+    return {str(device): counts[i].tolist() for i, device in enumerate(devices)}
+
+
+def _merge_counts(target: Dict, source: Dict):
+    for key, value in source.items():
+        target[key] = target.get(key, 0) + value
+
+
+def merge_aggregates(aggregates: List[Dict]) -> Dict:
+    """合并多个聚合（按天、按分块均可）"""
+    merged = empty_aggregate()
+
+    for agg in aggregates:
+        merged['total_alarms'] += agg['total_alarms']
+        merged['raw_total_alarms'] += agg['raw_total_alarms']
+        merged['false_alarms'] += agg['false_alarms']
+        merged['response_time_sum'] += agg['response_time_sum']
+        merged['response_time_count'] += agg['response_time_count']
+        for field in ('suppressed_by_device', 'alarm_type_counts', 'device_counts', 'area_counts'):
+            _merge_counts(merged[field], agg[field])
+
+    merged['hour_of_week_counts'] = (
+        np.sum([agg['hour_of_week_counts'] for agg in aggregates], axis=0, dtype=np.int64).tolist()
+        if aggregates else empty_aggregate()['hour_of_week_counts']
+    )
+
+    for agg in aggregates:
+        for device, hours in agg['device_hour_counts'].items():
+            current = merged['device_hour_counts'].get(device)
+            merged['device_hour_counts'][device] = (
+                hours if current is None else [a + b for a, b in zip(current, hours)]
+            )
+
+    merged['response_time_sketch'] = merge_sketch_dicts(
+        agg['response_time_sketch'] for agg in aggregates
+    ).to_dict()
+
+    for field in ('device_response_sketches', 'area_response_sketches'):
+        keys = set()
+        for agg in aggregates:
+            keys.update(agg[field])
+        merged[field] = {
+            key: merge_sketch_dicts(agg[field].get(key) for agg in aggregates).to_dict()
+            for key in keys
+        }
+
+    return merged
+
+
+# 报告中输出的响应时间分位点
+RESPONSE_TIME_QUANTILES = {'p50': 0.5, 'p90': 0.9, 'p99': 0.99}
+
+
+def sketch_percentiles(sketch: Optional[Dict]) -> Dict[str, float]:
+    """由序列化草图计算p50/p90/p99"""
+    estimator = KLLSketch.from_dict(sketch)
+    return {
+        name: round(estimator.quantile(q), 2)
+        for name, q in RESPONSE_TIME_QUANTILES.items()
+    }
+
+
+def aggregate_to_statistics(agg: Dict, device_alarm_frequency: int) -> Dict:
+    """
+    将聚合转换为calculate_statistics格式的统计指标
+
+    Args:
+        agg: 合并后的聚合
+        device_alarm_frequency: 高频设备阈值
+
+    Returns:
+        统计指标字典，数据为空时返回空字典
+    """
+    total_alarms = agg['total_alarms']
+    if total_alarms == 0:
+        return {}
+
+    false_alarm_rate = agg['false_alarms'] / total_alarms
+
+    count = agg['response_time_count']
+    avg_response_time = agg['response_time_sum'] / count if count > 0 else float('nan')
+    percentiles = sketch_percentiles(agg['response_time_sketch'])
+
+    def by_count(counts: Dict[str, int]) -> Dict[str, int]:
+        return dict(sorted(counts.items(), key=lambda item: item[1], reverse=True))
+
+    high_frequency_devices = {
+        device: n for device, n in by_count(agg['device_counts']).items()
+        if n > device_alarm_frequency
+    }
+
+    storm_devices = dict(list(by_count(agg['suppressed_by_device']).items())[:10])
+
+    return {
+        'total_alarms': total_alarms,
+        'raw_total_alarms': agg['raw_total_alarms'],
+        'suppressed_alarms': agg['raw_total_alarms'] - total_alarms,
+        'storm_devices': storm_devices,
+        'false_alarms': agg['false_alarms'],
+        'false_alarm_rate': round(false_alarm_rate, 3),
+        'avg_response_time_seconds': round(avg_response_time, 2),
+        'median_response_time_seconds': percentiles['p50'],
+        'response_time_percentiles': percentiles,
+        'alarm_type_distribution': by_count(agg['alarm_type_counts']),
+        'high_frequency_devices': high_frequency_devices,
+        'area_distribution': by_count(agg['area_counts']),
+    }
+
+
+class DailyAggregateCache:
+    """日聚合持久化缓存（每天一个JSON文件，按源文件版本失效）"""
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = Path(cache_dir)
+
+    def _path(self, date: str) -> Path:
+        return self.cache_dir / f'agg_{date}.json'
+
+    def get(self, date: str, source_version: Dict) -> Optional[Dict]:
+        """读取缓存的日聚合，源文件版本不一致时返回None"""
+        path = self._path(date)
+        if not path.exists():
+            return None
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except Exception:
+            return None
+
+        if entry.get('version') != AGGREGATE_VERSION or entry.get('source') != source_version:
+            return None
+
+        return entry['aggregate']
+
+    def put(self, date: str, source_version: Dict, aggregate: Dict):
+        """写入日聚合"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        entry = {
+            'version': AGGREGATE_VERSION,
+            'date': date,
+            'source': source_version,
+            'aggregate': aggregate,
+        }
+
+        path = self._path(date)
+        tmp_path = path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        tmp_path.replace(path)
+
+    def invalidate(self, date: str):
+        """删除某日缓存"""
+        path = self._path(date)
+        if path.exists():
+            path.unlink()
@@ -5,24 +5,36 @@
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 from datetime import datetime, timedelta
 from pathlib import Path
 import json
-from typing import Dict, List, Tuple, Optional
-import matplotlib
-matplotlib.use('Agg')  # 无GUI后端，适合服务器环境
-
-# 设置中文字体
-plt.rcParams['font.sans-serif'] = ['SimHei', 'DejaVu Sans']
-plt.rcParams['axes.unicode_minus'] = False
+from typing import Dict, Iterator, List, Tuple, Optional
+import sys
+import threading
 
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from modules.data_schema import ALARM_SCHEMA, SCHEMA_VERSION, apply_schema, source_columns, write_quarantine
+from modules.alarm_analysis.alarm_store import AlarmStore, PARQUET_SUPPORT
+from modules.alarm_analysis.alarm_aggregates import (
+    AGGREGATE_COLUMNS, DailyAggregateCache, aggregate_frame, aggregate_to_statistics,
+    merge_aggregates, sketch_percentiles)
+from modules.alarm_analysis.chart_renderer import ChartRenderService, build_chart_data
+from modules.alarm_analysis.alarm_warehouse import AlarmWarehouse
+from modules.alarm_analysis.volume_baseline import DeviceVolumeBaseline
+from modules.alarm_analysis.alarm_correlation import AlarmCorrelator
+from modules.alarm_analysis.alarm_cube import AlarmCube
+from modules.alarm_analysis.alarm_forecast import HoltWintersForecaster
+from modules.alarm_analysis.alarm_dedup import collapse_alarm_bursts
 
 class AlarmAnalyzer:
     """报警数据分析器"""
     
-    def __init__(self, data_dir: str = './data/alarms', output_dir: str = './data/reports'):
+    # analyze()实际用到的列，description等大文本列不加载
+    ANALYSIS_COLUMNS = ['timestamp', 'location', 'area', 'alarm_type', 'severity', 'status',
+                        'device_id', 'response_time', 'is_false_alarm']
+    
+    def __init__(self, data_dir: str = './data/alarms', output_dir: str = './data/reports',
+                 dedup_gap_seconds: Optional[float] = 60, warehouse_db: str = './security_ops.db'):
         self.data_dir = Path(data_dir)
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
@@ -34,14 +46,45 @@ class AlarmAnalyzer:
             'avg_response_time': 600,   # 平均响应时间阈值10分钟
             'device_alarm_frequency': 20  # 单设备日报警次数阈值
         }
+        
+        # 报警风暴合并间隔（秒）：同一设备同类报警间隔不超过此值时合并为一个事件段，None表示不合并
+        self.dedup_gap_seconds = dedup_gap_seconds
+        
+        # 列式存储（按日期分区的Parquet），未安装pyarrow时回退到逐日读取CSV
+        self.store = AlarmStore(data_dir=str(self.data_dir)) if PARQUET_SUPPORT else None
+        
+        # 日聚合缓存，与原始数据放在一起
+        self.aggregate_cache = DailyAggregateCache(self.data_dir / 'aggregates')
+        
+        # 图表渲染服务（按聚合数据哈希复用已渲染的图片）
+        self.chart_service = ChartRenderService(output_dir=str(self.output_dir))
+        
+        # SQLite数据仓库（按设备/时间的查询下推到索引）
+        self.warehouse = AlarmWarehouse(warehouse_db)
+        
+        # 设备×星期几×小时报警量基线（由日聚合增量更新）
+        self.volume_baseline = DeviceVolumeBaseline(self.data_dir / 'baseline' / 'device_hour_baseline.npz')
+        
+        # 报警与设备日志、视觉检测的关联引擎
+        self.correlator = AlarmCorrelator()
+        
+        # 日期×小时×区域×类型×严重程度×设备 报警计数立方体（供面板任意维度透视）
+        self.cube = AlarmCube(self.data_dir / 'cube' / 'alarm_cube.npz')
+        # 立方体和预测模型会被API线程池并发访问：同步、透视、预测更新和保存都在此锁内进行
+        self._cube_lock = threading.RLock()
+        
+        # 各维度的报警量预测模型（状态缓存，按需创建）
+        self.forecasters: Dict[str, HoltWintersForecaster] = {}
     
-    def load_alarm_data(self, date: str = None, days: int = 30) -> pd.DataFrame:
+    def load_alarm_data(self, date: str = None, days: int = 30,
+                        columns: Optional[List[str]] = None) -> pd.DataFrame:
         """
-        加载报警数据CSV文件
+        加载报警数据
         
         Args:
             date: 目标日期 (YYYY-MM-DD)，默认为今天
             days: 加载最近N天的数据
+            columns: 需要的列，默认加载全部列
         
         Returns:
             DataFrame包含报警记录
@@ -50,31 +93,135 @@ class AlarmAnalyzer:
             date = datetime.now().strftime('%Y-%m-%d')
         
         target_date = datetime.strptime(date, '%Y-%m-%d')
+        dates = [(target_date - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days)]
+        
+        if self.store is not None:
+            # 仅转换新增或已变更的CSV，然后按分区和列读取
+            self.store.ingest(dates)
+            combined_df = self.store.load(dates, columns)
+        else:
+            combined_df = self._load_csv_files(dates, columns)
+        
+        if combined_df.empty:
+            print(f"未找到{days}天内的报警数据")
+            return pd.DataFrame()
+        
+        # 两种读取路径都已按ALARM_SCHEMA完成类型转换和单位统一
+        return combined_df
+    
+    def _load_csv_files(self, dates: List[str], columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        逐日读取原始CSV文件并按表结构转换（无Parquet支持时使用）
+        
+        读取整行校验，保证不论请求哪些列，剔除的行都与Parquet入库时一致
+        """
         all_data = []
         
-        for i in range(days):
-            file_date = (target_date - timedelta(days=i)).strftime('%Y-%m-%d')
+        for file_date in dates:
             file_path = self.data_dir / f'alarms_{file_date}.csv'
             
             if file_path.exists():
                 try:
-                    df = pd.read_csv(file_path)
-                    all_data.append(df)
+                    df, quarantined = apply_schema(pd.read_csv(file_path), ALARM_SCHEMA)
+                    write_quarantine(quarantined, self.data_dir / 'quarantine' / file_path.name)
+                    all_data.append(df[columns] if columns is not None else df)
                 except Exception as e:
                     print(f"加载文件失败 {file_path}: {e}")
         
         if not all_data:
-            print(f"未找到{days}天内的报警数据")
             return pd.DataFrame()
         
         # 合并所有数据
-        combined_df = pd.concat(all_data, ignore_index=True)
+        return pd.concat(all_data, ignore_index=True)
+    
+    def iter_alarm_chunks(self, file_path: str, chunksize: int = 100000,
+                          columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        """
+        分块读取报警CSV（用于GB级导出文件，内存占用只与分块大小有关）
         
-        # 数据预处理
-        combined_df['timestamp'] = pd.to_datetime(combined_df['timestamp'])
-        combined_df['response_time'] = pd.to_numeric(combined_df.get('response_time', 0), errors='coerce')
+        Args:
+            file_path: CSV文件路径
+            chunksize: 每块行数
+            columns: 需要的列，默认为全部列
         
-        return combined_df
+        Yields:
+            按表结构转换后的报警记录分块（按读取的列校验，不合规的行被丢弃）
+        """
+        raw_columns = source_columns(ALARM_SCHEMA, columns)
+        usecols = (lambda c: c in raw_columns) if columns is not None else None
+        
+        for chunk in pd.read_csv(file_path, chunksize=chunksize, usecols=usecols):
+            chunk, _ = apply_schema(chunk, ALARM_SCHEMA)
+            yield chunk[columns] if columns is not None else chunk
+    
+    def analyze_stream(self, file_path: str, chunksize: int = 100000) -> Dict:
+        """
+        流式分析单个大型报警导出文件
+        
+        逐块折叠到统计聚合和时间热力图累加器中，不会一次性加载完整DataFrame
+        
+        Args:
+            file_path: CSV文件路径
+            chunksize: 每块行数
+        
+        Returns:
+            分析报告（统计指标、阈值警报、星期x小时分布、每日数量）
+        """
+        file_path = Path(file_path)
+        print(f"开始流式分析 {file_path}（每块{chunksize}行）...")
+        
+        aggregate = aggregate_frame(pd.DataFrame())
+        daily_counts = {}
+        chunk_count = 0
+        
+        for chunk in self.iter_alarm_chunks(file_path, chunksize, columns=self.ANALYSIS_COLUMNS):
+            # 风暴合并在分块内进行，跨分块边界的事件段会被拆开
+            aggregate = merge_aggregates([aggregate, aggregate_frame(chunk, self.dedup_gap_seconds)])
+            
+            # 每日数量与统计指标一致，按合并后的事件段计数
+            episodes = collapse_alarm_bursts(chunk, self.dedup_gap_seconds)
+            for day, count in episodes['timestamp'].dt.strftime('%Y-%m-%d').value_counts().items():
+                daily_counts[day] = daily_counts.get(day, 0) + int(count)
+            
+            chunk_count += 1
+        
+        # 时间热力图取自同一份（事件段）聚合，与统计指标口径一致
+        heatmap = np.asarray(aggregate['hour_of_week_counts'], dtype=np.int64).reshape(7, 24)
+        
+        stats = aggregate_to_statistics(aggregate, self.thresholds['device_alarm_frequency'])
+        
+        if not stats:
+            return {
+                'status': 'error',
+                'message': '未找到报警数据',
+                'source_file': str(file_path)
+            }
+        
+        stats['analysis_timestamp'] = datetime.now().isoformat()
+        alerts = self.check_thresholds(stats)
+        
+        day_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+        
+        report = {
+            'status': 'success',
+            'source_file': str(file_path),
+            'chunks_processed': chunk_count,
+            'statistics': stats,
+            'threshold_alerts': alerts,
+            'hourly_heatmap': {day: heatmap[i].tolist() for i, day in enumerate(day_names)},
+            'daily_counts': dict(sorted(daily_counts.items())),
+            'recommendations': self._generate_recommendations(stats, alerts)
+        }
+        
+        report_path = self.output_dir / f'alarm_stream_report_{file_path.stem}.json'
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        
+        report['report_path'] = str(report_path)
+        
+        print(f"流式分析完成！共处理{chunk_count}块，报告已保存到: {report_path}")
+        
+        return report
     
     def calculate_statistics(self, df: pd.DataFrame) -> Dict:
         """
@@ -87,11 +234,11 @@ class AlarmAnalyzer:
             return {}
         
         total_alarms = len(df)
-        false_alarms = len(df[df.get('is_false_alarm', False) == True])
+        false_alarms = int((df['is_false_alarm'] == True).sum()) if 'is_false_alarm' in df.columns else 0
         false_alarm_rate = false_alarms / total_alarms if total_alarms > 0 else 0
         
-        avg_response_time = df['response_time'].mean()
-        median_response_time = df['response_time'].median()
+        avg_response_time = float(df['response_time'].mean())
+        median_response_time = float(df['response_time'].median())
         
         # 报警类型分布
         alarm_type_dist = df['alarm_type'].value_counts().to_dict()
@@ -117,6 +264,311 @@ class AlarmAnalyzer:
         
         return stats
     
+    def _source_version(self, date: str) -> Optional[Dict]:
+        """某日原始CSV的版本标识（修改时间+大小+表结构版本+合并间隔），文件不存在时返回None"""
+        file_path = self.data_dir / f'alarms_{date}.csv'
+        if not file_path.exists():
+            return None
+        
+        stat = file_path.stat()
+        return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'schema_version': SCHEMA_VERSION,
+                'dedup_gap_seconds': self.dedup_gap_seconds}
+    
+    def get_daily_aggregates(self, date: str = None, days: int = 30) -> Dict[str, Dict]:
+        """
+        获取最近N天的日聚合
+        
+        历史日期直接读取缓存，仅当天或源文件有变化的日期重新计算
+        
+        Args:
+            date: 截止日期 (YYYY-MM-DD)，默认为今天
+            days: 天数
+        
+        Returns:
+            {日期: 日聚合}，按日期升序
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        if date is None:
+            date = today
+        
+        target_date = datetime.strptime(date, '%Y-%m-%d')
+        daily_aggregates = {}
+        
+        for i in reversed(range(days)):
+            file_date = (target_date - timedelta(days=i)).strftime('%Y-%m-%d')
+            version = self._source_version(file_date)
+            if version is None:
+                continue
+            
+            # 当天数据仍在追加，总是重新计算
+            aggregate = None if file_date >= today else self.aggregate_cache.get(file_date, version)
+            
+            if aggregate is None:
+                df = self.load_alarm_data(file_date, days=1, columns=AGGREGATE_COLUMNS)
+                aggregate = aggregate_frame(df, self.dedup_gap_seconds)
+                self.aggregate_cache.put(file_date, version, aggregate)
+            
+            daily_aggregates[file_date] = aggregate
+        
+        return daily_aggregates
+    
+    def calculate_statistics_from_aggregates(self, daily_aggregates: Dict[str, Dict]) -> Dict:
+        """
+        由日聚合合并计算统计指标（结果格式与calculate_statistics一致）
+        """
+        merged = merge_aggregates(list(daily_aggregates.values()))
+        stats = aggregate_to_statistics(merged, self.thresholds['device_alarm_frequency'])
+        
+        if stats:
+            stats['analysis_timestamp'] = datetime.now().isoformat()
+        
+        return stats
+    
+    def get_response_time_percentiles(self, date: str = None, days: int = 30,
+                                      by: Optional[str] = None) -> Dict:
+        """
+        任意时间窗口的响应时间p50/p90/p99（由存储的日草图合并，不扫描明细）
+        
+        Args:
+            date: 截止日期 (YYYY-MM-DD)，默认为今天
+            days: 天数
+            by: 分组维度，None为整体，'device'按设备，'area'按区域
+        
+        Returns:
+            整体分位数，或{设备/区域: 分位数}
+        """
+        daily_aggregates = list(self.get_daily_aggregates(date, days).values())
+        merged = merge_aggregates(daily_aggregates)
+        
+        if by is None:
+            return sketch_percentiles(merged['response_time_sketch'])
+        
+        field = {'device': 'device_response_sketches', 'area': 'area_response_sketches'}.get(by)
+        if field is None:
+            raise ValueError(f"不支持的分组维度: {by}")
+        
+        return {key: sketch_percentiles(sketch) for key, sketch in sorted(merged[field].items())}
+    
+    def get_daily_trends(self, date: str = None, days: int = 7) -> List[Dict]:
+        """
+        每日报警数量和平均响应时间（用于趋势图表）
+        
+        Returns:
+            [{'date', 'alarm_count', 'avg_response_time'}]，按日期升序
+        """
+        trends = []
+        
+        for file_date, aggregate in self.get_daily_aggregates(date, days).items():
+            if aggregate['total_alarms'] == 0:
+                continue
+            
+            count = aggregate['response_time_count']
+            trends.append({
+                'date': file_date,
+                'alarm_count': aggregate['total_alarms'],
+                'avg_response_time': aggregate['response_time_sum'] / count if count > 0 else None
+            })
+        
+        return trends
+    
+    def detect_volume_anomalies(self, date: str = None, aggregate: Optional[Dict] = None,
+                                bootstrap_days: int = 56) -> List[Dict]:
+        """
+        检测某天设备小时报警量相对基线的显著偏离
+        
+        先用date之前尚未计入基线的日聚合更新基线（首次使用时回溯bootstrap_days天），
+        再对date当天打分，date当天的数据不计入基线；
+        回溯分析历史日期时（持久基线已计入date及之后的数据），改用只由date之前
+        bootstrap_days天数据拟合的临时基线，不影响持久基线
+        
+        Args:
+            date: 检测日期 (YYYY-MM-DD)，默认为今天
+            aggregate: date当天的日聚合，未提供时自动计算
+            bootstrap_days: 基线为空时回溯的天数
+        
+        Returns:
+            异常列表，见DeviceVolumeBaseline.detect
+        """
+        if date is None:
+            date = datetime.now().strftime('%Y-%m-%d')
+        
+        target_date = datetime.strptime(date, '%Y-%m-%d')
+        baseline = self.volume_baseline
+        
+        if baseline.last_date is not None and baseline.last_date >= date:
+            baseline = baseline.empty_copy()
+        
+        if baseline.last_date is None:
+            pending_days = bootstrap_days
+        else:
+            pending_days = (target_date - datetime.strptime(baseline.last_date, '%Y-%m-%d')).days - 1
+        
+        if pending_days > 0:
+            previous_day = (target_date - timedelta(days=1)).strftime('%Y-%m-%d')
+            history = self.get_daily_aggregates(previous_day, pending_days)
+            for file_date, daily in history.items():
+                baseline.update_day(file_date, daily['device_hour_counts'])
+            if history:
+                baseline.save()
+        
+        if aggregate is None:
+            aggregate = self.get_daily_aggregates(date, 1).get(date)
+        if aggregate is None:
+            return []
+        
+        return baseline.detect(date, aggregate['device_hour_counts'])
+    
+    def get_incidents(self, date: str = None) -> List[Dict]:
+        """
+        关联某天的报警、设备异常事件和视觉检测，生成事件组
+        
+        Returns:
+            事件组列表，见AlarmCorrelator.correlate
+        """
+        if date is None:
+            date = datetime.now().strftime('%Y-%m-%d')
+        
+        df = self.load_alarm_data(date, days=1,
+                                  columns=['timestamp', 'location', 'area', 'alarm_type', 'severity', 'device_id'])
+        if df.empty:
+            return []
+        
+        start = datetime.strptime(date, '%Y-%m-%d')
+        return self.correlator.correlate_alarms(df, start, start + timedelta(days=1))
+    
+    def sync_cube(self, dates: Optional[List[str]] = None) -> Dict:
+        """
+        增量更新报警立方体（只重建新增或源文件有变化的日期）
+        
+        Args:
+            dates: 需要检查的日期，默认为数据目录下所有CSV
+        
+        Returns:
+            {'updated': [日期], 'skipped': 未变化的天数}
+        """
+        if dates is None:
+            dates = sorted(p.stem[len('alarms_'):] for p in self.data_dir.glob('alarms_*.csv'))
+        
+        updated = []
+        skipped = 0
+        
+        with self._cube_lock:
+            for file_date in dates:
+                version = self._source_version(file_date)
+                if version is None or self.cube.is_current(file_date, version):
+                    skipped += 1
+                    continue
+                
+                df = self.load_alarm_data(file_date, days=1,
+                                          columns=['timestamp', 'location', 'area', 'alarm_type', 'severity', 'device_id'])
+                if not df.empty:
+                    df = collapse_alarm_bursts(df, self.dedup_gap_seconds)
+                self.cube.update_day(file_date, df, version)
+                updated.append(file_date)
+            
+            if updated:
+                self.cube.save()
+        
+        return {'updated': updated, 'skipped': skipped}
+    
+    def query_cube(self, rows: str, columns: Optional[str] = None, filters: Optional[Dict] = None,
+                   start: Optional[str] = None, end: Optional[str] = None) -> Dict:
+        """
+        报警数透视（先同步有变化的日期，再在立方体上切片汇总）
+        
+        Args:
+            rows: 行维度 day / day_of_week / hour / area / alarm_type / severity / device_id
+            columns: 列维度，None时只按行维度汇总
+            filters: 过滤条件 {维度: 取值或取值列表}
+            start: 开始日期 (YYYY-MM-DD)
+            end: 结束日期 (YYYY-MM-DD)
+        
+        Returns:
+            透视结果，见AlarmCube.pivot
+        """
+        with self._cube_lock:
+            self.sync_cube()
+            return self.cube.pivot(rows, columns, filters, start, end)
+    
+    def forecast_alarms(self, by: str = 'area', horizon: int = 7, refit: bool = False) -> Dict:
+        """
+        预测各区域/设备未来几天的报警数
+        
+        日报警数取自报警立方体；模型只用尚未拟合过的完整日期（不含当天）增量更新
+        
+        Args:
+            by: 预测维度 area / device_id
+            horizon: 预测天数（1-90）
+            refit: 是否丢弃缓存状态从头拟合
+        
+        Returns:
+            {'by', 'fitted_through', 'forecasts': {名称: [{'date', 'expected', 'lower', 'upper'}]}}
+        
+        Raises:
+            ValueError: 预测维度不支持或预测天数超出范围
+        """
+        if by not in ('area', 'device_id'):
+            raise ValueError(f"不支持的预测维度: {by}")
+        if not 1 <= horizon <= 90:
+            raise ValueError("horizon需在1-90之间")
+        
+        # 与立方体查询共用锁：同步、透视、模型更新和保存期间不被其他请求打断
+        with self._cube_lock:
+            forecaster = self.forecasters.get(by)
+            if forecaster is None:
+                forecaster = HoltWintersForecaster(self.data_dir / 'forecast' / f'forecast_{by}.npz')
+                self.forecasters[by] = forecaster
+            if refit:
+                forecaster.reset()
+            
+            self.sync_cube()
+            today = datetime.now().strftime('%Y-%m-%d')
+            days = [day for day in self.cube.labels['day']
+                    if day < today and (forecaster.last_date is None or day > forecaster.last_date)]
+            
+            if days:
+                # 补齐中间没有报警的日期，保证按天连续更新
+                start = datetime.strptime(forecaster.last_date, '%Y-%m-%d') + timedelta(days=1) \
+                    if forecaster.last_date else datetime.strptime(min(days), '%Y-%m-%d')
+                dates = [d.strftime('%Y-%m-%d') for d in pd.date_range(start, max(days))]
+                
+                pivot = self.cube.pivot(by, 'day', start=dates[0], end=dates[-1])
+                counts = np.zeros((len(pivot['row_labels']), len(dates)))
+                if pivot['row_labels']:
+                    day_index = {day: i for i, day in enumerate(dates)}
+                    counts[:, [day_index[day] for day in pivot['column_labels']]] = pivot['values']
+                
+                forecaster.update(dates, pivot['row_labels'], counts)
+                forecaster.save()
+            
+            return {
+                'by': by,
+                'fitted_through': forecaster.last_date,
+                'forecasts': forecaster.forecast(horizon)
+            }
+    
+    def sync_warehouse(self, force: bool = False) -> Dict:
+        """将数据目录下新增或变更的报警CSV导入SQLite数据仓库"""
+        return self.warehouse.ingest_directory(self.data_dir, force=force)
+    
+    def query_alarm_counts(self, group_by: str = 'device', start: str = None, end: str = None,
+                           device_id: str = None, alarm_type: str = None) -> List[Dict]:
+        """
+        按设备/小时/日期等维度统计报警（先增量导入新增或变更的CSV，过滤和分组在SQL中完成）
+        
+        Args:
+            group_by: device / alarm_type / area / location / day / hour / hour_of_day
+            start: 开始时间 (YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS)
+            end: 结束时间
+            device_id: 只统计某个设备
+            alarm_type: 只统计某类报警
+        
+        Returns:
+            分组统计列表
+        """
+        self.sync_warehouse()
+        return self.warehouse.query_counts(group_by, start, end, device_id, alarm_type)
+    
     def check_thresholds(self, stats: Dict) -> List[Dict]:
         """
         检查是否触发阈值警报
@@ -161,88 +613,44 @@ class AlarmAnalyzer:
                 'devices': list(stats['high_frequency_devices'].keys())
             })
         
+        if stats.get('volume_anomalies'):
+            anomaly_devices = list(dict.fromkeys(a['device_id'] for a in stats['volume_anomalies']))
+            alerts.append({
+                'level': 'medium',
+                'type': 'device_volume_anomaly',
+                'message': f"发现{len(anomaly_devices)}个设备的小时报警量显著高于历史基线",
+                'devices': anomaly_devices
+            })
+        
         return alerts
     
     def generate_trend_charts(self, df: pd.DataFrame, date: str) -> Dict[str, str]:
         """
-        生成趋势分析图表
+        由明细数据生成趋势分析图表（同步等待渲染完成）
         
         Returns:
             图表文件路径字典
         """
-        chart_paths = {}
-        
         if df.empty:
-            return chart_paths
-        
-        # 1. 7天和30天趋势对比图
-        fig, axes = plt.subplots(2, 2, figsize=(16, 12))
-        fig.suptitle(f'报警趋势分析 - {date}', fontsize=16, fontweight='bold')
-        
-        # 每日报警数量趋势
-        daily_counts = df.groupby(df['timestamp'].dt.date).size()
-        axes[0, 0].plot(daily_counts.index, daily_counts.values, marker='o', linewidth=2)
-        axes[0, 0].set_title('每日报警数量趋势', fontsize=12)
-        axes[0, 0].set_xlabel('日期')
-        axes[0, 0].set_ylabel('报警数量')
-        axes[0, 0].grid(True, alpha=0.3)
-        axes[0, 0].tick_params(axis='x', rotation=45)
-        
-        # 报警类型分布饼图
-        alarm_type_counts = df['alarm_type'].value_counts()
-        axes[0, 1].pie(alarm_type_counts.values, labels=alarm_type_counts.index, autopct='%1.1f%%')
-        axes[0, 1].set_title('报警类型分布', fontsize=12)
-        
-        # 每小时报警分布热力图
-        df['hour'] = df['timestamp'].dt.hour
-        df['day_of_week'] = df['timestamp'].dt.day_name()
-        hourly_heatmap = df.groupby(['day_of_week', 'hour']).size().unstack(fill_value=0)
-        sns.heatmap(hourly_heatmap, cmap='YlOrRd', annot=True, fmt='d', ax=axes[1, 0])
-        axes[1, 0].set_title('报警时间热力图（星期 x 小时）', fontsize=12)
-        axes[1, 0].set_xlabel('小时')
-        axes[1, 0].set_ylabel('星期')
-        
-        # 响应时间分布箱线图
-        if 'response_time' in df.columns:
-            df_response = df[df['response_time'] > 0]
-            if not df_response.empty:
-                axes[1, 1].boxplot(df_response['response_time'] / 60)  # 转换为分钟
-                axes[1, 1].set_title('响应时间分布', fontsize=12)
-                axes[1, 1].set_ylabel('响应时间 (分钟)')
-                axes[1, 1].grid(True, alpha=0.3)
-        
-        plt.tight_layout()
-        trend_chart_path = self.output_dir / f'alarm_trends_{date}.png'
-        plt.savefig(trend_chart_path, dpi=150, bbox_inches='tight')
-        plt.close()
-        
-        chart_paths['trend_chart'] = str(trend_chart_path)
-        
-        # 2. 设备报警频率Top 10柱状图
-        fig, ax = plt.subplots(figsize=(12, 6))
-        device_counts = df['device_id'].value_counts().head(10)
-        device_counts.plot(kind='barh', ax=ax, color='steelblue')
-        ax.set_title('高频报警设备 Top 10', fontsize=14, fontweight='bold')
-        ax.set_xlabel('报警次数')
-        ax.set_ylabel('设备ID')
-        ax.grid(True, alpha=0.3, axis='x')
-        
-        plt.tight_layout()
-        device_chart_path = self.output_dir / f'device_frequency_{date}.png'
-        plt.savefig(device_chart_path, dpi=150, bbox_inches='tight')
-        plt.close()
-        
-        chart_paths['device_frequency_chart'] = str(device_chart_path)
-        
-        return chart_paths
+            return {}
+        
+        daily_aggregates = {
+            str(day): aggregate_frame(group, self.dedup_gap_seconds)
+            for day, group in df.groupby(df['timestamp'].dt.date)
+        }
+        return self.chart_service.render(build_chart_data(daily_aggregates, date))
     
-    def analyze(self, date: str = None, days: int = 30) -> Dict:
+    def analyze(self, date: str = None, days: int = 30, include_charts: bool = True,
+                wait_for_charts: bool = True, include_incidents: bool = True) -> Dict:
         """
         执行完整的报警分析流程
         
         Args:
             date: 分析日期
             days: 加载天数
+            include_charts: 是否生成趋势图表
+            wait_for_charts: 是否等待图表渲染完成；False时后台渲染，报告中的图表链接稍后可用
+            include_incidents: 是否关联分析日期当天的报警、设备日志和视觉检测
         
         Returns:
             完整分析报告
@@ -252,24 +660,42 @@ class AlarmAnalyzer:
         
         print(f"开始分析 {date} 的报警数据（最近{days}天）...")
         
-        # 加载数据
-        df = self.load_alarm_data(date, days)
+        # 合并日聚合计算统计指标（只重新计算当天和有变化的日期）
+        daily_aggregates = self.get_daily_aggregates(date, days)
+        stats = self.calculate_statistics_from_aggregates(daily_aggregates)
         
-        if df.empty:
+        if not stats:
             return {
                 'status': 'error',
                 'message': '未找到报警数据',
                 'date': date
             }
         
-        # 计算统计指标
-        stats = self.calculate_statistics(df)
+        # 设备小时报警量与历史基线对比
+        stats['volume_anomalies'] = self.detect_volume_anomalies(date, daily_aggregates.get(date))
         
         # 检查阈值
         alerts = self.check_thresholds(stats)
         
-        # 生成图表
-        chart_paths = self.generate_trend_charts(df, date)
+        # 跨来源事件关联
+        incidents = []
+        if include_incidents:
+            try:
+                incidents = self.get_incidents(date)
+            except Exception as e:
+                print(f"事件关联失败: {e}")
+            stats['incident_count'] = len(incidents)
+        
+        # 生成图表（由日聚合绘制，数据未变化时复用已有图片）
+        chart_paths = {}
+        chart_urls = {}
+        if include_charts:
+            chart_data = build_chart_data(daily_aggregates, date)
+            if wait_for_charts:
+                chart_paths = self.chart_service.render(chart_data)
+            else:
+                chart_paths = {name: str(path) for name, path in self.chart_service.submit(chart_data).items()}
+            chart_urls = {name: self.chart_service.url_for(path) for name, path in chart_paths.items()}
         
         # 组装报告
         report = {
@@ -279,6 +705,8 @@ class AlarmAnalyzer:
             'statistics': stats,
             'threshold_alerts': alerts,
             'charts': chart_paths,
+            'chart_urls': chart_urls,
+            'incidents': incidents,
             'recommendations': self._generate_recommendations(stats, alerts)
         }
         
@@ -304,9 +732,15 @@ class AlarmAnalyzer:
         if stats.get('avg_response_time_seconds', 0) > 300:
             recommendations.append("平均响应时间较长，建议优化通知流程或增加值班人员")
         
+        if stats.get('storm_devices'):
+            recommendations.append(f"检测到{len(stats['storm_devices'])}个设备存在报警风暴（已合并{stats.get('suppressed_alarms', 0)}条重复报警），建议检查门磁或传感器是否故障")
+        
         if stats.get('high_frequency_devices'):
             recommendations.append(f"检测到{len(stats['high_frequency_devices'])}个高频报警设备，建议优先排查这些设备是否存在硬件故障")
         
+        if stats.get('volume_anomalies'):
+            recommendations.append("部分设备报警量显著偏离其同时段历史水平，建议现场核查是否存在异常进出或设备故障")
+        
         if not alerts:
             recommendations.append("所有指标正常，继续保持当前运营水平")
         
@@ -322,11 +756,44 @@ if __name__ == "__main__":
     parser.add_argument('--days', type=int, help='加载最近N天数据', default=30)
     parser.add_argument('--data-dir', type=str, help='数据目录', default='./data/alarms')
     parser.add_argument('--output-dir', type=str, help='输出目录', default='./data/reports')
+    parser.add_argument('--ingest', action='store_true', help='仅将CSV转换为Parquet分区存储')
+    parser.add_argument('--stream-file', type=str, help='流式分析单个大型CSV导出文件', default=None)
+    parser.add_argument('--chunksize', type=int, help='流式分析每块行数', default=100000)
+    parser.add_argument('--load-warehouse', action='store_true', help='仅将CSV导入SQLite数据仓库')
+    parser.add_argument('--forecast', action='store_true', help='增量拟合并输出各区域未来7天报警量预测')
+    parser.add_argument('--dedup-gap', type=float, help='报警风暴合并间隔（秒），0表示不合并', default=60)
     
     args = parser.parse_args()
     
-    analyzer = AlarmAnalyzer(data_dir=args.data_dir, output_dir=args.output_dir)
-    report = analyzer.analyze(date=args.date, days=args.days)
+    analyzer = AlarmAnalyzer(data_dir=args.data_dir, output_dir=args.output_dir,
+                             dedup_gap_seconds=args.dedup_gap or None)
+    
+    if args.ingest:
+        if analyzer.store is None:
+            print("未安装pyarrow，无法转换为Parquet")
+        else:
+            result = analyzer.store.ingest()
+            print(f"转换完成: {len(result['ingested'])}个分区，跳过{result['skipped']}个未变更文件")
+        result = analyzer.sync_cube()
+        print(f"报警立方体已更新: {len(result['updated'])}天")
+        raise SystemExit(0)
+    
+    if args.load_warehouse:
+        result = analyzer.sync_warehouse()
+        print(f"导入完成: {sum(result['ingested'].values())}条记录，跳过{result['skipped']}个未变更文件")
+        raise SystemExit(0)
+    
+    if args.forecast:
+        result = analyzer.forecast_alarms(by='area')
+        print(f"预测模型已拟合至 {result['fitted_through']}")
+        for area, points in result['forecasts'].items():
+            print(f"  - {area}: " + ", ".join(f"{p['date'][5:]} {p['expected']:.0f} [{p['lower']:.0f}-{p['upper']:.0f}]" for p in points))
+        raise SystemExit(0)
+    
+    if args.stream_file:
+        report = analyzer.analyze_stream(args.stream_file, chunksize=args.chunksize)
+    else:
+        report = analyzer.analyze(date=args.date, days=args.days)
     
     print("\n=== 分析结果摘要 ===")
     print(f"总报警数: {report['statistics']['total_alarms']}")
@@ -0,0 +1,324 @@
+"""
+报警关联分析模块
+将报警、设备日志事件和视觉检测结果按设备/区域和时间窗口关联为事件组（incident），
+例如"强行开门"报警 + force_door 视觉检测 + 门禁控制器重启。
+
+关联方式：每条报警作为一个事件组的锚点，附加同一设备在报警前后一个窗口内的设备日志事件、
+同一区域在窗口内的视觉检测；报警之间不通过设备或区域相互连接，避免同区域的无关报警串联成一个事件组。
+各键内的窗口匹配通过排序和区间端点计数向量化完成，不做两两嵌套比较，
+复杂度为 O(n log n)，可处理每天数百万条事件。
+"""
+
+import sqlite3
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from modules.data_schema import DEVICE_LOG_SCHEMA, apply_schema, source_columns
+from modules.device_management.device_log_store import DeviceLogStore, PARQUET_SUPPORT
+
+# 事件来源
+SOURCE_ALARM = 'alarm'
+SOURCE_DEVICE = 'device'
+SOURCE_VISION = 'vision'
+
+# 设备日志中不参与关联的常规事件（DEVICE_LOG_SCHEMA映射后的标准取值）
+NORMAL_DEVICE_EVENT = 'normal'
+FAULT_STATUS = 'fault'
+
+# 视觉检测中不参与关联的正常行为
+NORMAL_BEHAVIORS = ('normal_swipe',)
+
+SEVERITY_RANK = {'low': 1, 'medium': 2, 'high': 3, 'critical': 4}
+
+EVENT_COLUMNS = ['timestamp', 'source', 'event_type', 'device_id', 'area', 'severity']
+
+
+def normalize_area(values: pd.Series) -> pd.Series:
+    """统一区域名称：'A区门禁' / 'Camera_A区' -> 'A区'"""
+    return (values.astype('string')
+            .str.replace(r'^Camera_', '', regex=True)
+            .str.replace(r'门禁$', '', regex=True))
+
+
+def _window_matches(codes: np.ndarray, ts: np.ndarray, query_codes: np.ndarray,
+                    query_ts: np.ndarray, window_ns: int):
+    """
+    为每个查询点找出关联键相同、时间在±窗口内的事件
+
+    事件按(键, 时间)排序后，与各查询区间的起点、终点一起排序，
+    每个端点之前的事件数即为区间在排序数组中的起止位置，复杂度 O((n + q) log(n + q))
+
+    Args:
+        codes: 事件关联键的整数编码，-1表示不参与关联
+        ts: 事件时间（int64纳秒）
+        query_codes: 查询点的关联键编码，-1表示不查询
+        query_ts: 查询点时间（int64纳秒）
+        window_ns: 关联时间窗口（纳秒）
+
+    Returns:
+        (order, lo, hi)：order为排序后的事件下标，第i个查询点匹配的事件为 order[lo[i]:hi[i]]
+    """
+    valid = np.flatnonzero(codes >= 0)
+    order = valid[np.lexsort((ts[valid], codes[valid]))]
+    n, q = len(order), len(query_ts)
+
+    # 同键同时刻时区间起点排在事件之前、终点排在事件之后（窗口两端都包含）
+    all_codes = np.concatenate([codes[order], query_codes, query_codes])
+    all_ts = np.concatenate([ts[order], query_ts - window_ns, query_ts + window_ns])
+    kind = np.concatenate([np.ones(n, dtype=np.int8), np.zeros(q, dtype=np.int8), np.full(q, 2, dtype=np.int8)])
+    merged = np.lexsort((kind, all_ts, all_codes))
+
+    is_event = (kind[merged] == 1).astype(np.int64)
+    events_before = np.cumsum(is_event) - is_event
+    position = np.empty(len(merged), dtype=np.int64)
+    position[merged] = np.arange(len(merged))
+
+    lo = events_before[position[n:n + q]]
+    hi = events_before[position[n + q:]]
+    hi[query_codes < 0] = lo[query_codes < 0]
+    return order, lo, hi
+
+
+def _expand_matches(order: np.ndarray, lo: np.ndarray, hi: np.ndarray):
+    """把各查询点的匹配区间展开为 (查询序号, 事件下标) 两个扁平数组"""
+    counts = hi - lo
+    query = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return query, order[np.repeat(lo, counts) + offsets]
+
+
+class AlarmCorrelator:
+    """报警/设备日志/视觉检测关联引擎"""
+
+    def __init__(self, device_log_dir: str = './data/devices',
+                 vision_db: str = './data/vision_ai/behavior_data.db',
+                 window_seconds: int = 300, min_confidence: float = 0.5):
+        """
+        Args:
+            device_log_dir: 设备日志目录（device_logs_YYYYMM.csv）
+            vision_db: 视觉检测数据库
+            window_seconds: 关联时间窗口（秒），同一设备/区域在报警前后此时间内的事件归入该报警的事件组
+            min_confidence: 参与关联的视觉检测最低置信度
+        """
+        self.device_log_dir = Path(device_log_dir)
+        self.log_store = DeviceLogStore(data_dir=device_log_dir) if PARQUET_SUPPORT else None
+        self.vision_db = Path(vision_db)
+        self.window_seconds = window_seconds
+        self.min_confidence = min_confidence
+
+    # ---------- 各来源事件 ----------
+
+    @staticmethod
+    def alarm_events(df: pd.DataFrame) -> pd.DataFrame:
+        """报警记录 -> 统一事件格式"""
+        if df.empty:
+            return pd.DataFrame(columns=EVENT_COLUMNS)
+
+        area_source = df['area'] if 'area' in df.columns else df.get('location')
+        return pd.DataFrame({
+            'timestamp': pd.to_datetime(df['timestamp'], errors='coerce'),
+            'source': SOURCE_ALARM,
+            'event_type': df['alarm_type'].astype('string'),
+            'device_id': df['device_id'].astype('string'),
+            'area': normalize_area(area_source) if area_source is not None else pd.NA,
+            'severity': df['severity'].astype('string') if 'severity' in df.columns else pd.NA,
+        })
+
+    def load_device_events(self, start: datetime, end: datetime) -> pd.DataFrame:
+        """加载时间范围内的设备异常事件（重启、错误、维护、故障状态等）"""
+        columns = ['timestamp', 'device_id', 'event_type', 'status']
+        months = [m.strftime('%Y%m') for m in pd.period_range(start, end, freq='M')]
+
+        if self.log_store is not None:
+            # 与设备监控共用Parquet分区：仅转换新增或变更的月份，时间条件和列投影下推到读取
+            self.log_store.ingest(DeviceLogStore.months_since(start, self.log_store.source_months()))
+            logs = self.log_store.load(start=start, columns=columns)
+        else:
+            logs = self._load_csv_files(months, columns)
+
+        if logs.empty:
+            return pd.DataFrame(columns=EVENT_COLUMNS)
+
+        logs = logs[(logs['timestamp'] >= start) & (logs['timestamp'] < end)
+                    & ((logs['event_type'] != NORMAL_DEVICE_EVENT) | (logs['status'] == FAULT_STATUS))]
+
+        return pd.DataFrame({
+            'timestamp': logs['timestamp'],
+            'source': SOURCE_DEVICE,
+            'event_type': logs['event_type'].astype('string'),
+            'device_id': logs['device_id'].astype('string'),
+            'area': pd.NA,
+            'severity': pd.NA,
+        })
+
+    def _load_csv_files(self, months: List[str], columns: List[str]) -> pd.DataFrame:
+        """读取相关月份的原始CSV并按表结构转换（无Parquet支持时使用）"""
+        frames = []
+        raw_columns = source_columns(DEVICE_LOG_SCHEMA, columns)
+
+        for month in months:
+            log_file = self.device_log_dir / f'device_logs_{month}.csv'
+            if not log_file.exists():
+                continue
+            try:
+                logs, _ = apply_schema(pd.read_csv(log_file, usecols=lambda c: c in raw_columns), DEVICE_LOG_SCHEMA)
+                frames.append(logs)
+            except Exception as e:
+                print(f"读取设备日志失败 {log_file}: {e}")
+
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def load_vision_events(self, start: datetime, end: datetime) -> pd.DataFrame:
+        """加载时间范围内的异常行为检测结果（过滤和时间范围在SQL中完成）"""
+        if not self.vision_db.exists():
+            return pd.DataFrame(columns=EVENT_COLUMNS)
+
+        placeholders = ', '.join('?' * len(NORMAL_BEHAVIORS))
+        conn = sqlite3.connect(self.vision_db)
+        try:
+            detections = pd.read_sql_query(f'''
+            SELECT timestamp, video_source, behavior_type
+            FROM detection_results
+            WHERE timestamp >= ? AND timestamp < ?
+              AND confidence >= ?
+              AND behavior_type NOT IN ({placeholders})
+            ''', conn, params=[start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S'),
+                               self.min_confidence, *NORMAL_BEHAVIORS])
+        except Exception as e:
+            print(f"读取视觉检测结果失败: {e}")
+            return pd.DataFrame(columns=EVENT_COLUMNS)
+        finally:
+            conn.close()
+
+        return pd.DataFrame({
+            'timestamp': pd.to_datetime(detections['timestamp'], errors='coerce', format='mixed'),
+            'source': SOURCE_VISION,
+            'event_type': detections['behavior_type'].astype('string'),
+            'device_id': pd.NA,
+            'area': normalize_area(detections['video_source']),
+            'severity': pd.NA,
+        })
+
+    # ---------- 关联 ----------
+
+    def correlate(self, alarm_events: pd.DataFrame, device_events: pd.DataFrame,
+                  vision_events: pd.DataFrame, max_incidents: Optional[int] = 200,
+                  max_events_per_incident: int = 20) -> List[Dict]:
+        """
+        关联三类事件并生成事件组
+
+        每条报警一个事件组：附加同设备的设备日志和同区域的视觉检测（报警前后各一个窗口内）；
+        只返回至少附加了一条其他来源事件的事件组
+
+        Args:
+            alarm_events/device_events/vision_events: 统一事件格式的DataFrame
+            max_incidents: 最多返回的事件组数（按事件数降序），None表示全部
+            max_events_per_incident: 每个事件组附带的明细事件数上限
+
+        Returns:
+            事件组列表，按开始时间排序
+        """
+        alarms, device_events, vision_events = (
+            f[f['timestamp'].notna()].reset_index(drop=True) if not f.empty else pd.DataFrame(columns=EVENT_COLUMNS)
+            for f in (alarm_events, device_events, vision_events)
+        )
+        if alarms.empty:
+            return []
+
+        def to_ns(frame: pd.DataFrame) -> np.ndarray:
+            return frame['timestamp'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+
+        def shared_codes(left: pd.Series, right: pd.Series):
+            codes = pd.factorize(pd.concat([left, right], ignore_index=True))[0]
+            return codes[:len(left)], codes[len(left):]
+
+        alarm_ts = to_ns(alarms)
+        window_ns = int(self.window_seconds * 1e9)
+
+        # 每条报警单独作为事件组的锚点：同设备的设备日志、同区域的视觉检测在报警前后一个窗口内即附加，
+        # 报警之间不相互连接，事件组的时间跨度不超过两个窗口
+        alarm_device, device_codes = shared_codes(alarms['device_id'], device_events['device_id'])
+        device_order, device_lo, device_hi = _window_matches(
+            device_codes, to_ns(device_events), alarm_device, alarm_ts, window_ns)
+
+        alarm_area, area_codes = shared_codes(alarms['area'], vision_events['area'])
+        vision_order, vision_lo, vision_hi = _window_matches(
+            area_codes, to_ns(vision_events), alarm_area, alarm_ts, window_ns)
+
+        sources = (SOURCE_ALARM, SOURCE_DEVICE, SOURCE_VISION)
+        per_source = np.column_stack([np.ones(len(alarms), dtype=np.int64),
+                                      device_hi - device_lo, vision_hi - vision_lo])
+
+        keep = np.flatnonzero(per_source[:, 1:].sum(axis=1) > 0)
+        if len(keep) == 0:
+            return []
+
+        selected = keep[np.argsort(-per_source[keep].sum(axis=1), kind='stable')]
+        if max_incidents is not None:
+            selected = selected[:max_incidents]
+        per_source = per_source[selected]
+
+        device_incident, device_idx = _expand_matches(device_order, device_lo[selected], device_hi[selected])
+        vision_incident, vision_idx = _expand_matches(vision_order, vision_lo[selected], vision_hi[selected])
+
+        incident_events = pd.concat([
+            alarms.iloc[selected].assign(incident=np.arange(len(selected))),
+            device_events.iloc[device_idx].assign(incident=device_incident),
+            vision_events.iloc[vision_idx].assign(incident=vision_incident),
+        ], ignore_index=True).sort_values(['incident', 'timestamp'], kind='stable')
+        incident_events['severity_rank'] = incident_events['severity'].map(SEVERITY_RANK)
+
+        incidents = []
+        for label, group in incident_events.groupby('incident', sort=False):
+            by_source = group.groupby('source')['event_type'].unique()
+            severity_rank = group['severity_rank'].max()
+            start, end = group['timestamp'].iloc[0], group['timestamp'].iloc[-1]
+
+            incidents.append({
+                'start': start.isoformat(),
+                'end': end.isoformat(),
+                'duration_seconds': (end - start).total_seconds(),
+                'event_count': len(group),
+                'sources': dict(zip(sources, per_source[label].tolist())),
+                'device_ids': sorted(group['device_id'].dropna().unique().tolist()),
+                'areas': sorted(group['area'].dropna().unique().tolist()),
+                'alarm_types': by_source.get(SOURCE_ALARM, np.array([])).tolist(),
+                'device_events': by_source.get(SOURCE_DEVICE, np.array([])).tolist(),
+                'vision_behaviors': by_source.get(SOURCE_VISION, np.array([])).tolist(),
+                'max_severity': (next(k for k, v in SEVERITY_RANK.items() if v == severity_rank)
+                                 if pd.notna(severity_rank) else None),
+                'events': [
+                    {
+                        'timestamp': row.timestamp.isoformat(),
+                        'source': row.source,
+                        'event_type': row.event_type,
+                        'device_id': None if pd.isna(row.device_id) else row.device_id,
+                        'area': None if pd.isna(row.area) else row.area,
+                    }
+                    for row in group.head(max_events_per_incident).itertuples(index=False)
+                ]
+            })
+
+        incidents.sort(key=lambda incident: incident['start'])
+        for i, incident in enumerate(incidents, 1):
+            incident['incident_id'] = f"INC-{incident['start'][:10].replace('-', '')}-{i:04d}"
+
+        return incidents
+
+    def correlate_alarms(self, alarms: pd.DataFrame, start: datetime, end: datetime,
+                         **kwargs) -> List[Dict]:
+        """
+        关联一段时间内的报警与同期设备日志、视觉检测
+
+        设备日志和视觉检测的加载范围在两端各扩展一个窗口，保证边界附近的事件也能关联
+        """
+        margin = timedelta(seconds=self.window_seconds)
+        return self.correlate(
+            self.alarm_events(alarms),
+            self.load_device_events(start - margin, end + margin),
+            self.load_vision_events(start - margin, end + margin),
+            **kwargs
+        )
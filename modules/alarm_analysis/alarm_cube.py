@@ -0,0 +1,281 @@
+"""
+报警多维数据立方体模块
+按 日期 × 小时 × 区域 × 报警类型 × 严重程度 × 设备 预先汇总报警数，
+以稀疏坐标（每维整数编码数组 + 计数数组）存储为.npz，按天增量更新，
+任意两个维度的透视（含派生维度day_of_week）只需一次bincount
+"""
+
+import json
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+# 立方体维度（codes矩阵的行顺序）
+CUBE_DIMENSIONS = ['day', 'hour', 'area', 'alarm_type', 'severity', 'device_id']
+
+# 由day派生的维度：0=周一 ... 6=周日
+DERIVED_DIMENSIONS = ['day_of_week']
+
+# 取值范围固定的维度，透视结果中保留全部取值（热力图需要完整网格）
+FIXED_DIMENSIONS = {'hour': 24, 'day_of_week': 7}
+
+# 缺失值的占位标签
+UNKNOWN_LABEL = '未知'
+
+
+class AlarmCube:
+    """稀疏存储的报警计数立方体"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: 立方体存储文件（.npz）
+        """
+        self.path = Path(path)
+
+        # 字符串维度的标签表（hour直接以0-23为编码，不需要标签表）
+        self.labels: Dict[str, List[str]] = {dim: [] for dim in CUBE_DIMENSIONS if dim != 'hour'}
+        self._lookup: Dict[str, Dict[str, int]] = {dim: {} for dim in self.labels}
+
+        # 按维度存储（每行一个维度），切片和bincount访问的都是连续内存
+        self.codes = np.zeros((len(CUBE_DIMENSIONS), 0), dtype=np.int32)
+        self.counts = np.zeros(0, dtype=np.int64)
+        # 每个格子来自哪一天的源文件（day标签表中的编码），重建某天时按此删除
+        self.source_days = np.zeros(0, dtype=np.int32)
+
+        # 各日期写入时的源数据版本，用于判断是否需要重建该日
+        self.sources: Dict[str, Dict] = {}
+
+        self.load()
+
+    # ---------- 持久化 ----------
+
+    def load(self):
+        if not self.path.exists():
+            return
+
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                self.codes = data['codes']
+                self.counts = data['counts']
+                self.source_days = data['source_days']
+                self.sources = json.loads(str(data['sources']))
+                for dim in self.labels:
+                    self.labels[dim] = data[f'labels_{dim}'].tolist()
+        except Exception as e:
+            print(f"读取报警立方体失败，将重新建立 {self.path}: {e}")
+            self.codes = np.zeros((len(CUBE_DIMENSIONS), 0), dtype=np.int32)
+            self.counts = np.zeros(0, dtype=np.int64)
+            self.source_days = np.zeros(0, dtype=np.int32)
+            self.sources = {}
+            self.labels = {dim: [] for dim in self.labels}
+
+        self._lookup = {dim: {label: i for i, label in enumerate(labels)}
+                        for dim, labels in self.labels.items()}
+
+    def save(self):
+        """原子写入（先写同目录下唯一命名的临时文件再替换，并发保存互不覆盖）"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        arrays = {f'labels_{dim}': np.array(labels, dtype=str) for dim, labels in self.labels.items()}
+        with tempfile.NamedTemporaryFile(dir=self.path.parent, prefix=f'{self.path.stem}.',
+                                         suffix='.tmp', delete=False) as f:
+            np.savez(f, codes=self.codes, counts=self.counts, source_days=self.source_days,
+                     sources=np.array(json.dumps(self.sources)), **arrays)
+        os.replace(f.name, self.path)
+
+    # ---------- 写入 ----------
+
+    def _encode(self, dim: str, values: pd.Series) -> np.ndarray:
+        """字符串列编码为该维度的全局编码，新标签追加到标签表"""
+        local_codes, uniques = pd.factorize(values.astype('string').fillna(UNKNOWN_LABEL))
+        lookup = self._lookup[dim]
+        mapping = np.empty(len(uniques), dtype=np.int32)
+
+        for i, label in enumerate(uniques):
+            label = str(label)
+            if label not in lookup:
+                lookup[label] = len(self.labels[dim])
+                self.labels[dim].append(label)
+            mapping[i] = lookup[label]
+
+        return mapping[local_codes]
+
+    def is_current(self, date: str, version: Dict) -> bool:
+        return self.sources.get(date) == version
+
+    def update_day(self, date: str, df: pd.DataFrame, version: Optional[Dict] = None):
+        """
+        替换某天源文件的数据（先删除该文件已有的格子，再写入新汇总）
+
+        Args:
+            date: 源文件日期 (YYYY-MM-DD)
+            df: 该文件的报警记录，需包含timestamp，区域取area列（没有时取location）
+            version: 源数据版本标识
+        """
+        source_code = self._encode('day', pd.Series([date]))[0]
+        keep = self.source_days != source_code
+        codes, counts, source_days = self.codes[:, keep], self.counts[keep], self.source_days[keep]
+
+        df = df[df['timestamp'].notna()] if 'timestamp' in df.columns else df.iloc[0:0]
+        if not df.empty:
+            missing = pd.Series(pd.NA, index=df.index)
+            area = df['area'] if 'area' in df.columns else df.get('location', missing)
+
+            # day维度取报警时间所在日期（与聚合统计的星期×小时分布一致）
+            columns = [
+                self._encode('day', df['timestamp'].dt.strftime('%Y-%m-%d')),
+                df['timestamp'].dt.hour.to_numpy(dtype=np.int32),
+                self._encode('area', area),
+                self._encode('alarm_type', df.get('alarm_type', missing)),
+                self._encode('severity', df.get('severity', missing)),
+                self._encode('device_id', df.get('device_id', missing)),
+            ]
+
+            # 多维编码压成一个整数键后计数
+            shape = (len(self.labels['day']), 24) + tuple(len(self.labels[dim]) for dim in CUBE_DIMENSIONS[2:])
+            keys, day_counts = np.unique(np.ravel_multi_index(columns, shape), return_counts=True)
+            day_codes = np.vstack(np.unravel_index(keys, shape)).astype(np.int32)
+
+            codes = np.hstack([codes, day_codes])
+            counts = np.concatenate([counts, day_counts.astype(np.int64)])
+            source_days = np.concatenate([source_days, np.full(len(day_counts), source_code, dtype=np.int32)])
+
+        self.codes, self.counts, self.source_days = codes, counts, source_days
+        self.sources[date] = version
+
+    # ---------- 查询 ----------
+
+    def _dimension_codes(self, dim: str, codes: np.ndarray) -> np.ndarray:
+        if dim == 'day_of_week':
+            weekdays = np.array([datetime.strptime(day, '%Y-%m-%d').weekday() for day in self.labels['day']],
+                                dtype=np.int32)
+            return weekdays[codes[0]]
+        return codes[CUBE_DIMENSIONS.index(dim)]
+
+    def _dimension_size(self, dim: str) -> int:
+        return FIXED_DIMENSIONS.get(dim) or len(self.labels[dim])
+
+    def _dimension_labels(self, dim: str) -> List:
+        if dim in FIXED_DIMENSIONS:
+            return list(range(FIXED_DIMENSIONS[dim]))
+        return self.labels[dim]
+
+    @staticmethod
+    def _fixed_indices(dim: str, values: List) -> List[int]:
+        """
+        固定维度（hour/day_of_week）的过滤取值 -> 下标
+
+        Raises:
+            ValueError: 取值不是整数或超出范围
+        """
+        size = FIXED_DIMENSIONS[dim]
+        try:
+            indices = [int(v) for v in values]
+        except (TypeError, ValueError):
+            indices = None
+        if indices is None or any(not 0 <= i < size for i in indices):
+            raise ValueError(f"{dim}的取值需为0-{size - 1}的整数: {values}")
+        return indices
+
+    def _filter_mask(self, filters: Dict[str, Union[str, int, List]], start: Optional[str],
+                     end: Optional[str]) -> Optional[np.ndarray]:
+        """过滤条件对应的格子掩码，没有任何过滤条件时返回None"""
+        mask = np.ones(len(self.counts), dtype=bool)
+        filtered = False
+
+        if start is not None or end is not None:
+            days = np.array(self.labels['day'], dtype=str)
+            in_range = np.ones(len(days), dtype=bool)
+            if start is not None:
+                in_range &= days >= start
+            if end is not None:
+                in_range &= days <= end
+            mask &= in_range[self.codes[0]]
+            filtered = True
+
+        for dim, values in filters.items():
+            if values is None:
+                continue
+            if not isinstance(values, (list, tuple, set)):
+                values = [values]
+
+            allowed = np.zeros(self._dimension_size(dim), dtype=bool)
+            if dim in FIXED_DIMENSIONS:
+                allowed[self._fixed_indices(dim, values)] = True
+            else:
+                allowed[[self._lookup[dim][str(v)] for v in values if str(v) in self._lookup[dim]]] = True
+            mask &= allowed[self._dimension_codes(dim, self.codes)]
+            filtered = True
+
+        return mask if filtered else None
+
+    def pivot(self, rows: str, columns: Optional[str] = None,
+              filters: Optional[Dict[str, Union[str, int, List]]] = None,
+              start: Optional[str] = None, end: Optional[str] = None) -> Dict:
+        """
+        按一个或两个维度汇总报警数
+
+        Args:
+            rows: 行维度（CUBE_DIMENSIONS或day_of_week）
+            columns: 列维度，None时只按行维度汇总
+            filters: 过滤条件 {维度: 取值或取值列表}
+            start/end: 日期范围 (YYYY-MM-DD，含两端)
+
+        Returns:
+            {'rows', 'columns', 'row_labels', 'column_labels', 'values', 'total'}
+
+        Raises:
+            ValueError: 维度不支持、固定维度取值超出范围或日期格式错误
+        """
+        valid_dimensions = CUBE_DIMENSIONS + DERIVED_DIMENSIONS
+        for dim in [rows, columns] + list(filters or {}):
+            if dim is not None and dim not in valid_dimensions:
+                raise ValueError(f"不支持的维度: {dim}，可选: {', '.join(valid_dimensions)}")
+        for name, day in (('start', start), ('end', end)):
+            if day is not None:
+                try:
+                    datetime.strptime(day, '%Y-%m-%d')
+                except ValueError:
+                    raise ValueError(f"{name}日期格式需为YYYY-MM-DD: {day}")
+
+        n_rows = self._dimension_size(rows)
+        n_cols = self._dimension_size(columns) if columns else 1
+        cells = self._dimension_codes(rows, self.codes).astype(np.int64) * n_cols
+        if columns:
+            cells += self._dimension_codes(columns, self.codes)
+
+        counts = self.counts
+        mask = self._filter_mask(filters or {}, start, end)
+        if mask is not None:
+            cells, counts = cells[mask], counts[mask]
+
+        matrix = np.bincount(cells, weights=counts, minlength=n_rows * n_cols).astype(np.int64)
+        matrix = matrix.reshape(n_rows, n_cols)
+
+        # 去掉全零的行列（固定维度保留完整取值），标签排序输出
+        row_labels = self._dimension_labels(rows)
+        row_index = [i for i in np.argsort(row_labels, kind='stable')
+                     if rows in FIXED_DIMENSIONS or matrix[i].any()]
+
+        if columns:
+            column_labels = self._dimension_labels(columns)
+            column_index = [j for j in np.argsort(column_labels, kind='stable')
+                            if columns in FIXED_DIMENSIONS or matrix[:, j].any()]
+            values = matrix[np.ix_(row_index, column_index)]
+            column_labels = [column_labels[j] for j in column_index]
+        else:
+            values = matrix[row_index, 0]
+            column_labels = None
+
+        return {
+            'rows': rows,
+            'columns': columns,
+            'row_labels': [row_labels[i] for i in row_index],
+            'column_labels': column_labels,
+            'values': values.tolist(),
+            'total': int(counts.sum())
+        }
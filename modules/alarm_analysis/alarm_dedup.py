@@ -0,0 +1,64 @@
+"""
+报警去重与风暴抑制模块
+将同一设备、同一报警类型在短间隔内连续触发的报警合并为一个事件段（episode），
+全部使用pandas/NumPy向量化运算，不逐行循环
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Optional
+
+
+def collapse_alarm_bursts(df: pd.DataFrame, gap_seconds: Optional[float] = 60) -> pd.DataFrame:
+    """
+    合并报警风暴
+
+    按(device_id, alarm_type, timestamp)排序后，相邻两条报警设备和类型相同、
+    且时间间隔不超过gap_seconds时归入同一事件段。每个事件段保留首条报警，
+    并附加episode_size（合并的原始报警数）和episode_end（最后一条报警时间）。
+
+    Args:
+        df: 报警记录，需包含timestamp、device_id、alarm_type列
+        gap_seconds: 合并间隔（秒），None或缺少必要列时不合并
+
+    Returns:
+        合并后的报警记录，按时间排序
+    """
+    required = {'timestamp', 'device_id', 'alarm_type'}
+    if df.empty or gap_seconds is None or not required.issubset(df.columns):
+        collapsed = df.copy()
+        collapsed['episode_size'] = 1
+        if 'timestamp' in df.columns:
+            collapsed['episode_end'] = df['timestamp']
+        return collapsed
+
+    device_codes = pd.factorize(df['device_id'])[0]
+    type_codes = pd.factorize(df['alarm_type'])[0]
+    timestamps = pd.to_datetime(df['timestamp'])
+    missing = timestamps.isna().to_numpy()
+    ts = timestamps.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+
+    order = np.lexsort((ts, type_codes, device_codes))
+    device_sorted = device_codes[order]
+    type_sorted = type_codes[order]
+    ts_sorted = ts[order]
+    missing_sorted = missing[order]
+
+    # 事件段起点：第一行、设备或类型变化、与上一条间隔超过gap、时间缺失
+    new_episode = np.ones(len(order), dtype=bool)
+    new_episode[1:] = (
+        (device_sorted[1:] != device_sorted[:-1])
+        | (type_sorted[1:] != type_sorted[:-1])
+        | (np.diff(ts_sorted) > int(gap_seconds * 1e9))
+        | missing_sorted[1:]
+        | missing_sorted[:-1]
+    )
+
+    starts = np.flatnonzero(new_episode)
+    ends = np.append(starts[1:], len(order)) - 1
+
+    collapsed = df.iloc[order[starts]].copy()
+    collapsed['episode_size'] = ends - starts + 1
+    collapsed['episode_end'] = timestamps.iloc[order[ends]].to_numpy()
+
+    return collapsed.sort_values('timestamp', kind='stable').reset_index(drop=True)
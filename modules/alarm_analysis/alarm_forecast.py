@@ -0,0 +1,197 @@
+"""
+报警量预测模块
+对每个区域/设备的日报警数拟合带周季节性的Holt-Winters模型（加法季节、阻尼趋势），
+所有序列在同一组矩阵运算中批量更新；拟合状态缓存为.npz，
+每晚只需用新增的天数继续更新，不必从头重新拟合
+"""
+
+import os
+import numpy as np
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# 季节周期（天）：季节分量按星期几索引，0=周一
+SEASON_LENGTH = 7
+
+# 95%预测区间
+DEFAULT_Z = 1.96
+
+
+class HoltWintersForecaster:
+    """批量Holt-Winters日报警数预测"""
+
+    def __init__(self, path: str, alpha: float = 0.3, beta: float = 0.05, gamma: float = 0.2,
+                 phi: float = 0.9):
+        """
+        Args:
+            path: 拟合状态存储文件（.npz）
+            alpha: 水平平滑系数
+            beta: 趋势平滑系数
+            gamma: 季节平滑系数
+            phi: 趋势阻尼系数（<1时远期预测趋于平稳，避免趋势外推失控）
+        """
+        self.path = Path(path)
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.phi = phi
+        self.reset()
+        self.load()
+
+    def reset(self):
+        """清空拟合状态"""
+        self.keys: List[str] = []
+        self._index: Dict[str, int] = {}
+        self.level = np.zeros(0)
+        self.trend = np.zeros(0)
+        self.season = np.zeros((0, SEASON_LENGTH))
+        self.sigma2 = np.zeros(0)  # 一步预测误差方差（EWMA）
+        self.n_obs = np.zeros(0, dtype=np.int32)
+        self.last_date: Optional[str] = None
+
+    # ---------- 持久化 ----------
+
+    def load(self):
+        if not self.path.exists():
+            return
+
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                self.keys = data['keys'].tolist()
+                self.level = data['level']
+                self.trend = data['trend']
+                self.season = data['season']
+                self.sigma2 = data['sigma2']
+                self.n_obs = data['n_obs']
+                self.last_date = str(data['last_date']) or None
+        except Exception as e:
+            print(f"读取预测模型状态失败，将重新拟合 {self.path}: {e}")
+            self.reset()
+            return
+
+        self._index = {key: i for i, key in enumerate(self.keys)}
+
+    def save(self):
+        """原子写入（先写临时文件再替换）"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, keys=np.array(self.keys, dtype=str), level=self.level, trend=self.trend,
+                     season=self.season, sigma2=self.sigma2, n_obs=self.n_obs,
+                     last_date=np.array(self.last_date or ''))
+        os.replace(tmp_path, self.path)
+
+    # ---------- 拟合 ----------
+
+    def _add_series(self, keys: List[str], history: np.ndarray, weekdays: np.ndarray):
+        """
+        新增序列并初始化状态
+
+        历史不少于两周时按经典方法初始化（首周均值为水平、两周均值差为趋势、首周偏差为季节），
+        否则以首日观测为水平，趋势和季节为0
+        """
+        n = len(keys)
+        level = history[:, 0].astype(float)
+        trend = np.zeros(n)
+        season = np.zeros((n, SEASON_LENGTH))
+
+        if history.shape[1] >= 2 * SEASON_LENGTH:
+            first_week = history[:, :SEASON_LENGTH]
+            second_week = history[:, SEASON_LENGTH:2 * SEASON_LENGTH]
+            level = first_week.mean(axis=1)
+            trend = (second_week.mean(axis=1) - level) / SEASON_LENGTH
+            season[:, weekdays[:SEASON_LENGTH]] = first_week - level[:, None]
+
+        for key in keys:
+            self._index[key] = len(self.keys)
+            self.keys.append(key)
+
+        self.level = np.concatenate([self.level, level])
+        self.trend = np.concatenate([self.trend, trend])
+        self.season = np.vstack([self.season, season])
+        self.sigma2 = np.concatenate([self.sigma2, np.zeros(n)])
+        self.n_obs = np.concatenate([self.n_obs, np.zeros(n, dtype=np.int32)])
+
+    def update(self, dates: List[str], keys: List[str], counts: np.ndarray):
+        """
+        用连续若干天的观测更新所有序列（按天循环，每天对全部序列做一次向量运算）
+
+        Args:
+            dates: 连续日期 (YYYY-MM-DD)，须晚于last_date
+            keys: 序列名称（区域/设备）
+            counts: (序列数, 天数) 日报警数；已有序列在counts中缺失时按0报警处理
+        """
+        if not dates:
+            return
+
+        weekdays = np.array([datetime.strptime(d, '%Y-%m-%d').weekday() for d in dates])
+        counts = np.asarray(counts, dtype=float)
+
+        new_rows = [i for i, key in enumerate(keys) if key not in self._index]
+        if new_rows:
+            self._add_series([keys[i] for i in new_rows], counts[new_rows], weekdays)
+
+        # 对齐到全部已知序列
+        y = np.zeros((len(self.keys), len(dates)))
+        y[[self._index[key] for key in keys]] = counts
+
+        rows = np.arange(len(self.keys))
+        for t, weekday in enumerate(weekdays):
+            season = self.season[:, weekday]
+            error = y[:, t] - (self.level + self.phi * self.trend + season)
+
+            weight = np.maximum(0.05, 1.0 / (self.n_obs + 1))
+            self.sigma2 = np.where(self.n_obs > 0, (1 - weight) * self.sigma2 + weight * error ** 2, self.sigma2)
+
+            level = self.alpha * (y[:, t] - season) + (1 - self.alpha) * (self.level + self.phi * self.trend)
+            self.trend = self.beta * (level - self.level) + (1 - self.beta) * self.phi * self.trend
+            self.season[rows, weekday] = self.gamma * (y[:, t] - level) + (1 - self.gamma) * season
+            self.level = level
+            self.n_obs += 1
+
+        self.last_date = dates[-1]
+
+    # ---------- 预测 ----------
+
+    def forecast(self, horizon: int = 7, z: float = DEFAULT_Z) -> Dict[str, List[Dict]]:
+        """
+        预测last_date之后horizon天的报警数
+
+        区间按加法Holt-Winters的h步误差方差近似：σ²·(1 + Σ(α + γ·[j为整周])²)
+
+        Returns:
+            {序列名称: [{'date', 'expected', 'lower', 'upper'}]}
+        """
+        if self.last_date is None or not self.keys:
+            return {}
+
+        last = datetime.strptime(self.last_date, '%Y-%m-%d')
+        steps = np.arange(1, horizon + 1)
+        dates = [(last + timedelta(days=int(h))).strftime('%Y-%m-%d') for h in steps]
+        weekdays = np.array([(last + timedelta(days=int(h))).weekday() for h in steps])
+
+        # 阻尼趋势累计：phi + phi^2 + ... + phi^h
+        damped = np.cumsum(self.phi ** steps)
+        expected = self.level[:, None] + self.trend[:, None] * damped + self.season[:, weekdays]
+
+        psi = self.alpha + self.gamma * (np.arange(1, horizon) % SEASON_LENGTH == 0)
+        variance_factor = 1 + np.concatenate([[0.0], np.cumsum(psi ** 2)])
+        spread = z * np.sqrt(self.sigma2[:, None] * variance_factor)
+
+        expected = np.maximum(expected, 0)
+        lower = np.maximum(expected - spread, 0)
+        upper = expected + spread
+
+        return {
+            key: [
+                {
+                    'date': dates[h],
+                    'expected': round(float(expected[i, h]), 2),
+                    'lower': round(float(lower[i, h]), 2),
+                    'upper': round(float(upper[i, h]), 2)
+                }
+                for h in range(horizon)
+            ]
+            for i, key in enumerate(self.keys)
+        }
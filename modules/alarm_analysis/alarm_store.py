@@ -0,0 +1,185 @@
+"""
+报警数据列式存储模块
+将每日报警CSV按表结构校验转换后存为按日期分区的Parquet，加载时只读取所需的分区和列
+"""
+
+import pandas as pd
+from pathlib import Path
+from typing import Dict, List, Optional
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from modules.data_schema import ALARM_SCHEMA, SCHEMA_VERSION, apply_schema, write_quarantine
+
+# Parquet读写依赖pyarrow（可选依赖，未安装时回退到CSV读取）
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_SUPPORT = True
+except ImportError:
+    PARQUET_SUPPORT = False
+
+# 分区文件元数据中记录的表结构版本
+SCHEMA_VERSION_KEY = b'alarm_schema_version'
+
+
+# 低基数字符串列，存储为categorical以压缩体积并加速groupby
+CATEGORICAL_COLUMNS = ['location', 'area', 'alarm_type', 'severity', 'status', 'device_id']
+
+
+class AlarmStore:
+    """按日期分区的报警Parquet存储"""
+
+    def __init__(self, data_dir: str = './data/alarms', store_dir: str = None):
+        self.data_dir = Path(data_dir)
+        # 分区目录结构: <store_dir>/date=YYYY-MM-DD/alarms.parquet
+        self.store_dir = Path(store_dir) if store_dir else self.data_dir / 'parquet'
+
+    def csv_path(self, date: str) -> Path:
+        """某日原始CSV文件路径"""
+        return self.data_dir / f'alarms_{date}.csv'
+
+    def partition_path(self, date: str) -> Path:
+        """某日Parquet分区文件路径"""
+        return self.store_dir / f'date={date}' / 'alarms.parquet'
+
+    def quarantine_path(self, date: str) -> Path:
+        """某日不合规行的隔离文件路径"""
+        return self.data_dir / 'quarantine' / f'alarms_{date}.csv'
+
+    def is_stale(self, date: str) -> bool:
+        """CSV存在且分区缺失、早于CSV或表结构版本不同时，需要重新转换"""
+        csv_path = self.csv_path(date)
+        if not csv_path.exists():
+            return False
+
+        partition = self.partition_path(date)
+        if not partition.exists():
+            return True
+
+        if partition.stat().st_mtime < csv_path.stat().st_mtime:
+            return True
+
+        metadata = pq.read_schema(partition).metadata or {}
+        return metadata.get(SCHEMA_VERSION_KEY) != str(SCHEMA_VERSION).encode()
+
+    def ingest_date(self, date: str) -> Optional[Path]:
+        """将某日CSV按表结构转换为Parquet分区，不合规的行写入隔离文件"""
+        csv_path = self.csv_path(date)
+        if not csv_path.exists():
+            return None
+
+        df, quarantined = apply_schema(pd.read_csv(csv_path), ALARM_SCHEMA)
+        write_quarantine(quarantined, self.quarantine_path(date))
+
+        partition = self.partition_path(date)
+        partition.parent.mkdir(parents=True, exist_ok=True)
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                               SCHEMA_VERSION_KEY: str(SCHEMA_VERSION).encode()})
+
+        # 先写临时文件再替换，避免读到写了一半的分区
+        tmp_path = partition.with_suffix('.parquet.tmp')
+        pq.write_table(table, tmp_path)
+        tmp_path.replace(partition)
+
+        return partition
+
+    def ingest(self, dates: List[str] = None, force: bool = False) -> Dict:
+        """
+        转换CSV为Parquet分区（仅处理新增或已变更的文件）
+
+        Args:
+            dates: 需要转换的日期列表，默认为数据目录下所有CSV
+            force: 是否强制重新转换
+
+        Returns:
+            转换统计
+        """
+        if not PARQUET_SUPPORT:
+            return {'ingested': [], 'skipped': 0, 'error': '未安装pyarrow，无法写入Parquet'}
+
+        if dates is None:
+            dates = sorted(p.stem[len('alarms_'):] for p in self.data_dir.glob('alarms_*.csv'))
+
+        ingested = []
+        skipped = 0
+
+        for date in dates:
+            if not (force or self.is_stale(date)):
+                skipped += 1
+                continue
+
+            try:
+                if self.ingest_date(date) is not None:
+                    ingested.append(date)
+            except Exception as e:
+                print(f"转换报警文件失败 {self.csv_path(date)}: {e}")
+
+        return {'ingested': ingested, 'skipped': skipped}
+
+    def available_dates(self) -> List[str]:
+        """已转换的分区日期"""
+        return sorted(p.parent.name[len('date='):] for p in self.store_dir.glob('date=*/alarms.parquet'))
+
+    def load(self, dates: List[str], columns: List[str] = None) -> pd.DataFrame:
+        """
+        读取指定日期分区，只加载需要的列
+
+        Args:
+            dates: 日期列表 (YYYY-MM-DD)，不存在的分区自动跳过
+            columns: 需要的列，None表示全部列
+
+        Returns:
+            合并后的DataFrame
+        """
+        frames = []
+
+        for date in dates:
+            partition = self.partition_path(date)
+            if not partition.exists():
+                continue
+
+            try:
+                read_columns = None
+                if columns is not None:
+                    # 只投影分区中实际存在的列
+                    available = pq.ParquetFile(partition).schema_arrow.names
+                    read_columns = [c for c in columns if c in available]
+
+                frames.append(pd.read_parquet(partition, columns=read_columns))
+            except Exception as e:
+                print(f"读取分区失败 {partition}: {e}")
+
+        if not frames:
+            return pd.DataFrame()
+
+        df = pd.concat(frames, ignore_index=True)
+
+        # 各分区类别集合不同时concat会退化为object，这里重新转换
+        for col in CATEGORICAL_COLUMNS:
+            if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype('category')
+
+        return df
+
+
+# 命令行工具接口
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='报警CSV转换为Parquet分区存储')
+    parser.add_argument('--data-dir', type=str, help='CSV数据目录', default='./data/alarms')
+    parser.add_argument('--store-dir', type=str, help='Parquet存储目录', default=None)
+    parser.add_argument('--force', action='store_true', help='强制重新转换所有文件')
+
+    args = parser.parse_args()
+
+    store = AlarmStore(data_dir=args.data_dir, store_dir=args.store_dir)
+    result = store.ingest(force=args.force)
+
+    if 'error' in result:
+        print(result['error'])
+    else:
+        print(f"转换完成: {len(result['ingested'])}个分区，跳过{result['skipped']}个未变更文件")
@@ -0,0 +1,279 @@
+"""
+实时报警流处理模块
+报警事件写入追加式事件日志并进入asyncio队列，消费者维护设备/区域/全局的滑动窗口计数，
+越过阈值时在秒级内产生与批处理check_thresholds相同格式的警报
+"""
+
+import asyncio
+import json
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional
+
+
+# 滑动窗口长度（秒）
+WINDOWS = {'5m': 300, '1h': 3600, '24h': 86400}
+
+# 每个窗口划分的桶数，桶越多边界越精确、内存越大（24h窗口的桶宽为288秒）
+BUCKETS_PER_WINDOW = 300
+
+# 允许的事件时间超前量（秒），容忍设备与服务器间的时钟偏差；更晚的时间视为无效
+MAX_CLOCK_SKEW_SECONDS = 300
+
+# 区域的默认阈值（批处理没有区域阈值）：单区域1小时/24小时报警数
+DEFAULT_AREA_THRESHOLDS = {'1h': 20, '24h': 50}
+
+
+class SlidingWindowCounter:
+    """分桶滑动窗口计数器，每个事件摊还O(1)"""
+
+    __slots__ = ('window', 'bucket_seconds', 'buckets', 'count')
+
+    def __init__(self, window_seconds: int, buckets: int = BUCKETS_PER_WINDOW):
+        self.window = window_seconds
+        self.bucket_seconds = max(window_seconds / buckets, 1)
+        self.buckets: Deque[List] = deque()  # [桶编号, 计数]
+        self.count = 0
+
+    def expire(self, now: float):
+        """移除已滑出窗口的桶"""
+        oldest = int((now - self.window) // self.bucket_seconds)
+        while self.buckets and self.buckets[0][0] <= oldest:
+            self.count -= self.buckets.popleft()[1]
+
+    def add(self, ts: float, n: int = 1, now: Optional[float] = None) -> int:
+        """记录事件并返回窗口内计数（按now滑动窗口，默认为事件时间）"""
+        self.expire(ts if now is None else now)
+        key = int(ts // self.bucket_seconds)
+
+        # 乱序到达的事件计入最新的桶
+        if self.buckets and self.buckets[-1][0] >= key:
+            self.buckets[-1][1] += n
+        else:
+            self.buckets.append([key, n])
+
+        self.count += n
+        return self.count
+
+
+class AlarmStreamProcessor:
+    """实时报警流处理器"""
+
+    def __init__(self, thresholds: Dict, log_dir: str = './data/alarms/stream',
+                 window_thresholds: Optional[Dict] = None):
+        """
+        Args:
+            thresholds: AlarmAnalyzer.thresholds，24小时窗口沿用批处理阈值
+            log_dir: 追加式事件日志目录
+            window_thresholds: 覆盖默认阈值，格式 {范围: {窗口: 阈值}}，范围为global/device/area
+        """
+        self.log_dir = Path(log_dir)
+
+        self.window_thresholds = {
+            'global': {'24h': thresholds['daily_alarm_count']},
+            'device': {'24h': thresholds['device_alarm_frequency']},
+            'area': dict(DEFAULT_AREA_THRESHOLDS),
+        }
+        for scope, limits in (window_thresholds or {}).items():
+            self.window_thresholds.setdefault(scope, {}).update(limits)
+
+        # {范围: {键: {窗口: 计数器}}}
+        self.counters: Dict[str, Dict[str, Dict[str, SlidingWindowCounter]]] = {
+            'global': {}, 'device': {}, 'area': {}
+        }
+        # 当前处于超阈值状态的(范围, 键, 窗口)，回落到阈值以下前不重复报警
+        self._active = set()
+
+        self.recent_alerts: Deque[Dict] = deque(maxlen=1000)
+        self.alert_handlers: List[Callable[[Dict], None]] = []
+        self.events_processed = 0
+
+        self.queue: Optional[asyncio.Queue] = None
+        self._consumer: Optional[asyncio.Task] = None
+
+    # ---------- 事件处理 ----------
+
+    @staticmethod
+    def normalize_event(event: Dict, now: Optional[float] = None) -> Dict:
+        """
+        校验并统一事件时间：缺省为当前时间，ISO字符串或时间戳统一为本地时间的ISO字符串
+
+        Args:
+            event: 报警事件
+            now: 当前时间戳，默认为系统时间
+
+        Raises:
+            ValueError: 时间无法解析，或晚于当前时间超过允许的时钟偏差
+        """
+        now = datetime.now().timestamp() if now is None else now
+        ts = event.get('timestamp')
+        try:
+            if ts is None:
+                dt = datetime.fromtimestamp(now)
+            elif isinstance(ts, (int, float)):
+                dt = datetime.fromtimestamp(float(ts))
+            else:
+                dt = datetime.fromisoformat(str(ts))
+                if dt.tzinfo is not None:
+                    dt = dt.astimezone().replace(tzinfo=None)
+        except (TypeError, ValueError, OverflowError, OSError):
+            raise ValueError(f"无法解析的报警时间: {ts}")
+
+        # 未来时间的事件会成为最新的桶，之后的事件都计入该桶且永远不会过期
+        if dt.timestamp() > now + MAX_CLOCK_SKEW_SECONDS:
+            raise ValueError(f"报警时间晚于当前时间: {ts}")
+
+        return {**event, 'timestamp': dt.isoformat()}
+
+    @staticmethod
+    def _event_time(event: Dict) -> float:
+        return datetime.fromisoformat(event['timestamp']).timestamp()
+
+    def _make_alert(self, scope: str, key: str, window: str, count: int, threshold: int, ts: float) -> Dict:
+        """生成与check_thresholds一致的警报字典（附加窗口和触发时间）"""
+        if scope == 'global':
+            alert = {
+                'level': 'high',
+                'type': 'alarm_count_exceeded',
+                'message': f"报警数量({count})超过阈值({threshold})",
+                'value': count,
+                'threshold': threshold
+            }
+        elif scope == 'device':
+            alert = {
+                'level': 'medium',
+                'type': 'high_frequency_devices',
+                'message': "发现1个高频报警设备",
+                'devices': [key]
+            }
+        else:
+            alert = {
+                'level': 'medium',
+                'type': 'high_frequency_areas',
+                'message': f"区域{key}报警数量({count})超过阈值({threshold})",
+                'areas': [key]
+            }
+
+        alert['window'] = window
+        alert['triggered_at'] = datetime.fromtimestamp(ts).isoformat()
+        return alert
+
+    def process_event(self, event: Dict, now: Optional[float] = None) -> List[Dict]:
+        """
+        处理单个报警事件，更新滑动窗口计数并检查阈值
+
+        事件时间早于某个窗口起点（如补传的历史报警）时不计入该窗口，
+        晚于当前时间超过允许的时钟偏差时不计入任何窗口；窗口按当前时间滑动
+
+        Args:
+            event: normalize_event()处理后的报警事件
+            now: 当前时间戳，默认为系统时间（回放历史事件时传入回放时刻）
+
+        Returns:
+            本事件触发的警报列表
+        """
+        ts = self._event_time(event)
+        now = datetime.now().timestamp() if now is None else now
+        alerts = []
+
+        scope_keys = [('global', 'all'), ('device', event.get('device_id'))]
+        area = event.get('area') or event.get('location')
+        if area:
+            scope_keys.append(('area', area))
+
+        for scope, key in scope_keys:
+            if key is None:
+                continue
+
+            counters = self.counters[scope].setdefault(key, {})
+            for window, seconds in WINDOWS.items():
+                if ts <= now - seconds or ts > now + MAX_CLOCK_SKEW_SECONDS:
+                    continue
+
+                counter = counters.get(window)
+                if counter is None:
+                    counter = counters[window] = SlidingWindowCounter(seconds)
+                count = counter.add(ts, now=now)
+
+                threshold = self.window_thresholds.get(scope, {}).get(window)
+                if threshold is None:
+                    continue
+
+                state = (scope, key, window)
+                if count > threshold:
+                    if state not in self._active:
+                        self._active.add(state)
+                        alerts.append(self._make_alert(scope, key, window, count, threshold, ts))
+                else:
+                    self._active.discard(state)
+
+        self.events_processed += 1
+
+        for alert in alerts:
+            self.recent_alerts.append(alert)
+            for handler in self.alert_handlers:
+                try:
+                    handler(alert)
+                except Exception as e:
+                    print(f"警报回调失败: {e}")
+
+        return alerts
+
+    def snapshot(self, scope: str = 'device', key: Optional[str] = None) -> Dict:
+        """当前各窗口计数"""
+        now = datetime.now().timestamp()
+        result = {}
+        for counter_key, counters in self.counters.get(scope, {}).items():
+            if key is not None and counter_key != key:
+                continue
+            for counter in counters.values():
+                counter.expire(now)
+            result[counter_key] = {window: counter.count for window, counter in counters.items()}
+        return result
+
+    # ---------- 事件日志与队列 ----------
+
+    def _append_log(self, event: Dict):
+        """写入追加式事件日志（按天分文件）"""
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        log_file = self.log_dir / f"events_{datetime.now().strftime('%Y-%m-%d')}.jsonl"
+        with open(log_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+    async def publish(self, event: Dict):
+        """
+        接收报警事件：校验时间后先落日志，再进入处理队列
+
+        Raises:
+            ValueError: 时间无法解析
+        """
+        event = self.normalize_event(event)
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+        self._append_log(event)
+        await self.queue.put(event)
+
+    async def run(self):
+        """队列消费者"""
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+
+        while True:
+            event = await self.queue.get()
+            try:
+                self.process_event(event)
+            except Exception as e:
+                print(f"处理报警事件失败: {e}")
+            finally:
+                self.queue.task_done()
+
+    def start(self):
+        """在当前事件循环中启动消费者"""
+        if self._consumer is None or self._consumer.done():
+            self._consumer = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._consumer is not None:
+            self._consumer.cancel()
+            self._consumer = None
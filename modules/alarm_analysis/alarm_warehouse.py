@@ -0,0 +1,260 @@
+"""
+报警数据仓库模块
+将报警CSV批量导入SQLite alarms表（WAL模式、大事务executemany、按源文件幂等），
+并提供把过滤和分组下推到SQL的查询接口，按设备/时间查询只扫描对应的索引范围
+"""
+
+import sqlite3
+import pandas as pd
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from modules.data_schema import ALARM_SCHEMA, apply_schema
+
+
+# 写入alarms表的列（与scripts/init_database.py中的表结构一致）
+ALARM_TABLE_COLUMNS = ['timestamp', 'device_id', 'alarm_type', 'location', 'area', 'description',
+                       'response_time', 'is_false_alarm', 'risk_level', 'source_file']
+
+# 分组维度 -> SQL表达式
+GROUP_BY_EXPRESSIONS = {
+    'device': 'device_id',
+    'alarm_type': 'alarm_type',
+    'area': 'area',
+    'location': 'location',
+    'day': "substr(timestamp, 1, 10)",
+    'hour': "substr(timestamp, 1, 13) || ':00'",
+    'hour_of_day': "CAST(substr(timestamp, 12, 2) AS INTEGER)",
+}
+
+
+class AlarmWarehouse:
+    """SQLite报警数据仓库"""
+
+    def __init__(self, db_path: str = './security_ops.db'):
+        self.db_path = Path(db_path)
+        self._schema_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        # WAL允许读写并发；NORMAL同步级别在WAL下仍保证一致性，写入吞吐明显高于FULL
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA cache_size=-65536')  # 64MB页缓存
+        conn.execute('PRAGMA mmap_size=268435456')
+
+        if not self._schema_ready:
+            self._ensure_schema(conn)
+            self._schema_ready = True
+
+        return conn
+
+    @staticmethod
+    def _ensure_schema(conn: sqlite3.Connection):
+        """建表/补列/建索引（兼容init_database.py创建的旧表）"""
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS alarms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME NOT NULL,
+            device_id TEXT NOT NULL,
+            alarm_type TEXT NOT NULL,
+            location TEXT,
+            area TEXT,
+            description TEXT,
+            response_time INTEGER,
+            is_false_alarm BOOLEAN,
+            risk_level TEXT,
+            source_file TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(alarms)')}
+        if 'source_file' not in columns:
+            conn.execute('ALTER TABLE alarms ADD COLUMN source_file TEXT')
+
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS alarm_ingest_log (
+            source_file TEXT PRIMARY KEY,
+            mtime_ns INTEGER,
+            size INTEGER,
+            row_count INTEGER,
+            ingested_at DATETIME
+        )
+        ''')
+
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_alarms_timestamp ON alarms(timestamp)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_alarms_device ON alarms(device_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_alarms_device_timestamp ON alarms(device_id, timestamp)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_alarms_source ON alarms(source_file)')
+        conn.commit()
+
+    @staticmethod
+    def _to_rows(chunk: pd.DataFrame, source_file: str) -> List[tuple]:
+        """CSV分块转换为alarms表行（先按表结构转换，不合规的行不入库）"""
+        chunk, _ = apply_schema(chunk, ALARM_SCHEMA)
+        rows = pd.DataFrame(index=chunk.index)
+
+        # 统一为ISO格式文本，保证按字符串比较即按时间比较
+        rows['timestamp'] = pd.to_datetime(chunk['timestamp'], errors='coerce').dt.strftime('%Y-%m-%d %H:%M:%S')
+        for col in ('device_id', 'alarm_type', 'location', 'area', 'description'):
+            rows[col] = chunk[col].astype(object) if col in chunk.columns else None
+
+        if 'response_time' in chunk.columns:
+            rows['response_time'] = pd.to_numeric(chunk['response_time'], errors='coerce')
+        else:
+            rows['response_time'] = None
+
+        rows['is_false_alarm'] = chunk['is_false_alarm'].astype(object) if 'is_false_alarm' in chunk.columns else None
+        rows['risk_level'] = chunk['severity'].astype(object) if 'severity' in chunk.columns else None
+        rows['source_file'] = source_file
+
+        rows = rows.dropna(subset=['timestamp', 'device_id', 'alarm_type'])
+        rows = rows.astype(object).where(rows.notna(), None)
+        return list(rows[ALARM_TABLE_COLUMNS].itertuples(index=False, name=None))
+
+    def ingest_csv(self, csv_path: str, batch_size: int = 50000, force: bool = False) -> int:
+        """
+        导入单个报警CSV（幂等：源文件未变化时跳过，变化时先删除旧记录再导入）
+
+        Returns:
+            导入的行数，跳过时返回0
+        """
+        csv_path = Path(csv_path)
+        source_file = csv_path.name
+        stat = csv_path.stat()
+
+        conn = self._connect()
+        try:
+            logged = conn.execute(
+                'SELECT mtime_ns, size FROM alarm_ingest_log WHERE source_file = ?', (source_file,)
+            ).fetchone()
+            if not force and logged == (stat.st_mtime_ns, stat.st_size):
+                return 0
+
+            placeholders = ', '.join('?' * len(ALARM_TABLE_COLUMNS))
+            insert_sql = f"INSERT INTO alarms ({', '.join(ALARM_TABLE_COLUMNS)}) VALUES ({placeholders})"
+
+            # 整个文件在一个事务内完成，失败时回滚，不会留下半个文件的数据
+            row_count = 0
+            with conn:
+                conn.execute('DELETE FROM alarms WHERE source_file = ?', (source_file,))
+                for chunk in pd.read_csv(csv_path, chunksize=batch_size):
+                    rows = self._to_rows(chunk, source_file)
+                    conn.executemany(insert_sql, rows)
+                    row_count += len(rows)
+
+                conn.execute('''
+                INSERT OR REPLACE INTO alarm_ingest_log (source_file, mtime_ns, size, row_count, ingested_at)
+                VALUES (?, ?, ?, ?, ?)
+                ''', (source_file, stat.st_mtime_ns, stat.st_size, row_count, datetime.now().isoformat()))
+
+            return row_count
+        finally:
+            conn.close()
+
+    def ingest_directory(self, data_dir: str, pattern: str = 'alarms_*.csv', force: bool = False) -> Dict:
+        """导入目录下所有报警CSV"""
+        ingested = {}
+        skipped = 0
+
+        for csv_path in sorted(Path(data_dir).glob(pattern)):
+            try:
+                rows = self.ingest_csv(csv_path, force=force)
+                if rows:
+                    ingested[csv_path.name] = rows
+                else:
+                    skipped += 1
+            except Exception as e:
+                print(f"导入报警文件失败 {csv_path}: {e}")
+
+        return {'ingested': ingested, 'skipped': skipped}
+
+    @staticmethod
+    def _where(start: Optional[str], end: Optional[str], device_id: Optional[str],
+               alarm_type: Optional[str]):
+        conditions = []
+        params = []
+
+        if device_id is not None:
+            conditions.append('device_id = ?')
+            params.append(device_id)
+        if alarm_type is not None:
+            conditions.append('alarm_type = ?')
+            params.append(alarm_type)
+        if start is not None:
+            conditions.append('timestamp >= ?')
+            params.append(start)
+        if end is not None:
+            # 只给日期时包含当天全部记录
+            conditions.append('timestamp <= ?')
+            params.append(end if len(end) > 10 else f'{end} 23:59:59')
+
+        where_clause = ' AND '.join(conditions) if conditions else '1=1'
+        return where_clause, params
+
+    def query_counts(self, group_by: str = 'device', start: Optional[str] = None,
+                     end: Optional[str] = None, device_id: Optional[str] = None,
+                     alarm_type: Optional[str] = None) -> List[Dict]:
+        """
+        分组统计（过滤和分组都在SQLite中完成）
+
+        Args:
+            group_by: 分组维度，见GROUP_BY_EXPRESSIONS
+            start/end: 时间范围 (YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS)
+            device_id/alarm_type: 过滤条件
+
+        Returns:
+            [{group_by: 分组值, 'alarm_count', 'false_alarms', 'avg_response_time'}]
+        """
+        expression = GROUP_BY_EXPRESSIONS.get(group_by)
+        if expression is None:
+            raise ValueError(f"不支持的分组维度: {group_by}")
+
+        where_clause, params = self._where(start, end, device_id, alarm_type)
+
+        conn = self._connect()
+        try:
+            cursor = conn.execute(f'''
+            SELECT {expression} AS grp,
+                   COUNT(*) AS alarm_count,
+                   SUM(CASE WHEN is_false_alarm THEN 1 ELSE 0 END) AS false_alarms,
+                   AVG(response_time) AS avg_response_time
+            FROM alarms
+            WHERE {where_clause}
+            GROUP BY grp
+            ORDER BY grp
+            ''', params)
+
+            return [
+                {
+                    group_by: row[0],
+                    'alarm_count': row[1],
+                    'false_alarms': row[2],
+                    'avg_response_time': row[3]
+                }
+                for row in cursor.fetchall()
+            ]
+        finally:
+            conn.close()
+
+    def query_alarms(self, start: Optional[str] = None, end: Optional[str] = None,
+                     device_id: Optional[str] = None, alarm_type: Optional[str] = None,
+                     limit: int = 1000) -> pd.DataFrame:
+        """按条件查询报警明细"""
+        where_clause, params = self._where(start, end, device_id, alarm_type)
+
+        conn = self._connect()
+        try:
+            return pd.read_sql_query(f'''
+            SELECT timestamp, device_id, alarm_type, location, area, description,
+                   response_time, is_false_alarm, risk_level
+            FROM alarms
+            WHERE {where_clause}
+            ORDER BY timestamp
+            LIMIT ?
+            ''', conn, params=params + [limit], parse_dates=['timestamp'])
+        finally:
+            conn.close()
@@ -0,0 +1,312 @@
+"""
+报警图表渲染服务
+图表由日聚合生成，输出文件按聚合数据哈希命名：数据未变化时直接复用已有图片，
+各图表在进程池中并行渲染，API可先返回报告和图表链接，图表就绪后再访问；
+进程池损坏时重建并重试一次，仍无法启动（如调用方脚本缺少 __main__ 保护）时改为在当前进程内渲染
+"""
+
+import hashlib
+import json
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # 无GUI后端，适合服务器环境
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+from modules.alarm_analysis.alarm_aggregates import merge_aggregates
+from modules.alarm_analysis.quantile_sketch import KLLSketch
+
+# 设置中文字体
+plt.rcParams['font.sans-serif'] = ['SimHei', 'DejaVu Sans']
+plt.rcParams['axes.unicode_minus'] = False
+
+
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def build_chart_data(daily_aggregates: Dict[str, Dict], date: str) -> Dict:
+    """
+    由日聚合提取绘图所需的数据（可JSON序列化，用于计算哈希）
+
+    Args:
+        daily_aggregates: {日期: 日聚合}
+        date: 报告日期（用于图表标题）
+    """
+    merged = merge_aggregates(list(daily_aggregates.values()))
+
+    alarm_type_counts = sorted(merged['alarm_type_counts'].items(), key=lambda item: item[1], reverse=True)
+    top_devices = sorted(merged['device_counts'].items(), key=lambda item: item[1], reverse=True)[:10]
+
+    # 箱线图统计量由草图估计（分钟），须线为1.5倍四分位距
+    response_box = None
+    sketch = KLLSketch.from_dict(merged['response_time_sketch'])
+    if sketch.n > 0:
+        q1, med, q3 = (v / 60 for v in sketch.quantiles([0.25, 0.5, 0.75]))
+        iqr = q3 - q1
+        response_box = {
+            'q1': round(q1, 3),
+            'med': round(med, 3),
+            'q3': round(q3, 3),
+            'whislo': round(max(sketch.min / 60, q1 - 1.5 * iqr), 3),
+            'whishi': round(min(sketch.max / 60, q3 + 1.5 * iqr), 3),
+        }
+
+    return {
+        'date': date,
+        'daily_counts': {
+            day: agg['total_alarms'] for day, agg in sorted(daily_aggregates.items())
+            if agg['total_alarms'] > 0
+        },
+        'alarm_type_counts': alarm_type_counts,
+        'hour_of_week_counts': merged['hour_of_week_counts'],
+        'response_time_box': response_box,
+        'top_devices': top_devices,
+    }
+
+
+def chart_data_hash(chart_data: Dict) -> str:
+    """图表数据哈希（数据相同则图片相同）"""
+    payload = json.dumps(chart_data, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def render_trend_chart(chart_data: Dict, output_path: str) -> str:
+    """渲染2x2趋势分析图（在工作进程中执行）"""
+    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
+    fig.suptitle(f"报警趋势分析 - {chart_data['date']}", fontsize=16, fontweight='bold')
+
+    # 每日报警数量趋势
+    daily_counts = pd.Series(chart_data['daily_counts'])
+    daily_counts.index = pd.to_datetime(daily_counts.index).date
+    axes[0, 0].plot(daily_counts.index, daily_counts.values, marker='o', linewidth=2)
+    axes[0, 0].set_title('每日报警数量趋势', fontsize=12)
+    axes[0, 0].set_xlabel('日期')
+    axes[0, 0].set_ylabel('报警数量')
+    axes[0, 0].grid(True, alpha=0.3)
+    axes[0, 0].tick_params(axis='x', rotation=45)
+
+    # 报警类型分布饼图
+    if chart_data['alarm_type_counts']:
+        labels, values = zip(*chart_data['alarm_type_counts'])
+        axes[0, 1].pie(values, labels=labels, autopct='%1.1f%%')
+    axes[0, 1].set_title('报警类型分布', fontsize=12)
+
+    # 每小时报警分布热力图
+    hourly_heatmap = pd.DataFrame(
+        np.asarray(chart_data['hour_of_week_counts'], dtype=np.int64).reshape(7, 24),
+        index=DAY_NAMES
+    )
+    sns.heatmap(hourly_heatmap, cmap='YlOrRd', annot=True, fmt='d', ax=axes[1, 0])
+    axes[1, 0].set_title('报警时间热力图（星期 x 小时）', fontsize=12)
+    axes[1, 0].set_xlabel('小时')
+    axes[1, 0].set_ylabel('星期')
+
+    # 响应时间分布箱线图
+    if chart_data['response_time_box']:
+        axes[1, 1].bxp([chart_data['response_time_box']], showfliers=False)
+        axes[1, 1].set_title('响应时间分布', fontsize=12)
+        axes[1, 1].set_ylabel('响应时间 (分钟)')
+        axes[1, 1].grid(True, alpha=0.3)
+
+    plt.tight_layout()
+    plt.savefig(output_path, dpi=150, bbox_inches='tight')
+    plt.close(fig)
+
+    return output_path
+
+
+def render_device_chart(chart_data: Dict, output_path: str) -> str:
+    """渲染设备报警频率Top 10柱状图（在工作进程中执行）"""
+    fig, ax = plt.subplots(figsize=(12, 6))
+    if chart_data['top_devices']:
+        devices, counts = zip(*chart_data['top_devices'])
+        pd.Series(counts, index=devices).plot(kind='barh', ax=ax, color='steelblue')
+    ax.set_title('高频报警设备 Top 10', fontsize=14, fontweight='bold')
+    ax.set_xlabel('报警次数')
+    ax.set_ylabel('设备ID')
+    ax.grid(True, alpha=0.3, axis='x')
+
+    plt.tight_layout()
+    plt.savefig(output_path, dpi=150, bbox_inches='tight')
+    plt.close(fig)
+
+    return output_path
+
+
+# 图表名称 -> (文件名前缀, 渲染函数)
+CHART_RENDERERS = {
+    'trend_chart': ('alarm_trends', render_trend_chart),
+    'device_frequency_chart': ('device_frequency', render_device_chart),
+}
+
+
+def _render_to_file(renderer, chart_data: Dict, output_path: str) -> str:
+    """先写临时文件再替换，文件存在即代表渲染完成"""
+    tmp_path = output_path + '.tmp.png'
+    renderer(chart_data, tmp_path)
+    Path(tmp_path).replace(output_path)
+    return output_path
+
+
+class ChartRenderService:
+    """按数据哈希缓存、进程池并行的图表渲染服务"""
+
+    def __init__(self, output_dir: str = './data/reports', max_workers: int = 2,
+                 url_prefix: str = '/api/v1/charts'):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.max_workers = max_workers
+        self.url_prefix = url_prefix
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._broken_pools = 0
+        self._in_process = False
+        self._pending: Dict[str, Future] = {}
+        self._failed: Dict[str, str] = {}
+        self._lock = threading.RLock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn避免在多线程的API进程中fork
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    def _mark_broken(self, executor: Optional[ProcessPoolExecutor]):
+        """
+        丢弃已损坏的进程池（工作进程异常退出后不能再提交任务），下次提交时重建
+
+        连续两个进程池都损坏说明工作进程无法启动（如调用方脚本缺少 __main__ 保护，
+        spawn重新导入主模块时出错），之后改为在当前进程内渲染
+        """
+        with self._lock:
+            if executor is None or executor is not self._executor:
+                return
+            self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._broken_pools += 1
+            if self._broken_pools >= 2 and not self._in_process:
+                print("渲染进程池无法启动，改为在当前进程内渲染")
+                self._in_process = True
+
+    def _submit_task(self, name: str, chart_data: Dict, path: Path):
+        """提交一个图表的渲染任务并登记为渲染中"""
+        renderer = CHART_RENDERERS[name][1]
+        executor = None
+
+        while not self._in_process:
+            executor = self._get_executor()
+            try:
+                future = executor.submit(_render_to_file, renderer, chart_data, str(path))
+                break
+            except BrokenProcessPool:
+                self._mark_broken(executor)
+            except (OSError, RuntimeError) as e:
+                print(f"无法启动渲染进程池，改为在当前进程内渲染: {e}")
+                self._in_process = True
+
+        if self._in_process:
+            executor = None
+            future = Future()
+            try:
+                future.set_result(_render_to_file(renderer, chart_data, str(path)))
+            except Exception as e:
+                future.set_exception(e)
+
+        self._pending[path.name] = future
+        future.add_done_callback(lambda f: self._on_done(path.name, f, executor))
+
+    def chart_files(self, chart_data: Dict) -> Dict[str, Path]:
+        """各图表的输出路径（文件名包含数据哈希）"""
+        data_hash = chart_data_hash(chart_data)
+        return {
+            name: self.output_dir / f'{prefix}_{data_hash}.png'
+            for name, (prefix, _) in CHART_RENDERERS.items()
+        }
+
+    def _on_done(self, filename: str, future: Future, executor: Optional[ProcessPoolExecutor]):
+        with self._lock:
+            if self._pending.get(filename) is future:
+                del self._pending[filename]
+            if future.exception() is None:
+                self._broken_pools = 0
+                return
+            if isinstance(future.exception(), BrokenProcessPool):
+                self._mark_broken(executor)
+            self._failed[filename] = str(future.exception())
+            print(f"图表渲染失败 {filename}: {future.exception()}")
+
+    def submit(self, chart_data: Dict) -> Dict[str, Path]:
+        """
+        提交渲染任务（不等待），已存在或正在渲染的图表不会重复提交
+
+        Returns:
+            {图表名称: 输出路径}
+        """
+        files = self.chart_files(chart_data)
+
+        with self._lock:
+            for name, path in files.items():
+                if path.exists() or path.name in self._pending:
+                    continue
+
+                self._failed.pop(path.name, None)
+                self._submit_task(name, chart_data, path)
+
+        return files
+
+    def render(self, chart_data: Dict, timeout: Optional[float] = None) -> Dict[str, str]:
+        """
+        提交渲染任务并等待完成
+
+        进程池在渲染中损坏时重建并重新提交一次，再次损坏则改为在当前进程内渲染
+        """
+        files = self.submit(chart_data)
+
+        for _ in range(3):
+            with self._lock:
+                futures = {p.name: self._pending[p.name] for p in files.values() if p.name in self._pending}
+            try:
+                for future in futures.values():
+                    future.result(timeout=timeout)
+                break
+            except BrokenProcessPool:
+                # 完成回调可能尚未执行：先移除损坏的任务，重新提交时在损坏的进程池上提交会触发重建
+                with self._lock:
+                    for filename, future in futures.items():
+                        if self._pending.get(filename) is future:
+                            del self._pending[filename]
+                files = self.submit(chart_data)
+
+        return {name: str(path) for name, path in files.items()}
+
+    def url_for(self, path: Path) -> str:
+        return f'{self.url_prefix}/{Path(path).name}'
+
+    def status(self, filename: str) -> str:
+        """图表状态：ready / pending / failed / missing"""
+        filename = Path(filename).name
+        if (self.output_dir / filename).exists():
+            return 'ready'
+        with self._lock:
+            if filename in self._pending:
+                return 'pending'
+            if filename in self._failed:
+                return 'failed'
+        return 'missing'
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
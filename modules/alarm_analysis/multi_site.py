@@ -0,0 +1,195 @@
+"""
+多站点报警分析模块
+各站点在进程池中并行计算可合并的局部聚合（计数、分布、分位数草图），
+再归约为全局报告和各站点明细
+"""
+
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from modules.alarm_analysis.alarm_aggregates import aggregate_to_statistics, merge_aggregates
+from modules.alarm_analysis.alarm_analyzer import AlarmAnalyzer
+
+
+# 设备/区域维度的字段，跨站点合并时键加站点前缀，避免不同站点的同名设备、区域（如AREA1）被合并
+SITE_KEYED_FIELDS = ('device_counts', 'suppressed_by_device', 'device_response_sketches',
+                     'device_hour_counts', 'area_counts', 'area_response_sketches')
+
+
+def compute_site_partial(site: str, data_dir: str, output_dir: str, date: str, days: int,
+                         dedup_gap_seconds: Optional[float]) -> Dict:
+    """
+    计算单个站点的局部聚合（在工作进程中执行）
+
+    Returns:
+        {'site', 'days_with_data', 'aggregate'}
+    """
+    analyzer = AlarmAnalyzer(data_dir=data_dir, output_dir=output_dir,
+                             dedup_gap_seconds=dedup_gap_seconds)
+    daily_aggregates = analyzer.get_daily_aggregates(date, days)
+
+    return {
+        'site': site,
+        'days_with_data': len(daily_aggregates),
+        'aggregate': merge_aggregates(list(daily_aggregates.values())),
+    }
+
+
+def _prefix_site_keys(aggregate: Dict, site: str) -> Dict:
+    """设备/区域维度字段的键加上站点前缀"""
+    prefixed = dict(aggregate)
+    for field in SITE_KEYED_FIELDS:
+        prefixed[field] = {f'{site}/{key}': value for key, value in aggregate[field].items()}
+    return prefixed
+
+
+class MultiSiteAlarmAnalyzer:
+    """多站点报警分析器"""
+
+    def __init__(self, site_dirs: Dict[str, str], output_dir: str = './data/reports',
+                 max_workers: Optional[int] = None, dedup_gap_seconds: Optional[float] = 60):
+        """
+        Args:
+            site_dirs: {站点名称: 报警数据目录}
+            output_dir: 报告输出目录
+            max_workers: 进程数，默认为CPU核数
+            dedup_gap_seconds: 报警风暴合并间隔（秒）
+        """
+        self.site_dirs = site_dirs
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.max_workers = max_workers
+        self.dedup_gap_seconds = dedup_gap_seconds
+
+        # 复用单站点分析器的阈值、警报和建议逻辑
+        self._reporter = AlarmAnalyzer(output_dir=str(self.output_dir))
+
+    @classmethod
+    def from_root(cls, root_dir: str, **kwargs) -> 'MultiSiteAlarmAnalyzer':
+        """以根目录下的每个子目录作为一个站点"""
+        site_dirs = {p.name: str(p) for p in sorted(Path(root_dir).iterdir()) if p.is_dir()}
+        return cls(site_dirs, **kwargs)
+
+    def compute_partials(self, date: str, days: int) -> List[Dict]:
+        """并行计算各站点局部聚合（map阶段）"""
+        partials = []
+
+        with ProcessPoolExecutor(max_workers=self.max_workers,
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = {
+                executor.submit(compute_site_partial, site, data_dir, str(self.output_dir),
+                                date, days, self.dedup_gap_seconds): site
+                for site, data_dir in self.site_dirs.items()
+            }
+
+            for future in as_completed(futures):
+                site = futures[future]
+                try:
+                    partials.append(future.result())
+                except Exception as e:
+                    print(f"站点 {site} 分析失败: {e}")
+
+        return sorted(partials, key=lambda p: p['site'])
+
+    def _site_report(self, aggregate: Dict) -> Dict:
+        stats = aggregate_to_statistics(aggregate, self._reporter.thresholds['device_alarm_frequency'])
+        return {
+            'statistics': stats,
+            'threshold_alerts': self._reporter.check_thresholds(stats) if stats else []
+        }
+
+    def analyze(self, date: str = None, days: int = 30) -> Dict:
+        """
+        执行多站点分析
+
+        Returns:
+            全局报告 + 各站点明细
+        """
+        if date is None:
+            date = datetime.now().strftime('%Y-%m-%d')
+
+        print(f"开始多站点分析 {date}（{len(self.site_dirs)}个站点，最近{days}天）...")
+
+        partials = self.compute_partials(date, days)
+
+        # reduce阶段：合并各站点局部聚合
+        global_aggregate = merge_aggregates([_prefix_site_keys(p['aggregate'], p['site']) for p in partials])
+        global_report = self._site_report(global_aggregate)
+
+        if not global_report['statistics']:
+            return {
+                'status': 'error',
+                'message': '未找到报警数据',
+                'date': date
+            }
+
+        global_report['statistics']['analysis_timestamp'] = datetime.now().isoformat()
+
+        sites = {}
+        for partial in partials:
+            site_report = self._site_report(partial['aggregate'])
+            site_report['days_with_data'] = partial['days_with_data']
+            sites[partial['site']] = site_report
+
+        report = {
+            'status': 'success',
+            'analysis_date': date,
+            'data_period_days': days,
+            'site_count': len(partials),
+            'failed_sites': sorted(set(self.site_dirs) - {p['site'] for p in partials}),
+            'statistics': global_report['statistics'],
+            'threshold_alerts': global_report['threshold_alerts'],
+            'sites': sites,
+            'recommendations': self._reporter._generate_recommendations(
+                global_report['statistics'], global_report['threshold_alerts']
+            )
+        }
+
+        report_path = self.output_dir / f'alarm_multi_site_report_{date}.json'
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+        report['report_path'] = str(report_path)
+
+        print(f"多站点分析完成！报告已保存到: {report_path}")
+
+        return report
+
+
+# 命令行工具接口
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='多站点报警数据分析工具')
+    parser.add_argument('--sites-root', type=str, help='站点根目录（每个子目录为一个站点）', default=None)
+    parser.add_argument('--sites', type=str, help='站点列表: 名称=目录,名称=目录', default=None)
+    parser.add_argument('--date', type=str, help='分析日期 (YYYY-MM-DD)', default=None)
+    parser.add_argument('--days', type=int, help='加载最近N天数据', default=30)
+    parser.add_argument('--workers', type=int, help='并行进程数', default=None)
+    parser.add_argument('--output-dir', type=str, help='输出目录', default='./data/reports')
+
+    args = parser.parse_args()
+
+    if args.sites_root:
+        multi = MultiSiteAlarmAnalyzer.from_root(args.sites_root, output_dir=args.output_dir,
+                                                 max_workers=args.workers)
+    elif args.sites:
+        site_dirs = dict(item.split('=', 1) for item in args.sites.split(','))
+        multi = MultiSiteAlarmAnalyzer(site_dirs, output_dir=args.output_dir, max_workers=args.workers)
+    else:
+        parser.error('需要指定 --sites-root 或 --sites')
+
+    report = multi.analyze(date=args.date, days=args.days)
+
+    if report['status'] == 'success':
+        print("\n=== 多站点分析摘要 ===")
+        print(f"全局报警数: {report['statistics']['total_alarms']}")
+        for site, site_report in report['sites'].items():
+            print(f"  - {site}: {site_report['statistics'].get('total_alarms', 0)}条报警，"
+                  f"{len(site_report['threshold_alerts'])}个警报")
@@ -0,0 +1,158 @@
+"""
+可合并分位数草图模块
+KLL草图（Karnin-Lang-Liberty）用于响应时间p50/p90/p99，可按天、设备、区域存储后任意合并
+
+误差界：秩误差 ε 与 k 成反比，k=200 时归一化秩误差约 1.65%（99%置信度），
+即返回的 p90 位于真实的 p88.35 ~ p91.65 之间。合并不会放大误差。
+草图大小为 O(k·log(n/k))，样本数不超过 k 时结果精确。
+"""
+
+import numpy as np
+from typing import Dict, Iterable, List, Optional
+
+
+class KLLSketch:
+    """KLL分位数草图"""
+
+    def __init__(self, k: int = 200, c: float = 2 / 3, seed: int = 0):
+        self.k = k
+        self.c = c
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        self.n = 0
+        self.min = float('inf')
+        self.max = float('-inf')
+        # 固定种子：相同输入和合并顺序得到相同草图，便于按数据哈希缓存结果
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level: int) -> int:
+        """每层容量，越高的层容量越大（c^depth * k）"""
+        depth = len(self.levels) - level - 1
+        return max(int(np.ceil(self.c ** depth * self.k)), 2)
+
+    def _size(self) -> int:
+        return sum(len(items) for items in self.levels)
+
+    def _max_size(self) -> int:
+        return sum(self._capacity(h) for h in range(len(self.levels)))
+
+    def _compress(self):
+        """压缩超出容量的层：排序后随机取奇数位或偶数位元素晋升到上一层"""
+        while self._size() >= self._max_size():
+            for h in range(len(self.levels)):
+                if len(self.levels[h]) < self._capacity(h):
+                    continue
+
+                if h + 1 >= len(self.levels):
+                    self.levels.append(np.empty(0))
+
+                items = np.sort(self.levels[h])
+                # 奇数个元素时保留一个在本层
+                keep = items[-1:] if len(items) % 2 else items[:0]
+                pairs = items[:len(items) - len(keep)]
+                offset = int(self._rng.integers(2))
+
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], pairs[offset::2]])
+                self.levels[h] = keep
+                break
+
+    def update(self, values: Iterable[float]):
+        """批量加入数值（忽略NaN）"""
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+
+        self.n += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other: 'KLLSketch') -> 'KLLSketch':
+        """合并另一个草图（原地修改并返回自身）"""
+        if other.n == 0:
+            return self
+
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def quantile(self, q: float) -> float:
+        """
+        估计分位数
+
+        Args:
+            q: 分位点 (0-1)
+
+        Returns:
+            分位数估计值，草图为空时返回NaN
+        """
+        if self.n == 0:
+            return float('nan')
+
+        if len(self.levels) == 1:
+            # 未发生过压缩，结果精确（线性插值，与pandas一致）
+            return float(np.quantile(self.levels[0], q))
+
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        cumulative = np.cumsum(weights[order])
+
+        idx = np.searchsorted(cumulative, q * cumulative[-1], side='left')
+        return float(items[order][min(idx, len(items) - 1)])
+
+    def quantiles(self, qs: Iterable[float]) -> List[float]:
+        return [self.quantile(q) for q in qs]
+
+    def to_dict(self) -> Dict:
+        """序列化为可JSON存储的字典"""
+        return {
+            'k': self.k,
+            'n': self.n,
+            'min': self.min if self.n else None,
+            'max': self.max if self.n else None,
+            'levels': [items.tolist() for items in self.levels],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> 'KLLSketch':
+        """从字典恢复草图，None返回空草图"""
+        sketch = cls()
+        if not data:
+            return sketch
+
+        sketch.k = data['k']
+        sketch.n = data['n']
+        if sketch.n:
+            sketch.min = data['min']
+            sketch.max = data['max']
+        sketch.levels = [np.asarray(items, dtype=float) for items in data['levels']] or [np.empty(0)]
+        return sketch
+
+    @classmethod
+    def from_values(cls, values: Iterable[float], k: int = 200) -> 'KLLSketch':
+        sketch = cls(k=k)
+        sketch.update(values)
+        return sketch
+
+
+def merge_sketch_dicts(sketches: Iterable[Optional[Dict]]) -> KLLSketch:
+    """合并多个序列化草图"""
+    merged = KLLSketch()
+    for data in sketches:
+        if data:
+            merged.merge(KLLSketch.from_dict(data))
+    return merged
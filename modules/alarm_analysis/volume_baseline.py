@@ -0,0 +1,174 @@
+"""
+设备报警量基线模块
+为每个设备的每个"星期几×小时"（168个时段）维护EWMA均值和方差，
+每天由日聚合增量更新，对当天各设备各小时的报警数做向量化的显著性检验，
+替代对所有设备一刀切的固定阈值（繁忙大堂门和安静机房门的正常水平差别很大）
+"""
+
+import os
+import numpy as np
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+HOURS_PER_WEEK = 7 * 24
+
+
+class DeviceVolumeBaseline:
+    """设备×星期几×小时 报警量基线"""
+
+    def __init__(self, path: Optional[str], alpha: float = 0.1, z_threshold: float = 4.0,
+                 min_observations: int = 4, min_excess: int = 3):
+        """
+        Args:
+            path: 基线存储文件（.npz），为None时只在内存中使用，不读取也不保存
+            alpha: EWMA平滑系数，越大越偏重近期
+            z_threshold: 判定异常的z分数阈值
+            min_observations: 某时段至少观测过几周才参与判定
+            min_excess: 报警数至少超出期望值多少条才判定异常，避免低基数时的偶发波动
+        """
+        self.path = Path(path) if path is not None else None
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.min_observations = min_observations
+        self.min_excess = min_excess
+
+        self.devices: List[str] = []
+        self._index: Dict[str, int] = {}
+        self.mean = np.zeros((0, HOURS_PER_WEEK))
+        self.var = np.zeros((0, HOURS_PER_WEEK))
+        self.n_obs = np.zeros((0, HOURS_PER_WEEK), dtype=np.int32)
+        self.last_date: Optional[str] = None
+
+        self.load()
+
+    # ---------- 持久化 ----------
+
+    def load(self):
+        if self.path is None or not self.path.exists():
+            return
+
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                self.devices = data['devices'].tolist()
+                self.mean = data['mean']
+                self.var = data['var']
+                self.n_obs = data['n_obs']
+                last_date = str(data['last_date'])
+                self.last_date = last_date or None
+        except Exception as e:
+            print(f"读取报警量基线失败，将重新建立 {self.path}: {e}")
+            return
+
+        self._index = {device: i for i, device in enumerate(self.devices)}
+
+    def save(self):
+        """原子写入（先写临时文件再替换）"""
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, devices=np.array(self.devices, dtype=str), mean=self.mean, var=self.var,
+                     n_obs=self.n_obs, last_date=np.array(self.last_date or ''))
+        os.replace(tmp_path, self.path)
+
+    def empty_copy(self) -> 'DeviceVolumeBaseline':
+        """参数相同、不持久化的空基线（回溯分析历史日期时使用）"""
+        return DeviceVolumeBaseline(None, alpha=self.alpha, z_threshold=self.z_threshold,
+                                    min_observations=self.min_observations, min_excess=self.min_excess)
+
+    # ---------- 计算 ----------
+
+    def _add_devices(self, devices: List[str]):
+        new_devices = [d for d in devices if d not in self._index]
+        if not new_devices:
+            return
+
+        for device in new_devices:
+            self._index[device] = len(self.devices)
+            self.devices.append(device)
+
+        extra = len(new_devices)
+        self.mean = np.vstack([self.mean, np.zeros((extra, HOURS_PER_WEEK))])
+        self.var = np.vstack([self.var, np.zeros((extra, HOURS_PER_WEEK))])
+        self.n_obs = np.vstack([self.n_obs, np.zeros((extra, HOURS_PER_WEEK), dtype=np.int32)])
+
+    def _count_matrix(self, device_hour_counts: Dict[str, List[int]]) -> np.ndarray:
+        """日聚合的设备小时计数 -> (已知设备数, 24) 矩阵，当天无报警的设备为0"""
+        counts = np.zeros((len(self.devices), 24))
+        known = [(self._index[d], hours) for d, hours in device_hour_counts.items() if d in self._index]
+        if known:
+            rows, hours = zip(*known)
+            counts[list(rows)] = np.asarray(hours, dtype=float)
+        return counts
+
+    @staticmethod
+    def _week_slots(date: str) -> np.ndarray:
+        weekday = datetime.strptime(date, '%Y-%m-%d').weekday()
+        return weekday * 24 + np.arange(24)
+
+    def update_day(self, date: str, device_hour_counts: Dict[str, List[int]]):
+        """
+        用一天的设备小时计数更新基线（所有设备一次矩阵运算）
+
+        Args:
+            date: 日期 (YYYY-MM-DD)
+            device_hour_counts: 日聚合中的device_hour_counts
+        """
+        self._add_devices(list(device_hour_counts))
+        slots = self._week_slots(date)
+
+        x = self._count_matrix(device_hour_counts)
+        mean = self.mean[:, slots]
+        var = self.var[:, slots]
+        n_obs = self.n_obs[:, slots]
+
+        # 观测不足1/alpha周时按累计平均更新（首次观测即为均值），之后按EWMA更新均值和方差
+        weight = np.maximum(self.alpha, 1.0 / (n_obs + 1))
+        delta = x - mean
+
+        self.mean[:, slots] = mean + weight * delta
+        self.var[:, slots] = (1 - weight) * (var + weight * delta ** 2)
+        self.n_obs[:, slots] = n_obs + 1
+        self.last_date = date
+
+    def detect(self, date: str, device_hour_counts: Dict[str, List[int]]) -> List[Dict]:
+        """
+        检测某天各设备各小时的报警量异常
+
+        方差下限取该时段均值和设备全周平均小时量中的较大者（泊松假设），
+        避免只观测过几周、恰好一直为0的时段把偶发的几条报警判为极端异常
+
+        Returns:
+            [{'device_id', 'hour', 'count', 'expected', 'z_score'}]，按z分数降序
+        """
+        if not self.devices:
+            return []
+
+        slots = self._week_slots(date)
+        x = self._count_matrix(device_hour_counts)
+        mean = self.mean[:, slots]
+        observed = self.n_obs > 0
+        device_mean = ((self.mean * observed).sum(axis=1, keepdims=True)
+                       / np.maximum(observed.sum(axis=1, keepdims=True), 1))
+        std = np.sqrt(np.maximum(np.maximum(self.var[:, slots], mean), device_mean) + 0.25)
+        z = (x - mean) / std
+
+        flagged = ((self.n_obs[:, slots] >= self.min_observations)
+                   & (z > self.z_threshold)
+                   & (x - mean >= self.min_excess))
+
+        rows, hours = np.nonzero(flagged)
+        order = np.argsort(-z[rows, hours], kind='stable')
+
+        return [
+            {
+                'device_id': self.devices[row],
+                'hour': int(hour),
+                'count': int(x[row, hour]),
+                'expected': round(float(mean[row, hour]), 2),
+                'z_score': round(float(z[row, hour]), 2)
+            }
+            for row, hour in zip(rows[order], hours[order])
+        ]
@@ -0,0 +1,203 @@
+"""
+数据表结构声明模块
+以声明式的列定义描述报警CSV和设备日志CSV，入库时一次性完成向量化的类型转换、
+单位统一（分钟→秒）、取值映射和派生列，不合规的行写入隔离文件，
+下游分析可以直接假定列存在且类型正确
+"""
+
+import pandas as pd
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+# 结构定义变更时递增，依赖源文件版本的缓存（Parquet分区、日聚合、立方体）随之重建
+SCHEMA_VERSION = 1
+
+# 列定义字段：
+#   type: datetime / category / string / float32 / float64 / int32 / boolean
+#   required: 转换后为空的行进入隔离文件
+#   values: 允许的取值（转换和映射之后），其他非空取值进入隔离文件
+#   value_map: 原始取值 -> 标准取值
+#   min / max: 数值范围，超出范围的行进入隔离文件
+#   sources: 按顺序查找的原始列及换算系数（统一单位），默认为同名列、系数1
+#   derive: 所有原始列都不存在时，由其他列派生 (函数, 依赖的原始列)
+
+ALARM_SCHEMA: Dict[str, Dict] = {
+    'timestamp': {'type': 'datetime', 'required': True},
+    'device_id': {'type': 'category', 'required': True},
+    'alarm_type': {'type': 'category', 'required': True},
+    'location': {'type': 'category'},
+    'area': {
+        'type': 'category',
+        'derive': (lambda df: df['location'].astype('string').str.replace(r'门禁$', '', regex=True),
+                   ['location']),
+    },
+    'severity': {'type': 'category', 'values': ['low', 'medium', 'high', 'critical']},
+    'status': {'type': 'category', 'values': ['open', 'in_progress', 'resolved', 'false_alarm']},
+    'description': {'type': 'string'},
+    # 统一为秒
+    'response_time': {
+        'type': 'float32', 'min': 0,
+        'sources': {'response_time': 1, 'response_time_seconds': 1, 'response_time_minutes': 60},
+    },
+    'is_false_alarm': {
+        'type': 'boolean',
+        'derive': (lambda df: df['status'].astype('string') == 'false_alarm', ['status']),
+    },
+}
+
+DEVICE_LOG_SCHEMA: Dict[str, Dict] = {
+    'timestamp': {'type': 'datetime', 'required': True},
+    'device_id': {'type': 'category', 'required': True},
+    'device_type': {'type': 'category'},
+    'event_type': {
+        'type': 'category',
+        'value_map': {'正常运行': 'normal', '重启': 'reboot', '错误': 'error',
+                      '维护': 'maintenance', '配置更新': 'config_update'},
+    },
+    'uptime_hours': {'type': 'float32', 'min': 0},
+    'error_count': {'type': 'int32', 'min': 0},
+    'temperature': {'type': 'float32'},
+    'status': {
+        'type': 'category',
+        'value_map': {'正常': 'online', '警告': 'warning', '故障': 'fault', '离线': 'offline'},
+    },
+    'response_time_ms': {'type': 'float32', 'min': 0},
+}
+
+_TRUE_VALUES = {'true', '1', 'yes', 'y', 't', '是'}
+_FALSE_VALUES = {'false', '0', 'no', 'n', 'f', '否'}
+
+
+def source_columns(schema: Dict[str, Dict], columns: Optional[List[str]] = None) -> Set[str]:
+    """
+    生成指定列所需读取的原始列名（用于read_csv的usecols）
+
+    Args:
+        schema: 表结构
+        columns: 需要的标准列，None表示全部
+    """
+    needed = set()
+    for name in columns if columns is not None else schema:
+        spec = schema.get(name)
+        if spec is None:
+            needed.add(name)
+            continue
+        needed.update(spec.get('sources', {name: 1}))
+        if 'derive' in spec:
+            needed.update(spec['derive'][1])
+    return needed
+
+
+def _coerce(values: pd.Series, spec: Dict) -> pd.Series:
+    """单列向量化类型转换（无法转换的值变为空值）"""
+    kind = spec['type']
+
+    if 'value_map' in spec and kind in ('category', 'string'):
+        values = values.astype('string').str.strip()
+        values = values.replace(spec['value_map'])
+
+    if kind == 'datetime':
+        return pd.to_datetime(values, errors='coerce', format='mixed')
+    if kind in ('float32', 'float64', 'int32'):
+        numeric = pd.to_numeric(values, errors='coerce')
+        return numeric.astype('float64') if kind == 'int32' else numeric.astype(kind)
+    if kind == 'boolean':
+        if pd.api.types.is_bool_dtype(values):
+            return values.astype('boolean')
+        text = values.astype('string').str.strip().str.lower()
+        result = pd.Series(pd.NA, index=values.index, dtype='boolean')
+        result[text.isin(_TRUE_VALUES).fillna(False).astype(bool)] = True
+        result[text.isin(_FALSE_VALUES).fillna(False).astype(bool)] = False
+        return result
+    if kind == 'category':
+        return values.astype('string').str.strip().astype('category')
+    return values.astype('string')
+
+
+def apply_schema(df: pd.DataFrame, schema: Dict[str, Dict]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    按表结构转换DataFrame
+
+    Args:
+        df: 原始数据（read_csv结果）
+        schema: 表结构
+
+    Returns:
+        (合规数据, 隔离数据)；合规数据包含表结构中的全部列，
+        隔离数据为原始行加上quarantine_reason列
+    """
+    result = pd.DataFrame(index=df.index)
+    reasons = pd.Series(pd.NA, index=df.index, dtype='string')
+
+    def reject(mask: pd.Series, reason: str):
+        mask = mask.fillna(False).astype(bool) & reasons.isna()
+        reasons[mask] = reason
+
+    for name, spec in schema.items():
+        values = None
+        for source, factor in spec.get('sources', {name: 1}).items():
+            if source in df.columns:
+                values = df[source]
+                break
+
+        if values is None and 'derive' in spec and all(c in df.columns for c in spec['derive'][1]):
+            values = spec['derive'][0](df)
+            factor = 1
+
+        present = values is not None
+        if not present:
+            values = pd.Series(pd.NA, index=df.index)
+            factor = 1
+
+        raw = values
+        coerced = _coerce(values, spec)
+        if spec['type'] in ('float32', 'float64', 'int32') and factor != 1:
+            coerced = coerced * factor
+
+        # 原始值非空但无法转换
+        reject(raw.notna() & coerced.isna(), f'{name}: 无法转换为{spec["type"]}')
+
+        # 未读取的列（usecols只选了部分列）不做必填检查
+        if spec.get('required') and present:
+            reject(coerced.isna(), f'{name}: 缺失')
+        if 'values' in spec:
+            reject(coerced.notna() & ~coerced.isin(spec['values']), f'{name}: 取值不在允许范围')
+        if 'min' in spec:
+            reject(coerced < spec['min'], f'{name}: 小于{spec["min"]}')
+        if 'max' in spec:
+            reject(coerced > spec['max'], f'{name}: 大于{spec["max"]}')
+        if spec['type'] == 'int32':
+            reject(coerced.notna() & (coerced != coerced.round()), f'{name}: 不是整数')
+
+        result[name] = coerced
+
+    bad = reasons.notna().to_numpy()
+    clean = result[~bad].copy()
+
+    # int32在剔除非整数行后再转换为可空整数
+    for name, spec in schema.items():
+        if spec['type'] == 'int32':
+            clean[name] = clean[name].astype('Int32')
+        elif spec['type'] == 'category':
+            clean[name] = clean[name].cat.remove_unused_categories()
+
+    quarantined = df[bad].copy()
+    quarantined['quarantine_reason'] = reasons[bad]
+
+    return clean.reset_index(drop=True), quarantined
+
+
+def write_quarantine(quarantined: pd.DataFrame, path: Path, append: bool = False):
+    """
+    写入隔离文件（没有不合规行且非追加模式时删除该源文件的旧隔离文件）
+    """
+    path = Path(path)
+    if quarantined.empty:
+        if not append and path.exists():
+            path.unlink()
+        return
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    header = not (append and path.exists())
+    quarantined.to_csv(path, mode='a' if append else 'w', header=header, index=False, encoding='utf-8')
+    print(f"{len(quarantined)}行数据不合规，已写入隔离文件: {path}")
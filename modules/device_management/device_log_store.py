@@ -0,0 +1,210 @@
+"""
+设备日志列式存储模块
+将每月的设备日志CSV按表结构校验转换后存为按月分区的Parquet（分区内按时间排序），
+加载时只打开与时间范围相关的月份，时间条件下推到行组统计信息，只读取所需的列
+"""
+
+import pandas as pd
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from modules.data_schema import DEVICE_LOG_SCHEMA, SCHEMA_VERSION, apply_schema, write_quarantine
+
+# Parquet读写依赖pyarrow（可选依赖，未安装时回退到CSV读取）
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_SUPPORT = True
+except ImportError:
+    PARQUET_SUPPORT = False
+
+# 分区文件元数据中记录的表结构版本
+SCHEMA_VERSION_KEY = b'device_log_schema_version'
+
+# 每个行组的行数：行组是时间条件能跳过的最小单位，分区按时间排序后越小跳得越准
+ROW_GROUP_SIZE = 65536
+
+# 低基数字符串列，存储为categorical以压缩体积并加速groupby
+CATEGORICAL_COLUMNS = ['device_id', 'device_type', 'event_type', 'status']
+
+
+class DeviceLogStore:
+    """按月分区的设备日志Parquet存储"""
+
+    def __init__(self, data_dir: str = './data/devices', store_dir: str = None):
+        self.data_dir = Path(data_dir)
+        # 分区目录结构: <store_dir>/month=YYYYMM/device_logs.parquet
+        self.store_dir = Path(store_dir) if store_dir else self.data_dir / 'parquet'
+
+    def csv_path(self, month: str) -> Path:
+        """某月原始CSV文件路径"""
+        return self.data_dir / f'device_logs_{month}.csv'
+
+    def partition_path(self, month: str) -> Path:
+        """某月Parquet分区文件路径"""
+        return self.store_dir / f'month={month}' / 'device_logs.parquet'
+
+    def quarantine_path(self, month: str) -> Path:
+        """某月不合规行的隔离文件路径"""
+        return self.data_dir / 'quarantine' / f'device_logs_{month}.csv'
+
+    def source_months(self) -> List[str]:
+        """数据目录下所有月度CSV对应的月份 (YYYYMM)"""
+        return sorted(p.stem[len('device_logs_'):] for p in self.data_dir.glob('device_logs_*.csv'))
+
+    @staticmethod
+    def months_since(start: Optional[datetime], months: List[str]) -> List[str]:
+        """
+        筛选可能包含start之后日志的月份
+
+        月度文件只包含该月及更早补传的日志，因此早于start所在月份的文件可以整体跳过
+        """
+        if start is None:
+            return list(months)
+        return [m for m in months if m >= start.strftime('%Y%m')]
+
+    def is_stale(self, month: str) -> bool:
+        """CSV存在且分区缺失、早于CSV或表结构版本不同时，需要重新转换"""
+        csv_path = self.csv_path(month)
+        if not csv_path.exists():
+            return False
+
+        partition = self.partition_path(month)
+        if not partition.exists():
+            return True
+
+        if partition.stat().st_mtime < csv_path.stat().st_mtime:
+            return True
+
+        metadata = pq.read_schema(partition).metadata or {}
+        return metadata.get(SCHEMA_VERSION_KEY) != str(SCHEMA_VERSION).encode()
+
+    def ingest_month(self, month: str) -> Optional[Path]:
+        """将某月CSV按表结构转换为按时间排序的Parquet分区，不合规的行写入隔离文件"""
+        csv_path = self.csv_path(month)
+        if not csv_path.exists():
+            return None
+
+        df, quarantined = apply_schema(pd.read_csv(csv_path), DEVICE_LOG_SCHEMA)
+        write_quarantine(quarantined, self.quarantine_path(month))
+
+        # 按时间排序（同一时间保持原始顺序），使每个行组覆盖一段连续时间，时间条件可以跳过整组
+        df = df.sort_values('timestamp', kind='stable', ignore_index=True)
+
+        partition = self.partition_path(month)
+        partition.parent.mkdir(parents=True, exist_ok=True)
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                               SCHEMA_VERSION_KEY: str(SCHEMA_VERSION).encode()})
+
+        # 先写临时文件再替换，避免读到写了一半的分区
+        tmp_path = partition.with_suffix('.parquet.tmp')
+        pq.write_table(table, tmp_path, row_group_size=ROW_GROUP_SIZE)
+        tmp_path.replace(partition)
+
+        return partition
+
+    def ingest(self, months: List[str] = None, force: bool = False) -> Dict:
+        """
+        转换CSV为Parquet分区（仅处理新增或已变更的文件）
+
+        Args:
+            months: 需要转换的月份列表 (YYYYMM)，默认为数据目录下所有CSV
+            force: 是否强制重新转换
+
+        Returns:
+            转换统计
+        """
+        if not PARQUET_SUPPORT:
+            return {'ingested': [], 'skipped': 0, 'error': '未安装pyarrow，无法写入Parquet'}
+
+        if months is None:
+            months = self.source_months()
+
+        ingested = []
+        skipped = 0
+
+        for month in months:
+            if not (force or self.is_stale(month)):
+                skipped += 1
+                continue
+
+            try:
+                if self.ingest_month(month) is not None:
+                    ingested.append(month)
+            except Exception as e:
+                print(f"转换设备日志失败 {self.csv_path(month)}: {e}")
+
+        return {'ingested': ingested, 'skipped': skipped}
+
+    def available_months(self) -> List[str]:
+        """已转换的分区月份"""
+        return sorted(p.parent.name[len('month='):] for p in self.store_dir.glob('month=*/device_logs.parquet'))
+
+    def load(self, start: Optional[datetime] = None, columns: List[str] = None) -> pd.DataFrame:
+        """
+        读取start之后的日志，只加载需要的列
+
+        Args:
+            start: 起始时间（含），None表示全部
+            columns: 需要的列，None表示全部列
+
+        Returns:
+            按时间排序的DataFrame
+        """
+        frames = []
+        filters = [('timestamp', '>=', pd.Timestamp(start))] if start is not None else None
+
+        for month in self.months_since(start, self.available_months()):
+            partition = self.partition_path(month)
+
+            try:
+                read_columns = None
+                if columns is not None:
+                    # 只投影分区中实际存在的列
+                    available = pq.ParquetFile(partition).schema_arrow.names
+                    read_columns = [c for c in columns if c in available]
+
+                frames.append(pd.read_parquet(partition, columns=read_columns, filters=filters))
+            except Exception as e:
+                print(f"读取分区失败 {partition}: {e}")
+
+        if not frames:
+            return pd.DataFrame()
+
+        df = pd.concat(frames, ignore_index=True)
+
+        # 后续月份的文件可能含有补传的早期日志，合并后重新按时间排序
+        if len(frames) > 1 and 'timestamp' in df.columns:
+            df = df.sort_values('timestamp', kind='stable', ignore_index=True)
+
+        # 各分区类别集合不同时concat会退化为object，这里重新转换
+        for col in CATEGORICAL_COLUMNS:
+            if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype('category')
+
+        return df
+
+
+# 命令行工具接口
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='设备日志CSV转换为Parquet分区存储')
+    parser.add_argument('--data-dir', type=str, help='CSV数据目录', default='./data/devices')
+    parser.add_argument('--store-dir', type=str, help='Parquet存储目录', default=None)
+    parser.add_argument('--force', action='store_true', help='强制重新转换所有文件')
+
+    args = parser.parse_args()
+
+    store = DeviceLogStore(data_dir=args.data_dir, store_dir=args.store_dir)
+    result = store.ingest(force=args.force)
+
+    if 'error' in result:
+        print(result['error'])
+    else:
+        print(f"转换完成: {len(result['ingested'])}个分区，跳过{result['skipped']}个未变更文件")
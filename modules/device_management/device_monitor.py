@@ -3,14 +3,28 @@ TMS设备管理模块
 监控安防设备健康状态、异常追踪、维护调度和备件管理
 """
 
+import hashlib
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from pathlib import Path
 import json
 from typing import Dict, List, Optional
-import matplotlib.pyplot as plt
-import seaborn as sns
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from modules.data_schema import DEVICE_LOG_SCHEMA, SCHEMA_VERSION, apply_schema, write_quarantine
+from modules.result_cache import VersionedResultCache
+from modules.device_management.device_log_store import DeviceLogStore, PARQUET_SUPPORT
+from modules.device_management.device_telemetry import DeviceTelemetry
+from modules.device_management.failure_model import DeviceFailureModel, FEATURE_COLUMNS, LOOKBACK_DAYS
+from modules.device_management.health_heatmap import build_heatmap_table, render_heatmap
+from modules.device_management.health_history import HealthHistory
+from modules.device_management.maintenance_scheduler import DEFAULT_CREWS, MaintenanceScheduler
+from modules.device_management.spare_parts_forecast import SparePartsForecaster
+
+# 健康评分用到的列（加载时只读取这些列）
+HEALTH_COLUMNS = ['timestamp', 'device_id', 'event_type', 'status', 'response_time_ms']
 
 
 class DeviceMonitor:
@@ -21,6 +35,9 @@ class DeviceMonitor:
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
+        # 列式存储（按月分区的Parquet），未安装pyarrow时回退到读取月度CSV
+        self.log_store = DeviceLogStore(data_dir=str(self.data_dir)) if PARQUET_SUPPORT else None
+        
         # 设备健康评分权重
         self.health_weights = {
             'uptime_ratio': 0.35,           # 在线时间占比
@@ -29,7 +46,7 @@ class DeviceMonitor:
             'maintenance_compliance': 0.20  # 维护合规性
         }
         
-        # 备件安全库存配置
+        # 备件安全库存下限（动态安全库存按消耗预测计算，不低于此值）
         self.spare_parts_safety_stock = {
             'door_controller': 5,
             'camera': 8,
@@ -37,24 +54,85 @@ class DeviceMonitor:
             'cable': 50,
             'power_supply': 6
         }
-    
-    def load_device_logs(self, days: int = 30) -> pd.DataFrame:
-        """加载设备状态日志"""
-        log_file = self.data_dir / f'device_logs_{datetime.now().strftime("%Y%m")}.csv'
         
-        if not log_file.exists():
-            print(f"设备日志文件不存在: {log_file}")
-            return pd.DataFrame()
+        # 备件消耗预测（由维护事件推算消耗，计算再订货点和建议订货量）
+        self.spare_parts_forecaster = SparePartsForecaster()
+        
+        # 实时遥测缓冲区（心跳/状态事件），及按设备缓存的实时健康评分
+        self.telemetry = DeviceTelemetry()
+        self._live_health: Dict[str, Dict] = {}
+        self._live_scored_at: Optional[datetime] = None
         
-        df = pd.read_csv(log_file)
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        # 故障预测模型（训练后才参与监控），概率不低于阈值的设备列入预测故障
+        self.failure_model = DeviceFailureModel(self.data_dir / 'models' / 'failure_model.npz')
+        self.failure_threshold = 0.5
+        
+        # 维修班组排班（班次时间为小时数，workdays为星期几，0=周一）
+        self.maintenance_crews = [dict(crew) for crew in DEFAULT_CREWS]
+        
+        # 监控报告缓存（按日志/库存文件版本失效，仪表盘并发轮询只计算一次）
+        self.report_cache = VersionedResultCache(ttl_seconds=300)
+        
+        # 每次全量监控的健康评分历史（按监控天数分开保存，不同统计窗口的评分不可比）；
+        # 只保存API报告（7天）和定时任务（30天）两种监控天数的历史
+        self.health_history_days = (7, 30)
+        self._health_histories: Dict[int, HealthHistory] = {}
+    
+    def load_device_logs(self, days: int = 30, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        加载最近N天的设备状态日志（跨月读取所有相关的月度文件）
         
-        # 筛选最近N天
+        Args:
+            days: 加载最近N天的数据
+            columns: 需要的列，默认加载全部列
+        
+        Returns:
+            按时间排序的DataFrame
+        """
         cutoff_date = datetime.now() - timedelta(days=days)
-        df = df[df['timestamp'] >= cutoff_date]
+        
+        if self.log_store is not None:
+            # 仅转换相关月份中新增或已变更的CSV，时间条件和列投影下推到Parquet读取
+            months = DeviceLogStore.months_since(cutoff_date, self.log_store.source_months())
+            self.log_store.ingest(months)
+            df = self.log_store.load(start=cutoff_date, columns=columns)
+        else:
+            df = self._load_csv_files(cutoff_date, columns)
+        
+        if df.empty:
+            print(f"未找到{days}天内的设备日志: {self.data_dir}")
         
         return df
     
+    def _load_csv_files(self, cutoff_date: datetime, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        读取相关月份的原始CSV文件并按表结构转换（无Parquet支持时使用）
+        
+        读取整行校验，保证不论请求哪些列，剔除的行都与Parquet入库时一致
+        """
+        all_data = []
+        months = sorted(p.stem[len('device_logs_'):] for p in self.data_dir.glob('device_logs_*.csv'))
+        
+        for month in DeviceLogStore.months_since(cutoff_date, months):
+            log_file = self.data_dir / f'device_logs_{month}.csv'
+            try:
+                # 按表结构转换类型、统一状态/事件取值（如 故障->fault、维护->maintenance），不合规的行隔离
+                df, quarantined = apply_schema(pd.read_csv(log_file), DEVICE_LOG_SCHEMA)
+                write_quarantine(quarantined, self.data_dir / 'quarantine' / log_file.name)
+                df = df[df['timestamp'] >= cutoff_date]
+                all_data.append(df[columns] if columns is not None else df)
+            except Exception as e:
+                print(f"加载设备日志失败 {log_file}: {e}")
+        
+        if not all_data:
+            return pd.DataFrame()
+        
+        # 与Parquet读取一致按时间排序
+        df = pd.concat(all_data, ignore_index=True)
+        if 'timestamp' in df.columns:
+            df = df.sort_values('timestamp', kind='stable', ignore_index=True)
+        return df
+    
     def calculate_device_health(self, device_id: str, df: pd.DataFrame) -> Dict:
         """
         计算单个设备的健康评分
@@ -67,16 +145,15 @@ class DeviceMonitor:
         if device_logs.empty:
             return {'error': '无设备数据', 'device_id': device_id}
         
-        # 1. 在线时间占比
+        # 1. 在线时间占比（时间跨度包含最后一条日志代表的5分钟，比例不超过1）
         try:
-            total_time = (device_logs['timestamp'].max() - device_logs['timestamp'].min()).total_seconds()
-            total_time = max(total_time, 1)  # 避免除以0
+            total_time = (device_logs['timestamp'].max() - device_logs['timestamp'].min()).total_seconds() + 300
         except:
-            total_time = 1
+            total_time = 300
         
         online_logs = device_logs[device_logs['status'] == 'online']
         uptime_seconds = len(online_logs) * 300  # 假设每条日志代表5分钟
-        uptime_ratio = uptime_seconds / total_time if total_time > 0 else 0
+        uptime_ratio = min(max(uptime_seconds / total_time, 0), 1) if total_time > 0 else 0
         
         # 2. 错误率
         total_logs = len(device_logs)
@@ -84,10 +161,11 @@ class DeviceMonitor:
         error_rate = error_logs / total_logs if total_logs > 0 else 0
         
         # 3. 平均响应时间
-        avg_response_time = device_logs.get('response_time_ms', pd.Series([100])).mean()
-        # 处理None和NaN值
-        if avg_response_time is None or (isinstance(avg_response_time, float) and np.isnan(avg_response_time)):
+        avg_response_time = device_logs.get('response_time_ms', pd.Series([100])).astype('float64').mean()
+        # 处理None和NaN值（response_time_ms为float32列，均值统一按float64计算）
+        if avg_response_time is None or pd.isna(avg_response_time):
             avg_response_time = 100
+        avg_response_time = float(avg_response_time)
         response_score = 1 - min(avg_response_time / 1000, 1)  # 归一化到0-1，1000ms为满分0
         
         # 4. 维护合规性（最近维护距离今天的天数）
@@ -151,8 +229,8 @@ class DeviceMonitor:
         
         # 响应延迟增加趋势
         if 'response_time_ms' in device_logs.columns:
-            recent_avg = device_logs.tail(100)['response_time_ms'].mean()
-            historical_avg = device_logs.head(100)['response_time_ms'].mean()
+            recent_avg = device_logs.tail(100)['response_time_ms'].astype('float64').mean()
+            historical_avg = device_logs.head(100)['response_time_ms'].astype('float64').mean()
             # 添加None和NaN检查
             if (recent_avg is not None and historical_avg is not None and 
                 not np.isnan(recent_avg) and not np.isnan(historical_avg) and
@@ -161,6 +239,158 @@ class DeviceMonitor:
         
         return patterns
     
+    def calculate_fleet_health(self, df: pd.DataFrame, sample_seconds: float = 300,
+                               extra_maintenance: Optional[Dict[str, datetime]] = None) -> List[Dict]:
+        """
+        一次性计算全部设备的健康评分（结果与逐个调用calculate_device_health一致）
+        
+        先按设备稳定排序使每个设备的日志连续且保持原始顺序，各项指标用bincount/reduceat
+        按设备分组计算，每列只扫描一遍，不再按设备反复过滤整张表
+        
+        Args:
+            df: 设备日志
+            sample_seconds: 每条日志代表的时长（秒），CSV日志为5分钟
+            extra_maintenance: 日志之外已知的最近维护时间 {设备ID: 时间}（如已滑出实时缓冲区的维护记录）
+        
+        Returns:
+            设备健康字典列表，按设备首次出现的顺序
+        """
+        if df.empty:
+            return []
+        
+        now = datetime.now()
+        device_codes, device_ids = pd.factorize(df['device_id'])
+        valid = device_codes >= 0
+        order = np.argsort(device_codes[valid], kind='stable')
+        rows = np.flatnonzero(valid)[order]
+        codes = device_codes[rows]
+        n_devices = len(device_ids)
+        
+        counts = np.bincount(codes, minlength=n_devices)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        position = np.arange(len(codes)) - starts[codes]  # 设备内的序号
+        
+        timestamps = df['timestamp'].to_numpy(dtype='datetime64[ns]')[rows].astype(np.int64)
+        status = df['status'].iloc[rows]
+        
+        # 1. 在线时间占比：时间跨度包含最后一条样本代表的时长，新设备或心跳稀疏时比例也不超过1
+        total_time = (np.maximum.reduceat(timestamps, starts) - np.minimum.reduceat(timestamps, starts)) / 1e9
+        total_time = total_time + sample_seconds
+        online = np.bincount(codes, weights=(status == 'online').to_numpy(), minlength=n_devices)
+        uptime_ratio = np.clip(online * sample_seconds / total_time, 0, 1)
+        
+        # 2. 错误率
+        errors = np.bincount(codes, weights=self._status_matches(status, 'error|fault'), minlength=n_devices)
+        error_rate = errors / counts
+        
+        # 3. 平均响应时间
+        if 'response_time_ms' in df.columns:
+            response = df['response_time_ms'].to_numpy(dtype='float64', na_value=np.nan)[rows]
+            has_response = ~np.isnan(response)
+            response_sum = np.bincount(codes[has_response], weights=response[has_response], minlength=n_devices)
+            response_count = np.bincount(codes[has_response], minlength=n_devices)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                avg_response_time = np.where(response_count > 0, response_sum / response_count, 100.0)
+        else:
+            avg_response_time = np.full(n_devices, 100.0)
+        response_score = 1 - np.minimum(avg_response_time / 1000, 1)
+        
+        # 4. 维护合规性
+        maintenance = (df['event_type'].iloc[rows] == 'maintenance').to_numpy()
+        last_maintenance = np.full(n_devices, np.iinfo(np.int64).min)
+        np.maximum.at(last_maintenance, codes[maintenance], timestamps[maintenance])
+        if extra_maintenance:
+            known = [pd.Timestamp(extra_maintenance[d]).value if d in extra_maintenance else np.iinfo(np.int64).min
+                     for d in device_ids]
+            last_maintenance = np.maximum(last_maintenance, np.array(known, dtype=np.int64))
+        has_maintenance = last_maintenance > np.iinfo(np.int64).min
+        days_since_maintenance = (np.datetime64(now, 'ns').astype(np.int64) - last_maintenance) // (86400 * 10**9)
+        maintenance_compliance = np.where(has_maintenance, np.maximum(0, 1 - days_since_maintenance / 90), 0)
+        
+        health_score = (
+            uptime_ratio * self.health_weights['uptime_ratio'] +
+            (1 - error_rate) * self.health_weights['error_rate'] +
+            response_score * self.health_weights['response_time'] +
+            maintenance_compliance * self.health_weights['maintenance_compliance']
+        ) * 100
+        health_score = np.where(np.isfinite(health_score), health_score, 50.0)
+        
+        anomaly_patterns = self._detect_fleet_anomaly_patterns(
+            df, rows, codes, counts, position, timestamps, status
+        )
+        
+        return [
+            {
+                'device_id': device_ids[i],
+                'health_score': round(float(health_score[i]), 2),
+                'uptime_ratio': round(float(uptime_ratio[i]), 3),
+                'error_rate': round(float(error_rate[i]), 3),
+                'avg_response_time_ms': round(float(avg_response_time[i]), 2),
+                'days_since_maintenance': int(days_since_maintenance[i]) if has_maintenance[i] else None,
+                'anomaly_patterns': anomaly_patterns[i],
+                'status': self._classify_health(float(health_score[i]))
+            }
+            for i in range(n_devices)
+        ]
+    
+    @staticmethod
+    def _status_matches(status: pd.Series, pattern: str) -> np.ndarray:
+        """状态正则匹配（分类列只对类别取值匹配一次，再按编码展开）"""
+        if isinstance(status.dtype, pd.CategoricalDtype):
+            matched = np.append(status.cat.categories.astype(str).str.contains(pattern, case=False), False)
+            return matched[status.cat.codes.to_numpy()]
+        return status.astype('string').str.contains(pattern, case=False, na=False).to_numpy(dtype=bool)
+    
+    def _detect_fleet_anomaly_patterns(self, df: pd.DataFrame, rows: np.ndarray, codes: np.ndarray,
+                                       counts: np.ndarray, position: np.ndarray, timestamps: np.ndarray,
+                                       status: pd.Series) -> List[List[str]]:
+        """按设备分组检测异常模式（规则与_detect_anomaly_patterns一致）"""
+        n_devices = len(counts)
+        patterns = [[] for _ in range(n_devices)]
+        
+        # 频繁离线/在线切换：设备首条日志、取值变化或状态为空都计为一次切换
+        status_codes = pd.factorize(status)[0]
+        changed = (position == 0) | (status_codes == -1)
+        changed[1:] |= status_codes[1:] != status_codes[:-1]
+        status_changes = np.bincount(codes, weights=changed, minlength=n_devices).astype(np.int64)
+        
+        # 错误率突增：设备×日期的错误数最大值
+        is_error = self._status_matches(status, 'error')
+        error_peak = np.zeros(n_devices, dtype=np.int64)
+        if is_error.any():
+            day_codes, days = pd.factorize(timestamps[is_error] // (86400 * 10**9))
+            daily = np.bincount(codes[is_error] * len(days) + day_codes)
+            keys = np.flatnonzero(daily)
+            np.maximum.at(error_peak, keys // len(days), daily[keys])
+        
+        # 响应延迟增加趋势：最近100条与最早100条的均值
+        trend = None
+        if 'response_time_ms' in df.columns:
+            response = df['response_time_ms'].to_numpy(dtype='float64', na_value=np.nan)[rows]
+            has_response = ~np.isnan(response)
+            
+            def window_mean(mask):
+                mask = mask & has_response
+                total = np.bincount(codes[mask], weights=response[mask], minlength=n_devices)
+                count = np.bincount(codes[mask], minlength=n_devices)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    return total / count
+            
+            historical_avg = window_mean(position < 100)
+            recent_avg = window_mean(position >= counts[codes] - 100)
+            with np.errstate(invalid='ignore'):
+                trend = (historical_avg > 0) & (recent_avg > historical_avg * 1.5)
+        
+        for i in np.flatnonzero(status_changes > 20):
+            patterns[i].append(f'频繁状态切换 ({status_changes[i]}次)')
+        for i in np.flatnonzero(error_peak > 10):
+            patterns[i].append(f'单日错误峰值 ({error_peak[i]}次)')
+        if trend is not None:
+            for i in np.flatnonzero(trend):
+                patterns[i].append(f'响应时间恶化 ({historical_avg[i]:.0f}ms → {recent_avg[i]:.0f}ms)')
+        
+        return patterns
+    
     def _classify_health(self, score: float) -> str:
         """根据健康评分分类设备状态"""
         # 处理None或NaN值
@@ -179,49 +409,119 @@ class DeviceMonitor:
             return 'critical'
     
     def check_spare_parts_inventory(self) -> Dict:
-        """检查备件库存"""
+        """
+        检查备件库存：按近期维护消耗预测需求，库存位置（现有+在途）不高于再订货点的备件
+        列入低库存并给出建议订货量
+        """
         inventory_file = self.data_dir / 'spare_parts_inventory.csv'
         
         if not inventory_file.exists():
             return {'error': '库存文件不存在'}
         
         inventory = pd.read_csv(inventory_file)
-        low_stock_items = []
-        
-        for _, row in inventory.iterrows():
-            part_type = row['part_type']
-            current_stock = row['quantity']
-            safety_stock = self.spare_parts_safety_stock.get(part_type, 5)
-            
-            if current_stock < safety_stock:
-                low_stock_items.append({
-                    'part_type': part_type,
-                    'current_stock': int(current_stock),
-                    'safety_stock': safety_stock,
-                    'shortage': safety_stock - current_stock,
-                    'alert_level': 'critical' if current_stock < safety_stock * 0.5 else 'warning'
-                })
+        forecaster = self.spare_parts_forecaster
+        demand = self.forecast_spare_parts_demand()
+        plan = forecaster.reorder_plan(inventory, demand, self.spare_parts_safety_stock)
+        
+        low_stock = plan[plan['alert_level'].notna()]
+        low_stock_items = [
+            {
+                'part_type': row['part_type'],
+                **({'site': row['site']} if 'site' in plan.columns else {}),
+                'current_stock': int(row['quantity']),
+                'safety_stock': int(row['safety_stock']),
+                'reorder_point': int(row['reorder_point']),
+                'shortage': max(int(row['reorder_point'] - row['quantity']), 0),
+                'order_quantity': int(row['order_quantity']),
+                'daily_demand': round(float(row['daily_demand']), 3),
+                'lead_time_days': float(row['lead_time_days']),
+                'days_of_cover': round(float(row['days_of_cover']), 1) if np.isfinite(row['days_of_cover']) else None,
+                'alert_level': row['alert_level']
+            }
+            for row in low_stock.to_dict('records')
+        ]
         
         return {
             'total_part_types': len(inventory),
             'low_stock_items': low_stock_items,
             'low_stock_count': len(low_stock_items),
+            'reorder_count': int((plan['order_quantity'] > 0).sum()),
+            'service_level': forecaster.service_level,
+            'demand_forecast': [
+                {
+                    'part_type': row['part_type'],
+                    'site': row['site'],
+                    'consumed': int(row['consumed']),
+                    'daily_demand': round(float(row['daily_demand']), 3),
+                    'forecast_30d': round(float(row['daily_demand']) * 30, 1)
+                }
+                for row in demand.to_dict('records')
+            ],
             'timestamp': datetime.now().isoformat()
         }
     
+    def forecast_spare_parts_demand(self) -> pd.DataFrame:
+        """各备件类型/区域的日需求预测（按日志版本缓存，实时状态轮询不必每次重新读取历史日志）"""
+        history_days = self.spare_parts_forecaster.history_days
+        
+        def compute():
+            df = self.load_device_logs(history_days, columns=['timestamp', 'device_id', 'event_type'])
+            return self.spare_parts_forecaster.forecast(df)
+        
+        return self.report_cache.get(('spare_parts_demand', history_days), self.data_version(history_days), compute)
+    
+    def load_spare_parts_stock(self) -> Optional[Dict[str, int]]:
+        """当前备件库存 {备件类型: 数量}，库存文件不存在时返回None（排程不限制备件）"""
+        inventory_file = self.data_dir / 'spare_parts_inventory.csv'
+        if not inventory_file.exists():
+            return None
+        
+        inventory = pd.read_csv(inventory_file)
+        return inventory.groupby('part_type')['quantity'].sum().astype(int).to_dict()
+    
+    def plan_maintenance(self, days_ahead: int = 5, history_days: int = 7,
+                         start_date: Optional[datetime] = None) -> Dict:
+        """
+        根据维护建议生成多日班组排程
+        
+        工单来自监控报告的维护建议（优先级、预计工时），楼宇和坐标取自device_locations.csv
+        （没有时楼宇取设备ID前缀），高优先级维修工单按备件库存限制
+        
+        Args:
+            days_ahead: 排程天数
+            history_days: 监控报告使用的日志天数
+            start_date: 首个排程日，默认为明天
+        """
+        report = self.get_monitor_report(history_days)
+        if report.get('status') != 'success':
+            return {'status': 'error', 'message': report.get('message', '无法生成监控报告')}
+        
+        scheduler = MaintenanceScheduler(crews=self.maintenance_crews)
+        plan = scheduler.schedule(
+            report['maintenance_recommendations'],
+            days=days_ahead,
+            start_date=start_date,
+            spare_parts_stock=self.load_spare_parts_stock(),
+            locations=scheduler.load_locations(self.data_dir / 'device_locations.csv')
+        )
+        
+        return {'status': 'success', **plan}
+    
     def generate_maintenance_recommendations(self, device_health: List[Dict]) -> List[Dict]:
         """生成维护建议"""
         recommendations = []
         
-        # 优先级排序：健康评分低、有异常模式的设备
+        # 优先级排序：健康评分低、有异常模式或预测即将故障的设备
         # 添加None检查
         poor_devices = [d for d in device_health 
-                       if d.get('health_score') is not None and d.get('health_score', 100) < 70]
+                       if (d.get('health_score') is not None and d.get('health_score', 100) < 70)
+                       or self._predicted_failure(d)]
         poor_devices.sort(key=lambda x: x.get('health_score', 0))
         
         for device in poor_devices:
             health_score = device.get('health_score', 0)
-            priority = 'high' if health_score is not None and health_score < 50 else 'medium'
+            priority = 'high' if ((health_score is not None and health_score < 50)
+                                  or self._predicted_failure(device)) else 'medium'
             
             # 生成具体维护建议
             actions = []
@@ -236,6 +536,9 @@ class DeviceMonitor:
                 actions.append('执行定期维护保养')
             if device.get('anomaly_patterns'):
                 actions.append(f'调查异常模式: {", ".join(device["anomaly_patterns"][:2])}')
+            if self._predicted_failure(device):
+                actions.append(f'预测{self.failure_model.horizon_days}天内故障概率'
+                               f'{device["failure_probability"]:.0%}，安排预防性检修')
             
             recommendations.append({
                 'device_id': device['device_id'],
@@ -247,50 +550,222 @@ class DeviceMonitor:
         
         return recommendations
     
-    def generate_health_heatmap(self, device_health: List[Dict], by_area: bool = True) -> str:
-        """生成设备健康热力图"""
+    def _predicted_failure(self, device: Dict) -> bool:
+        probability = device.get('failure_probability')
+        return probability is not None and probability >= self.failure_threshold
+    
+    def train_failure_model(self, history_days: int = 180, horizon_days: int = 14) -> Dict:
+        """
+        用最近history_days天的设备日志训练故障预测模型并保存
+        
+        Returns:
+            训练指标（样本数、故障比例、验证集AUC、主要特征）
+        """
+        df = self.load_device_logs(history_days, columns=FEATURE_COLUMNS)
+        if df.empty:
+            raise ValueError("无设备日志数据，无法训练故障预测模型")
+        return self.failure_model.train(df, horizon_days=horizon_days)
+    
+    def generate_health_heatmap(self, device_health: List[Dict], by_area: bool = True) -> Optional[str]:
+        """生成设备健康热力图（同一数据的图片只渲染一次）"""
         if not device_health:
             return None
         
-        df = pd.DataFrame(device_health)
+        return render_heatmap(build_heatmap_table(device_health, by_area), self.output_dir, by_area)
+    
+    def get_health_heatmap(self, days: int = 30, by_area: bool = True) -> pd.DataFrame:
+        """
+        热力图透视表（按数据版本缓存，不渲染图片，供仪表盘导出JSON/Arrow后交互式绘制）
+        
+        Raises:
+            ValueError: 没有设备日志数据
+        """
+        def compute():
+            report = self.get_monitor_report(days)
+            if report.get('status') != 'success':
+                raise ValueError(report.get('message', '无法生成监控报告'))
+            return build_heatmap_table(report['device_health'], by_area)
         
-        # 假设设备ID包含区域信息（如：AREA1_DOOR001）
-        if by_area:
-            df['area'] = df['device_id'].str.split('_').str[0]
-            df['device_type'] = df['device_id'].str.split('_').str[1].str[:4]  # 提取设备类型前4个字符
-            
-            pivot_table = df.pivot_table(
-                values='health_score',
-                index='area',
-                columns='device_type',
-                aggfunc='mean'
-            )
+        return self.report_cache.get(('health_heatmap', days, by_area), self.data_version(days), compute)
+    
+    def get_health_heatmap_image(self, days: int = 30, by_area: bool = True) -> Optional[str]:
+        """热力图PNG路径（只在请求时渲染，并发请求只渲染一次）"""
+        key = ('health_heatmap_image', days, by_area)
+        
+        def compute():
+            return render_heatmap(self.get_health_heatmap(days, by_area), self.output_dir, by_area)
+        
+        path = self.report_cache.get(key, self.data_version(days), compute)
+        if path is not None and not Path(path).exists():
+            # 图片文件被清理后重新渲染
+            self.report_cache.invalidate(key)
+            path = self.report_cache.get(key, self.data_version(days), compute)
+        return path
+    
+    def live_device_health(self, full_rescore_seconds: int = 3600) -> List[Dict]:
+        """
+        根据实时遥测缓冲区计算设备健康评分（增量）
+        
+        只重算上次评分后收到新样本的设备；维护天数、失联判断随时间变化，
+        超过full_rescore_seconds后全部设备重算一次
+        
+        Returns:
+            设备健康字典列表，附加last_seen（最近样本时间）和stale（是否失联）
+        """
+        now = datetime.now()
+        telemetry = self.telemetry
+        
+        if self._live_scored_at is None or (now - self._live_scored_at).total_seconds() > full_rescore_seconds:
+            telemetry.take_dirty()
+            changed = list(telemetry.device_ids)
+            self._live_scored_at = now
         else:
-            # 按设备类型分组
-            df['device_type'] = df['device_id'].str.extract(r'(DOOR|CAM|SENSOR)')[0]
-            pivot_table = df.groupby('device_type')['health_score'].mean().to_frame()
-        
-        # 绘制热力图
-        plt.figure(figsize=(12, 8))
-        sns.heatmap(pivot_table, annot=True, fmt='.1f', cmap='RdYlGn', 
-                   vmin=0, vmax=100, cbar_kws={'label': '健康评分'})
-        plt.title('设备健康状态热力图', fontsize=14, fontweight='bold')
-        plt.xlabel('设备类型')
-        plt.ylabel('区域' if by_area else '设备类型')
-        plt.tight_layout()
-        
-        heatmap_path = self.output_dir / f'device_health_heatmap_{datetime.now().strftime("%Y%m%d")}.png'
-        plt.savefig(heatmap_path, dpi=150, bbox_inches='tight')
-        plt.close()
-        
-        return str(heatmap_path)
-    
-    def monitor_all_devices(self, days: int = 30) -> Dict:
-        """执行完整的设备监控流程"""
+            changed = telemetry.take_dirty()
+        
+        if changed:
+            df = telemetry.frame(changed)
+            for health in self.calculate_fleet_health(df, sample_seconds=telemetry.sample_seconds,
+                                                      extra_maintenance=telemetry.last_maintenance(changed)):
+                self._live_health[health['device_id']] = health
+        
+        device_health = []
+        for device_id, health in self._live_health.items():
+            last_seen = telemetry.last_seen(device_id)
+            device_health.append({
+                **health,
+                'last_seen': last_seen.isoformat() if last_seen else None,
+                'stale': telemetry.is_stale(device_id, now)
+            })
+        
+        return device_health
+    
+    def monitor_live_devices(self, batch_report: Optional[Dict] = None) -> Dict:
+        """
+        基于实时遥测的设备状态报告（与monitor_all_devices结构相同，不生成热力图和报告文件）
+        
+        Args:
+            batch_report: 批处理监控报告；提供时按设备合并，有遥测的设备用实时评分覆盖，
+                          只出现在日志中的设备保留批处理评分，备件状态沿用该报告
+        """
+        device_health = self.live_device_health()
+        source = 'telemetry'
+        
+        if batch_report is None:
+            spare_parts = self.check_spare_parts_inventory()
+        else:
+            live_ids = {d['device_id'] for d in device_health}
+            device_health = [d for d in batch_report['device_health'] if d['device_id'] not in live_ids] + device_health
+            spare_parts = batch_report['spare_parts_status']
+            source = 'telemetry+logs'
+        
+        maintenance_recs = self.generate_maintenance_recommendations(device_health)
+        
+        avg_health = float(np.mean([d['health_score'] for d in device_health])) if device_health else 0.0
+        critical_devices = [d for d in device_health if d['status'] == 'critical']
+        poor_devices = [d for d in device_health if d['status'] in ['poor', 'critical']]
+        
+        return {
+            'status': 'success',
+            'source': source,
+            'monitor_timestamp': datetime.now().isoformat(),
+            'samples_received': self.telemetry.samples_received,
+            'summary': {
+                'total_devices': len(device_health),
+                'avg_health_score': round(avg_health, 2),
+                'critical_devices': len(critical_devices),
+                'poor_devices': len(poor_devices),
+                'stale_devices': sum(1 for d in device_health if d.get('stale')),
+                'devices_need_maintenance': len(maintenance_recs)
+            },
+            'device_health': device_health,
+            'spare_parts_status': spare_parts,
+            'maintenance_recommendations': maintenance_recs,
+            'heatmap_path': None,
+            'alerts': self._generate_alerts(device_health, spare_parts)
+        }
+    
+    def data_version(self, days: int = 30) -> tuple:
+        """
+        监控报告的输入数据版本：相关月度日志、备件库存和故障预测模型文件的修改时间/大小、
+        表结构版本、评分参数和日期
+        
+        日期计入版本，使维护天数和报告文件名随日期更新
+        """
+        # 备件需求预测读取的历史日志通常比监控天数更长
+        cutoff_date = datetime.now() - timedelta(days=max(days, self.spare_parts_forecaster.history_days))
+        months = sorted(p.stem[len('device_logs_'):] for p in self.data_dir.glob('device_logs_*.csv'))
+        files = [self.data_dir / f'device_logs_{m}.csv' for m in DeviceLogStore.months_since(cutoff_date, months)]
+        files.append(self.data_dir / 'spare_parts_inventory.csv')
+        files.append(self.failure_model.path)
+        
+        file_versions = []
+        for path in files:
+            try:
+                stat = path.stat()
+                file_versions.append((path.name, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                file_versions.append((path.name, None, None))
+        
+        return (
+            tuple(file_versions),
+            SCHEMA_VERSION,
+            tuple(sorted(self.health_weights.items())),
+            tuple(sorted(self.spare_parts_safety_stock.items())),
+            datetime.now().strftime('%Y-%m-%d')
+        )
+    
+    def get_monitor_report(self, days: int = 30, max_age: Optional[float] = None) -> Dict:
+        """
+        获取监控报告（缓存）：输入数据版本未变且未超过有效期时直接返回上次结果，
+        并发请求共享同一次计算
+        
+        Args:
+            days: 监控天数
+            max_age: 结果有效期（秒），默认使用report_cache的有效期
+        
+        Returns:
+            monitor_all_devices的报告（多个请求共享，不应修改）
+        """
+        return self.report_cache.get(('monitor_all_devices', days), self.data_version(days),
+                                     lambda: self.monitor_all_devices(days), ttl_seconds=max_age)
+    
+    def health_history(self, days: int = 30) -> HealthHistory:
+        """
+        监控天数为days时的健康评分历史
+        
+        Raises:
+            ValueError: 不保存该监控天数的历史（只保存health_history_days中的天数）
+        """
+        if days not in self.health_history_days:
+            raise ValueError(f"只保存监控天数为{'/'.join(map(str, self.health_history_days))}的评分历史: {days}")
+        
+        history = self._health_histories.get(days)
+        if history is None:
+            history = self._health_histories.setdefault(
+                days, HealthHistory(str(self.output_dir / 'health_history' / f'days_{days}')))
+        return history
+    
+    def monitor_all_devices(self, days: int = 30, with_heatmap: bool = False) -> Dict:
+        """
+        执行完整的设备监控流程
+        
+        Args:
+            days: 监控天数
+            with_heatmap: 是否同时渲染热力图PNG（API按需通过get_health_heatmap_image获取）
+        """
         print(f"开始监控设备健康状态（最近{days}天）...")
         
-        # 加载设备日志
-        df = self.load_device_logs(days)
+        # 加载设备日志（只读取需要的列）；有故障预测模型时多读取特征回看窗口内的日志
+        self.failure_model.load()
+        failure_probability = None
+        if self.failure_model.is_trained:
+            columns = list(dict.fromkeys(HEALTH_COLUMNS + FEATURE_COLUMNS))
+            df = self.load_device_logs(max(days, LOOKBACK_DAYS), columns=columns)
+            if not df.empty:
+                failure_probability = self.failure_model.score_devices(df)
+                df = df[df['timestamp'] >= datetime.now() - timedelta(days=days)]
+        else:
+            df = self.load_device_logs(days, columns=HEALTH_COLUMNS)
         
         if df.empty:
             return {'status': 'error', 'message': '无设备日志数据'}
@@ -299,12 +774,19 @@ class DeviceMonitor:
         device_ids = df['device_id'].unique()
         print(f"发现 {len(device_ids)} 个设备")
         
-        # 计算每个设备的健康状态
-        device_health = []
-        for device_id in device_ids:
-            health = self.calculate_device_health(device_id, df)
-            if 'error' not in health:
-                device_health.append(health)
+        # 全部设备一次性计算健康状态
+        device_health = self.calculate_fleet_health(df)
+        if failure_probability is not None:
+            for health in device_health:
+                probability = failure_probability.get(health['device_id'])
+                health['failure_probability'] = round(probability, 3) if probability is not None else None
+        
+        # 追加到评分历史并检测评分骤降：同一输入数据版本（含日期）只追加一次
+        score_drops = []
+        if days in self.health_history_days:
+            version = hashlib.sha1(repr(self.data_version(days)).encode('utf-8')).hexdigest()
+            score_drops = self.health_history(days).append(
+                {d['device_id']: d['health_score'] for d in device_health}, version=version)
         
         # 检查备件库存
         spare_parts = self.check_spare_parts_inventory()
@@ -312,8 +794,8 @@ class DeviceMonitor:
         # 生成维护建议
         maintenance_recs = self.generate_maintenance_recommendations(device_health)
         
-        # 生成热力图
-        heatmap_path = self.generate_health_heatmap(device_health)
+        # 生成热力图（仅在需要时渲染）
+        heatmap_path = self.generate_health_heatmap(device_health) if with_heatmap else None
         
         # 统计摘要
         avg_health = np.mean([d['health_score'] for d in device_health])
@@ -329,13 +811,16 @@ class DeviceMonitor:
                 'avg_health_score': round(avg_health, 2),
                 'critical_devices': len(critical_devices),
                 'poor_devices': len(poor_devices),
+                'predicted_failures': sum(1 for d in device_health if self._predicted_failure(d)),
+                'health_score_drops': len(score_drops),
                 'devices_need_maintenance': len(maintenance_recs)
             },
             'device_health': device_health,
+            'health_score_drops': score_drops,
             'spare_parts_status': spare_parts,
             'maintenance_recommendations': maintenance_recs,
             'heatmap_path': heatmap_path,
-            'alerts': self._generate_alerts(device_health, spare_parts)
+            'alerts': self._generate_alerts(device_health, spare_parts, score_drops)
         }
         
         # 保存报告
@@ -352,7 +837,8 @@ class DeviceMonitor:
         
         return report
     
-    def _generate_alerts(self, device_health: List[Dict], spare_parts: Dict) -> List[Dict]:
+    def _generate_alerts(self, device_health: List[Dict], spare_parts: Dict,
+                         score_drops: Optional[List[Dict]] = None) -> List[Dict]:
         """生成警报"""
         alerts = []
         
@@ -366,6 +852,25 @@ class DeviceMonitor:
                 'devices': [d['device_id'] for d in critical_devices]
             })
         
+        # 预测故障警报
+        predicted = [d for d in device_health if self._predicted_failure(d)]
+        if predicted:
+            alerts.append({
+                'level': 'high',
+                'type': 'predicted_device_failure',
+                'message': f'{len(predicted)}个设备预测{self.failure_model.horizon_days}天内可能故障',
+                'devices': [d['device_id'] for d in sorted(predicted, key=lambda d: -d['failure_probability'])]
+            })
+        
+        # 健康评分骤降警报（与历史评分相比持续下降）
+        if score_drops:
+            alerts.append({
+                'level': 'medium',
+                'type': 'health_score_drop',
+                'message': f'{len(score_drops)}个设备健康评分较历史明显下降',
+                'devices': [d['device_id'] for d in score_drops]
+            })
+        
         # 备件库存警报
         if spare_parts.get('low_stock_items'):
             critical_parts = [p for p in spare_parts['low_stock_items'] if p['alert_level'] == 'critical']
@@ -376,6 +881,19 @@ class DeviceMonitor:
                     'message': f'{len(critical_parts)}种备件库存严重不足',
                     'parts': [p['part_type'] for p in critical_parts]
                 })
+            
+            # 需要补货的备件（附建议订货量）
+            reorder_parts = [p for p in spare_parts['low_stock_items']
+                             if p['alert_level'] == 'warning' and p.get('order_quantity')]
+            if reorder_parts:
+                alerts.append({
+                    'level': 'medium',
+                    'type': 'spare_parts_reorder',
+                    'message': f'{len(reorder_parts)}种备件已低于再订货点，需要补货',
+                    'parts': [p['part_type'] for p in reorder_parts],
+                    'orders': [{k: p[k] for k in ('part_type', 'site', 'order_quantity') if k in p}
+                               for p in reorder_parts]
+                })
         
         return alerts
 
@@ -388,11 +906,37 @@ if __name__ == "__main__":
     parser.add_argument('--days', type=int, default=30, help='监控天数')
     parser.add_argument('--data-dir', type=str, default='./data/devices', help='数据目录')
     parser.add_argument('--output-dir', type=str, default='./data/reports', help='输出目录')
+    parser.add_argument('--train-failure-model', action='store_true', help='用历史日志训练故障预测模型')
+    parser.add_argument('--history-days', type=int, default=180, help='训练使用的历史天数')
+    parser.add_argument('--horizon', type=int, default=14, help='预测未来N天内的故障')
+    parser.add_argument('--schedule', type=int, default=None, metavar='N', help='生成未来N天的维护排程')
     
     args = parser.parse_args()
     
     monitor = DeviceMonitor(data_dir=args.data_dir, output_dir=args.output_dir)
-    report = monitor.monitor_all_devices(days=args.days)
+    
+    if args.train_failure_model:
+        metrics = monitor.train_failure_model(history_days=args.history_days, horizon_days=args.horizon)
+        print(f"故障预测模型已保存: {monitor.failure_model.path}")
+        print(f"样本数: {metrics['samples']}，故障比例: {metrics['positive_rate']:.1%}，"
+              f"验证集AUC: {metrics.get('validation_auc')}")
+        for item in metrics['top_features']:
+            print(f"  - {item['feature']}: {item['coefficient']:+.3f}")
+        raise SystemExit(0)
+    
+    if args.schedule:
+        plan = monitor.plan_maintenance(days_ahead=args.schedule, history_days=args.days)
+        if plan['status'] != 'success':
+            print(plan['message'])
+            raise SystemExit(1)
+        print(f"排程: {plan['summary']['scheduled']}/{plan['summary']['total_orders']}个工单，"
+              f"路程{plan['summary']['travel_hours']}小时，用时{plan['summary']['solve_seconds']}秒")
+        for shift in plan['schedule']:
+            print(f"  {shift['date']} {shift['crew_id']}: " +
+                  ", ".join(f"{t['start']} {t['device_id']}" for t in shift['tasks']))
+        raise SystemExit(0)
+    
+    report = monitor.monitor_all_devices(days=args.days, with_heatmap=True)
     
     print("\n=== 监控摘要 ===")
     print(f"总设备数: {report['summary']['total_devices']}")
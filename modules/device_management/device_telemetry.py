@@ -0,0 +1,270 @@
+"""
+设备实时遥测模块
+接收设备心跳和状态事件，每个设备只保留最近N条样本：所有设备的样本存放在
+(设备数 × 容量) 的定长NumPy环形缓冲区中，每个设备只有一个__slots__状态对象记录
+所在行、写入位置和样本数；有新样本的设备标记为待评分，健康评分只对这些设备增量重算
+"""
+
+import asyncio
+import json
+import threading
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from modules.data_schema import DEVICE_LOG_SCHEMA
+
+# 状态/事件的标准取值，缓冲区中存为int8编码（-1表示未知）
+STATUS_CODES = ['online', 'warning', 'fault', 'offline']
+EVENT_CODES = ['normal', 'reboot', 'error', 'maintenance', 'config_update']
+
+# 心跳事件未携带状态时视为在线、正常运行
+DEFAULT_STATUS = 'online'
+DEFAULT_EVENT = 'normal'
+
+_STATUS_INDEX = {value: i for i, value in enumerate(STATUS_CODES)}
+_EVENT_INDEX = {value: i for i, value in enumerate(EVENT_CODES)}
+_MAINTENANCE_CODE = _EVENT_INDEX['maintenance']
+
+
+def _to_code(value: Optional[str], default: str, index: Dict[str, int], value_map: Dict[str, str],
+             field: str) -> int:
+    """状态/事件取值 -> 编码（同时接受CSV日志中的中文取值）"""
+    value = default if value is None else value_map.get(str(value).strip(), str(value).strip())
+    if value not in index:
+        raise ValueError(f"不支持的{field}: {value}，可选: {', '.join(index)}")
+    return index[value]
+
+
+def _event_time(ts) -> datetime:
+    """事件时间 -> 本地时间（无时区），与CSV日志的时间口径一致"""
+    if ts is None:
+        return datetime.now()
+    if isinstance(ts, (int, float)):
+        return datetime.fromtimestamp(float(ts))
+    dt = datetime.fromisoformat(str(ts))
+    return dt.astimezone().replace(tzinfo=None) if dt.tzinfo is not None else dt
+
+
+class DeviceState:
+    """单个设备的缓冲区状态"""
+
+    __slots__ = ('row', 'head', 'size', 'last_seen', 'last_maintenance')
+
+    def __init__(self, row: int):
+        self.row = row                       # 在缓冲区矩阵中的行号
+        self.head = 0                        # 下一条样本的写入位置
+        self.size = 0                        # 已保存的样本数（不超过容量）
+        self.last_seen = 0                   # 最近一条样本的时间（纳秒）
+        self.last_maintenance: Optional[int] = None  # 最近维护时间（纳秒），样本滑出缓冲区后仍保留
+
+
+class DeviceTelemetry:
+    """设备遥测环形缓冲区"""
+
+    def __init__(self, capacity: int = 288, sample_seconds: float = 300, offline_after: float = 900):
+        """
+        Args:
+            capacity: 每个设备保留的样本数（默认288条，5分钟心跳即最近24小时）
+            sample_seconds: 心跳间隔（秒），即每条样本代表的在线时长
+            offline_after: 超过多少秒没有收到样本视为失联
+        """
+        self.capacity = capacity
+        self.sample_seconds = sample_seconds
+        self.offline_after = offline_after
+
+        self.devices: Dict[str, DeviceState] = {}
+        self.device_ids: List[str] = []
+
+        rows = 64
+        self.timestamps = np.zeros((rows, capacity), dtype=np.int64)
+        self.status = np.full((rows, capacity), -1, dtype=np.int8)
+        self.events = np.full((rows, capacity), -1, dtype=np.int8)
+        self.response = np.full((rows, capacity), np.nan, dtype=np.float32)
+
+        # 有新样本、健康评分需要重算的设备
+        self._dirty = set()
+        self.samples_received = 0
+
+        # 接收端（事件循环）和评分端（可能在线程池中）并发访问缓冲区
+        self._lock = threading.Lock()
+        self._transport = None
+
+    # ---------- 写入 ----------
+
+    def _grow(self):
+        """缓冲区行数翻倍"""
+        extra = len(self.timestamps)
+        self.timestamps = np.vstack([self.timestamps, np.zeros((extra, self.capacity), dtype=np.int64)])
+        self.status = np.vstack([self.status, np.full((extra, self.capacity), -1, dtype=np.int8)])
+        self.events = np.vstack([self.events, np.full((extra, self.capacity), -1, dtype=np.int8)])
+        self.response = np.vstack([self.response, np.full((extra, self.capacity), np.nan, dtype=np.float32)])
+
+    def _state(self, device_id: str) -> DeviceState:
+        state = self.devices.get(device_id)
+        if state is None:
+            if len(self.device_ids) == len(self.timestamps):
+                self._grow()
+            state = self.devices[device_id] = DeviceState(len(self.device_ids))
+            self.device_ids.append(device_id)
+        return state
+
+    def record(self, event: Dict):
+        """
+        写入一条心跳/状态事件
+
+        Args:
+            event: {'device_id', 'timestamp'(可选), 'status'(可选), 'event_type'(可选), 'response_time_ms'(可选)}
+
+        Raises:
+            ValueError: 缺少设备ID或取值不合法
+        """
+        device_id = event.get('device_id')
+        if not device_id:
+            raise ValueError("缺少device_id")
+
+        ts = np.datetime64(_event_time(event.get('timestamp')), 'ns').astype(np.int64)
+        status = _to_code(event.get('status'), DEFAULT_STATUS, _STATUS_INDEX,
+                          DEVICE_LOG_SCHEMA['status']['value_map'], '状态')
+        event_code = _to_code(event.get('event_type'), DEFAULT_EVENT, _EVENT_INDEX,
+                              DEVICE_LOG_SCHEMA['event_type']['value_map'], '事件类型')
+        response = event.get('response_time_ms')
+        response = np.nan if response is None else float(response)
+        if response < 0:
+            raise ValueError(f"response_time_ms不能为负数: {response}")
+
+        with self._lock:
+            state = self._state(str(device_id))
+            row, pos = state.row, state.head
+            self.timestamps[row, pos] = ts
+            self.status[row, pos] = status
+            self.events[row, pos] = event_code
+            self.response[row, pos] = response
+
+            state.head = (pos + 1) % self.capacity
+            state.size = min(state.size + 1, self.capacity)
+            state.last_seen = max(state.last_seen, ts)
+            if event_code == _MAINTENANCE_CODE:
+                state.last_maintenance = max(state.last_maintenance or ts, ts)
+
+            self._dirty.add(state.row)
+            self.samples_received += 1
+
+    def record_many(self, events: Iterable[Dict]) -> Tuple[int, List[str]]:
+        """
+        批量写入事件，不合法的事件跳过
+
+        Returns:
+            (写入条数, 错误信息列表)
+        """
+        accepted = 0
+        errors = []
+        for event in events:
+            try:
+                self.record(event)
+                accepted += 1
+            except (ValueError, TypeError, AttributeError) as e:
+                errors.append(f"{event.get('device_id') if isinstance(event, dict) else event}: {e}")
+        return accepted, errors
+
+    # ---------- 读取 ----------
+
+    def take_dirty(self) -> List[str]:
+        """取出并清空待评分设备"""
+        with self._lock:
+            rows = sorted(self._dirty)
+            self._dirty.clear()
+        return [self.device_ids[row] for row in rows]
+
+    def frame(self, device_ids: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        将缓冲区样本展开为与设备日志相同列的DataFrame（每个设备内按时间排序）
+
+        Args:
+            device_ids: 需要的设备，None表示全部
+        """
+        with self._lock:
+            wanted = dict.fromkeys(device_ids) if device_ids is not None else self.device_ids
+            states = [self.devices[d] for d in wanted if d in self.devices]
+            labels = [self.device_ids[s.row] for s in states]
+            rows = np.array([s.row for s in states], dtype=np.int64)
+            sizes = np.array([s.size for s in states], dtype=np.int64)
+            heads = np.array([s.head for s in states], dtype=np.int64)
+
+            # 每个设备最旧的样本位于 head - size（环形取模），逐设备展开为连续下标
+            owner = np.repeat(np.arange(len(states)), sizes)
+            offset = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+            cols = (heads[owner] - sizes[owner] + offset) % self.capacity
+            cell_rows = rows[owner]
+
+            timestamps = self.timestamps[cell_rows, cols]
+            status = self.status[cell_rows, cols]
+            events = self.events[cell_rows, cols]
+            response = self.response[cell_rows, cols]
+
+        # 乱序到达的样本按时间重排（设备内稳定排序）
+        order = np.lexsort((timestamps, owner))
+        owner, timestamps, status, events, response = (
+            owner[order], timestamps[order], status[order], events[order], response[order])
+
+        return pd.DataFrame({
+            'timestamp': timestamps.view('datetime64[ns]'),
+            'device_id': pd.Categorical.from_codes(owner, labels),
+            'event_type': pd.Categorical.from_codes(events, EVENT_CODES),
+            'status': pd.Categorical.from_codes(status, STATUS_CODES),
+            'response_time_ms': response,
+        })
+
+    def last_maintenance(self, device_ids: List[str]) -> Dict[str, datetime]:
+        """各设备最近维护时间（含已滑出缓冲区的维护记录）"""
+        return {
+            d: pd.Timestamp(self.devices[d].last_maintenance).to_pydatetime()
+            for d in device_ids
+            if d in self.devices and self.devices[d].last_maintenance is not None
+        }
+
+    def last_seen(self, device_id: str) -> Optional[datetime]:
+        state = self.devices.get(device_id)
+        return pd.Timestamp(state.last_seen).to_pydatetime() if state is not None else None
+
+    def is_stale(self, device_id: str, now: Optional[datetime] = None) -> bool:
+        """超过offline_after秒没有收到样本"""
+        last_seen = self.last_seen(device_id)
+        if last_seen is None:
+            return True
+        return ((now or datetime.now()) - last_seen).total_seconds() > self.offline_after
+
+    # ---------- 网络接收 ----------
+
+    async def start_udp_listener(self, host: str = '0.0.0.0', port: int = 9760):
+        """
+        启动UDP监听：每个数据报为一条或多条（按行分隔）JSON事件
+
+        心跳量大且允许偶尔丢包，使用UDP避免每条心跳一次HTTP请求
+        """
+        telemetry = self
+
+        class TelemetryProtocol(asyncio.DatagramProtocol):
+            def datagram_received(self, data: bytes, addr):
+                events = []
+                for line in data.decode('utf-8', errors='replace').splitlines():
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        events.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        print(f"遥测数据格式错误 {addr}: {line[:100]}")
+                _, errors = telemetry.record_many(events)
+                for error in errors:
+                    print(f"遥测事件无效 {addr}: {error}")
+
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(TelemetryProtocol, local_addr=(host, port))
+        print(f"设备遥测UDP监听已启动: {host}:{port}")
+
+    def stop(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
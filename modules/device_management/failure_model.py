@@ -0,0 +1,384 @@
+"""
+设备故障预测模块
+从设备日志为全部设备一次性提取滚动窗口特征（错误/重启次数、状态占比、温度和运行时长趋势、
+维护间隔等），用NumPy实现的L2正则逻辑回归（牛顿法）预测未来N天内出现故障状态的概率；
+模型参数和标准化参数保存为.npz，训练只需CPU
+"""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# 特征提取的回看窗口（天）
+LOOKBACK_DAYS = 30
+
+# 特征提取需要的日志列
+FEATURE_COLUMNS = ['timestamp', 'device_id', 'event_type', 'status', 'uptime_hours',
+                   'error_count', 'temperature', 'response_time_ms']
+
+FEATURE_NAMES = [
+    'errors_1d',              # 近1天错误事件数
+    'errors_7d',              # 近7天错误事件数
+    'errors_30d',             # 近30天错误事件数
+    'error_trend',            # 近7天与近30天日均错误数之差
+    'error_counter_7d',       # 近7天日志上报的错误计数之和
+    'reboots_7d',             # 近7天重启次数
+    'reboots_30d',            # 近30天重启次数
+    'fault_ratio_30d',        # 近30天故障状态占比
+    'offline_ratio_30d',      # 近30天离线状态占比
+    'warning_ratio_30d',      # 近30天警告状态占比
+    'temperature_mean_7d',    # 近7天平均温度
+    'temperature_max_7d',     # 近7天最高温度
+    'temperature_slope_30d',  # 近30天温度趋势（度/天）
+    'uptime_mean_7d',         # 近7天平均连续运行时长
+    'uptime_slope_30d',       # 近30天连续运行时长趋势（小时/天），频繁重启时下降
+    'response_ratio_7d_30d',  # 近7天与近30天平均响应时间之比
+    'days_since_maintenance', # 距最近维护天数（窗口内无维护时取窗口长度）
+    'log_count_30d',          # 近30天日志条数
+]
+
+# 视为"故障"的状态（预测目标）
+FAILURE_STATUS = 'fault'
+
+DAY_NS = 86400 * 10**9
+
+
+def _group_slope(codes: np.ndarray, x: np.ndarray, y: np.ndarray, n_groups: int) -> np.ndarray:
+    """按组的一元线性回归斜率（最小二乘），数据不足或x无变化的组为0"""
+    valid = ~np.isnan(y)
+    codes, x, y = codes[valid], x[valid], y[valid]
+
+    n = np.bincount(codes, minlength=n_groups).astype(float)
+    sx = np.bincount(codes, weights=x, minlength=n_groups)
+    sy = np.bincount(codes, weights=y, minlength=n_groups)
+    sxx = np.bincount(codes, weights=x * x, minlength=n_groups)
+    sxy = np.bincount(codes, weights=x * y, minlength=n_groups)
+
+    denominator = n * sxx - sx * sx
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = (n * sxy - sx * sy) / denominator
+    return np.where((n >= 3) & (denominator > 1e-9), slope, 0.0)
+
+
+def _group_mean(codes: np.ndarray, values: np.ndarray, mask: np.ndarray, n_groups: int,
+                default: np.ndarray) -> np.ndarray:
+    """按组均值（忽略空值），无数据的组取default"""
+    mask = mask & ~np.isnan(values)
+    total = np.bincount(codes[mask], weights=values[mask], minlength=n_groups)
+    count = np.bincount(codes[mask], minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, default)
+
+
+def _column(df: pd.DataFrame, name: str) -> np.ndarray:
+    if name not in df.columns:
+        return np.full(len(df), np.nan)
+    return df[name].to_numpy(dtype='float64', na_value=np.nan)
+
+
+def extract_features(df: pd.DataFrame, as_of: datetime,
+                     lookback_days: int = LOOKBACK_DAYS) -> Tuple[List[str], np.ndarray]:
+    """
+    提取截至as_of的设备特征（全部设备一次向量化计算）
+
+    Args:
+        df: 设备日志（已按DEVICE_LOG_SCHEMA转换）
+        as_of: 特征截止时间，只使用 [as_of - lookback_days, as_of) 的日志
+        lookback_days: 回看窗口（天）
+
+    Returns:
+        (设备ID列表, 特征矩阵 (设备数, len(FEATURE_NAMES)))
+    """
+    timestamps = df['timestamp'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    as_of_ns = np.datetime64(as_of, 'ns').astype(np.int64)
+    in_window = (timestamps < as_of_ns) & (timestamps >= as_of_ns - lookback_days * DAY_NS)
+
+    window = df[in_window]
+    if window.empty:
+        return [], np.zeros((0, len(FEATURE_NAMES)))
+
+    device_codes, device_ids = pd.factorize(window['device_id'])
+    valid = device_codes >= 0
+    codes = device_codes[valid]
+    n = len(device_ids)
+
+    age_days = (as_of_ns - timestamps[in_window][valid]) / DAY_NS
+    event_type = window['event_type'].astype('string').to_numpy(dtype=object, na_value='')[valid]
+    status = window['status'].astype('string').to_numpy(dtype=object, na_value='')[valid]
+    temperature = _column(window, 'temperature')[valid]
+    uptime = _column(window, 'uptime_hours')[valid]
+    error_counter = np.nan_to_num(_column(window, 'error_count')[valid])
+    response = _column(window, 'response_time_ms')[valid]
+
+    last_1d = age_days <= 1
+    last_7d = age_days <= 7
+    everything = np.ones(len(codes), dtype=bool)
+
+    def count(mask):
+        return np.bincount(codes[mask], minlength=n).astype(float)
+
+    is_error = event_type == 'error'
+    is_reboot = event_type == 'reboot'
+    log_count = count(everything)
+
+    errors_7d = count(is_error & last_7d)
+    errors_30d = count(is_error)
+
+    temperature_7d = np.where(last_7d, temperature, np.nan)
+    temperature_max = np.full(n, np.nan)
+    has_temperature = ~np.isnan(temperature_7d)
+    np.fmax.at(temperature_max, codes[has_temperature], temperature_7d[has_temperature])
+    temperature_mean_30d = _group_mean(codes, temperature, everything, n, np.nan)
+    temperature_mean_7d = _group_mean(codes, temperature, last_7d, n, temperature_mean_30d)
+
+    response_30d = _group_mean(codes, response, everything, n, np.nan)
+    response_7d = _group_mean(codes, response, last_7d, n, response_30d)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        response_ratio = np.where(response_30d > 0, response_7d / response_30d, 1.0)
+
+    maintenance = event_type == 'maintenance'
+    days_since_maintenance = np.full(n, float(lookback_days))
+    np.minimum.at(days_since_maintenance, codes[maintenance], age_days[maintenance])
+
+    features = np.column_stack([
+        count(is_error & last_1d),
+        errors_7d,
+        errors_30d,
+        errors_7d / 7 - errors_30d / lookback_days,
+        np.bincount(codes[last_7d], weights=error_counter[last_7d], minlength=n),
+        count(is_reboot & last_7d),
+        count(is_reboot),
+        count(status == FAILURE_STATUS) / log_count,
+        count(status == 'offline') / log_count,
+        count(status == 'warning') / log_count,
+        temperature_mean_7d,
+        np.where(np.isnan(temperature_max), temperature_mean_7d, temperature_max),
+        _group_slope(codes, -age_days, temperature, n),
+        _group_mean(codes, uptime, last_7d, n, _group_mean(codes, uptime, everything, n, np.nan)),
+        _group_slope(codes, -age_days, uptime, n),
+        np.nan_to_num(response_ratio, nan=1.0),
+        days_since_maintenance,
+        log_count,
+    ])
+
+    return [str(d) for d in device_ids], features
+
+
+def failure_labels(df: pd.DataFrame, device_ids: List[str], as_of: datetime, horizon_days: int) -> np.ndarray:
+    """as_of之后horizon_days天内是否出现故障状态（训练标签）"""
+    timestamps = df['timestamp'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    as_of_ns = np.datetime64(as_of, 'ns').astype(np.int64)
+    upcoming = (timestamps >= as_of_ns) & (timestamps < as_of_ns + horizon_days * DAY_NS)
+    upcoming &= (df['status'] == FAILURE_STATUS).to_numpy()
+
+    failed = set(df.loc[upcoming, 'device_id'].astype(str))
+    return np.array([d in failed for d in device_ids], dtype=float)
+
+
+def build_training_set(df: pd.DataFrame, horizon_days: int = 14, step_days: int = 7,
+                       lookback_days: int = LOOKBACK_DAYS) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    在历史日志上每隔step_days取一个截止时间，构造 (特征, 标签) 样本
+
+    截止时间须保证前面有完整的回看窗口、后面有完整的预测窗口
+
+    Returns:
+        (特征矩阵, 标签, 每个样本的截止时间序号)
+    """
+    start = df['timestamp'].min().normalize() + timedelta(days=lookback_days)
+    end = df['timestamp'].max().normalize() - timedelta(days=horizon_days)
+
+    features, labels, snapshots = [], [], []
+    as_of = start
+    while as_of <= end:
+        device_ids, x = extract_features(df, as_of, lookback_days)
+        if device_ids:
+            features.append(x)
+            labels.append(failure_labels(df, device_ids, as_of, horizon_days))
+            snapshots.append(np.full(len(device_ids), len(snapshots)))
+        as_of += timedelta(days=step_days)
+
+    if not features:
+        return np.zeros((0, len(FEATURE_NAMES))), np.zeros(0), np.zeros(0, dtype=int)
+
+    return np.vstack(features), np.concatenate(labels), np.concatenate(snapshots)
+
+
+def roc_auc(y: np.ndarray, score: np.ndarray) -> Optional[float]:
+    """ROC曲线下面积（秩和公式，并列取平均秩），只有一个类别时返回None"""
+    positives = y == 1
+    n_pos, n_neg = int(positives.sum()), int((~positives).sum())
+    if n_pos == 0 or n_neg == 0:
+        return None
+    ranks = pd.Series(score).rank(method='average').to_numpy()
+    return float((ranks[positives].sum() - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg))
+
+
+class DeviceFailureModel:
+    """L2正则逻辑回归故障预测模型"""
+
+    def __init__(self, path: str, l2: float = 1.0):
+        """
+        Args:
+            path: 模型文件（.npz）
+            l2: L2正则强度（作用于标准化后的系数，不含截距）
+        """
+        self.path = Path(path)
+        self.l2 = l2
+
+        self.coef: Optional[np.ndarray] = None
+        self.intercept = 0.0
+        self.mean = np.zeros(len(FEATURE_NAMES))
+        self.scale = np.ones(len(FEATURE_NAMES))
+        self.horizon_days = 14
+        self.metrics: Dict = {}
+        self._mtime: Optional[float] = None
+
+        self.load()
+
+    @property
+    def is_trained(self) -> bool:
+        return self.coef is not None
+
+    # ---------- 持久化 ----------
+
+    def load(self):
+        """读取模型文件（文件更新后重新读取）"""
+        if not self.path.exists():
+            return
+
+        mtime = self.path.stat().st_mtime
+        if mtime == self._mtime:
+            return
+
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if data['feature_names'].tolist() != FEATURE_NAMES:
+                    print(f"故障预测模型特征与当前版本不一致，请重新训练: {self.path}")
+                    return
+                self.coef = data['coef']
+                self.intercept = float(data['intercept'])
+                self.mean = data['mean']
+                self.scale = data['scale']
+                self.horizon_days = int(data['horizon_days'])
+                self.metrics = json.loads(str(data['metrics']))
+                self._mtime = mtime
+        except Exception as e:
+            print(f"读取故障预测模型失败 {self.path}: {e}")
+
+    def save(self):
+        """原子写入（先写临时文件再替换）"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, feature_names=np.array(FEATURE_NAMES, dtype=str), coef=self.coef,
+                     intercept=np.array(self.intercept), mean=self.mean, scale=self.scale,
+                     horizon_days=np.array(self.horizon_days), metrics=np.array(json.dumps(self.metrics)))
+        os.replace(tmp_path, self.path)
+        self._mtime = self.path.stat().st_mtime
+
+    # ---------- 训练与预测 ----------
+
+    def _standardize(self, X: np.ndarray) -> np.ndarray:
+        return (np.nan_to_num(X, nan=0.0) - self.mean) / self.scale
+
+    def fit(self, X: np.ndarray, y: np.ndarray, max_iter: int = 50, tol: float = 1e-6):
+        """
+        牛顿法（IRLS）拟合：特征只有十几维，每步解一个小线性方程组，几步即收敛
+
+        Args:
+            X: 特征矩阵
+            y: 0/1标签
+        """
+        X = np.nan_to_num(X, nan=0.0)
+        self.mean = X.mean(axis=0)
+        self.scale = np.where(X.std(axis=0) > 1e-9, X.std(axis=0), 1.0)
+
+        design = np.column_stack([np.ones(len(X)), self._standardize(X)])
+        penalty = np.full(design.shape[1], self.l2)
+        penalty[0] = 0.0
+
+        w = np.zeros(design.shape[1])
+        for _ in range(max_iter):
+            p = 1 / (1 + np.exp(-np.clip(design @ w, -30, 30)))
+            gradient = design.T @ (p - y) + penalty * w
+            hessian = (design * (p * (1 - p))[:, None]).T @ design + np.diag(penalty) + 1e-9 * np.eye(len(w))
+            step = np.linalg.solve(hessian, gradient)
+            w -= step
+            if np.abs(step).max() < tol:
+                break
+
+        self.intercept = float(w[0])
+        self.coef = w[1:]
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """故障概率"""
+        if not self.is_trained:
+            raise ValueError("故障预测模型尚未训练")
+        z = self._standardize(X) @ self.coef + self.intercept
+        return 1 / (1 + np.exp(-np.clip(z, -30, 30)))
+
+    def score_devices(self, df: pd.DataFrame, as_of: Optional[datetime] = None) -> Dict[str, float]:
+        """
+        批量预测全部设备在未来horizon_days天内出现故障的概率
+
+        Returns:
+            {设备ID: 故障概率}
+        """
+        device_ids, X = extract_features(df, as_of or datetime.now())
+        if not device_ids:
+            return {}
+        return dict(zip(device_ids, self.predict_proba(X).tolist()))
+
+    def explain(self, top: int = 5) -> List[Dict]:
+        """影响最大的特征（标准化系数绝对值降序）"""
+        if not self.is_trained:
+            return []
+        order = np.argsort(-np.abs(self.coef))[:top]
+        return [{'feature': FEATURE_NAMES[i], 'coefficient': round(float(self.coef[i]), 4)} for i in order]
+
+    def train(self, df: pd.DataFrame, horizon_days: int = 14, step_days: int = 7,
+              validation_fraction: float = 0.25) -> Dict:
+        """
+        在历史日志上训练并保存模型
+
+        按截止时间划分：较晚的validation_fraction截止时间作为验证集评估AUC，
+        评估后用全部样本重新拟合
+
+        Returns:
+            训练指标
+        """
+        X, y, snapshots = build_training_set(df, horizon_days=horizon_days, step_days=step_days)
+        if len(X) == 0:
+            raise ValueError(f"历史日志不足：至少需要{LOOKBACK_DAYS + horizon_days}天的日志")
+        if y.min() == y.max():
+            raise ValueError("训练样本中只有一个类别（全部故障或全部未故障），无法训练")
+
+        n_snapshots = int(snapshots.max()) + 1
+        n_validation = int(round(n_snapshots * validation_fraction))
+        metrics = {
+            'samples': int(len(X)),
+            'snapshots': n_snapshots,
+            'positive_rate': round(float(y.mean()), 4),
+            'horizon_days': horizon_days,
+            'trained_at': datetime.now().isoformat(),
+        }
+
+        if 0 < n_validation < n_snapshots:
+            train = snapshots < n_snapshots - n_validation
+            if y[train].min() != y[train].max():
+                self.fit(X[train], y[train])
+                auc = roc_auc(y[~train], self.predict_proba(X[~train]))
+                metrics['validation_auc'] = round(auc, 4) if auc is not None else None
+                metrics['validation_samples'] = int((~train).sum())
+
+        self.fit(X, y)
+        self.horizon_days = horizon_days
+        self.metrics = metrics
+        self.save()
+
+        return {**metrics, 'top_features': self.explain()}
@@ -0,0 +1,126 @@
+"""
+设备健康热力图模块
+热力图数据（区域 × 设备类型的平均健康评分透视表）与渲染分离：透视表可导出为JSON/Arrow，
+由仪表盘在前端交互式绘制；PNG只在请求时渲染，文件名包含透视表数据哈希，数据未变化时直接复用
+"""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # 无GUI后端，适合服务器环境
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+# Arrow导出依赖pyarrow（可选依赖）
+try:
+    import pyarrow as pa
+    ARROW_SUPPORT = True
+except ImportError:
+    ARROW_SUPPORT = False
+
+ARROW_MEDIA_TYPE = 'application/vnd.apache.arrow.stream'
+
+
+def build_heatmap_table(device_health: List[Dict], by_area: bool = True) -> pd.DataFrame:
+    """
+    设备健康评分透视表
+
+    Args:
+        device_health: 设备健康评分列表（需要device_id/health_score）
+        by_area: True为 区域 × 设备类型，False为按设备类型汇总的一列
+
+    Returns:
+        透视表（值为平均健康评分）
+    """
+    df = pd.DataFrame(device_health, columns=['device_id', 'health_score'])
+
+    # 假设设备ID包含区域信息（如：AREA1_DOOR001）
+    if by_area:
+        parts = df['device_id'].str.split('_')
+        df['area'] = parts.str[0]
+        df['device_type'] = parts.str[1].str[:4]  # 提取设备类型前4个字符
+
+        return df.pivot_table(
+            values='health_score',
+            index='area',
+            columns='device_type',
+            aggfunc='mean'
+        )
+
+    # 按设备类型分组
+    df['device_type'] = df['device_id'].str.extract(r'(DOOR|CAM|SENSOR)')[0]
+    return df.groupby('device_type')['health_score'].mean().to_frame()
+
+
+def heatmap_to_dict(table: pd.DataFrame) -> Dict:
+    """透视表 -> 可JSON序列化的矩阵（缺失值为None，评分保留1位小数）"""
+    values = table.to_numpy(dtype=float).round(1)
+    return {
+        'index_name': table.index.name,
+        'index': [str(v) for v in table.index],
+        'columns': [str(v) for v in table.columns],
+        'values': [[None if np.isnan(v) else float(v) for v in row] for row in values]
+    }
+
+
+def heatmap_hash(table: pd.DataFrame) -> str:
+    """透视表数据哈希（数据相同则图片相同）"""
+    payload = json.dumps(heatmap_to_dict(table), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def heatmap_to_arrow(table: pd.DataFrame) -> bytes:
+    """
+    透视表 -> Arrow IPC流（首列为行标签，其余每个设备类型一列float64）
+
+    Raises:
+        RuntimeError: 未安装pyarrow
+    """
+    if not ARROW_SUPPORT:
+        raise RuntimeError('未安装pyarrow，无法导出Arrow格式')
+
+    frame = table.copy()
+    frame.columns = [str(c) for c in frame.columns]
+    arrow_table = pa.Table.from_pandas(frame.reset_index(), preserve_index=False)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, arrow_table.schema) as writer:
+        writer.write_table(arrow_table)
+    return sink.getvalue().to_pybytes()
+
+
+def render_heatmap(table: pd.DataFrame, output_dir: Path, by_area: bool = True) -> Optional[str]:
+    """
+    渲染热力图PNG（同一数据的图片已存在时直接返回）
+
+    Returns:
+        图片路径，透视表为空时返回None
+    """
+    if table.empty:
+        return None
+
+    prefix = 'device_health_heatmap' if by_area else 'device_type_health'
+    output_path = Path(output_dir) / f'{prefix}_{heatmap_hash(table)}.png'
+    if output_path.exists():
+        return str(output_path)
+
+    fig = plt.figure(figsize=(12, 8))
+    sns.heatmap(table, annot=True, fmt='.1f', cmap='RdYlGn',
+                vmin=0, vmax=100, cbar_kws={'label': '健康评分'})
+    plt.title('设备健康状态热力图', fontsize=14, fontweight='bold')
+    plt.xlabel('设备类型')
+    plt.ylabel('区域' if by_area else '设备类型')
+    plt.tight_layout()
+
+    # 先写临时文件再替换，文件存在即代表渲染完成
+    tmp_path = output_path.with_suffix('.tmp.png')
+    plt.savefig(tmp_path, dpi=150, bbox_inches='tight')
+    plt.close(fig)
+    tmp_path.replace(output_path)
+
+    return str(output_path)
@@ -0,0 +1,312 @@
+"""
+设备健康评分历史模块
+每次全量监控追加一次评分：设备列表和评分记录都是只追加的文件（devices.txt 每行一个设备，
+runs.bin 每次运行一条 [时间戳, 设备数, float32评分...] 记录），启动时读入 (设备 × 运行次数)
+的内存矩阵，按设备/区域取序列只需一次字典查找和切片；
+每次追加时对全部设备向量化地更新Page-Hinkley检验，检测评分的持续下降；
+追加时可附带输入数据版本，与上次运行的版本相同时不重复记录
+"""
+
+import os
+import threading
+import numpy as np
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# 每次运行记录的头部：时间戳（纳秒）+ 本次记录的设备数
+RUN_HEADER = np.dtype([('timestamp', '<i8'), ('n_devices', '<i4')])
+
+
+def area_of(device_id: str) -> str:
+    """设备所属区域（设备ID前缀，如 AREA1_DOOR001 -> AREA1）"""
+    return str(device_id).split('_')[0]
+
+
+class HealthHistory:
+    """只追加的设备健康评分时间序列"""
+
+    def __init__(self, history_dir: str, delta: float = 2.0, threshold: float = 25.0, min_runs: int = 3):
+        """
+        Args:
+            history_dir: 存储目录
+            delta: Page-Hinkley容忍量（评分点），小于此幅度的波动不累积
+            threshold: 累积下降超过此值（评分点）判定为评分骤降
+            min_runs: 设备至少有几次评分后才参与判定
+        """
+        self.history_dir = Path(history_dir)
+        self.devices_path = self.history_dir / 'devices.txt'
+        self.runs_path = self.history_dir / 'runs.bin'
+        # 最近一次运行的输入数据版本：「运行次数\n版本」
+        self.version_path = self.history_dir / 'last_version.txt'
+
+        self.delta = delta
+        self.threshold = threshold
+        self.min_runs = min_runs
+
+        self.devices: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._areas: Dict[str, List[int]] = {}
+
+        # 评分矩阵按容量翻倍扩展，有效部分为 [:len(devices), :n_runs]
+        self.scores = np.full((64, 64), np.nan, dtype=np.float32)
+        self.timestamps = np.zeros(64, dtype=np.int64)
+        self.n_runs = 0
+        self.last_version: Optional[str] = None
+
+        # 监控报告可能在线程池中并发生成
+        self._lock = threading.Lock()
+
+        self._reset_detector(0)
+        self._load()
+
+    # ---------- 内部存储 ----------
+
+    def _reset_detector(self, n: int):
+        # Page-Hinkley状态：当前段的样本数、均值、累积量m及其最大值M
+        self.ph_count = np.zeros(n, dtype=np.int32)
+        self.ph_mean = np.zeros(n)
+        self.ph_sum = np.zeros(n)
+        self.ph_max = np.zeros(n)
+        # 最近一次检测到的下降：运行序号（-1表示无）、下降前均值、检测时评分
+        self.change_run = np.full(n, -1, dtype=np.int32)
+        self.change_baseline = np.full(n, np.nan)
+        self.change_score = np.full(n, np.nan)
+
+    def _add_device(self, device_id: str) -> int:
+        row = len(self.devices)
+        self._index[device_id] = row
+        self.devices.append(device_id)
+        self._areas.setdefault(area_of(device_id), []).append(row)
+
+        if row >= self.scores.shape[0]:
+            self.scores = np.vstack([self.scores, np.full(self.scores.shape, np.nan, dtype=np.float32)])
+        if row >= len(self.ph_count):
+            extra = max(len(self.ph_count), 64)
+            self.ph_count = np.concatenate([self.ph_count, np.zeros(extra, dtype=np.int32)])
+            self.ph_mean = np.concatenate([self.ph_mean, np.zeros(extra)])
+            self.ph_sum = np.concatenate([self.ph_sum, np.zeros(extra)])
+            self.ph_max = np.concatenate([self.ph_max, np.zeros(extra)])
+            self.change_run = np.concatenate([self.change_run, np.full(extra, -1, dtype=np.int32)])
+            self.change_baseline = np.concatenate([self.change_baseline, np.full(extra, np.nan)])
+            self.change_score = np.concatenate([self.change_score, np.full(extra, np.nan)])
+        return row
+
+    def _add_run(self, timestamp: int, scores: np.ndarray):
+        """写入内存矩阵并更新检测状态"""
+        if self.n_runs >= self.scores.shape[1]:
+            self.scores = np.hstack([self.scores, np.full(self.scores.shape, np.nan, dtype=np.float32)])
+            self.timestamps = np.concatenate([self.timestamps, np.zeros(len(self.timestamps), dtype=np.int64)])
+
+        self.scores[:len(scores), self.n_runs] = scores
+        self.timestamps[self.n_runs] = timestamp
+        self._update_detector(scores.astype(float), self.n_runs)
+        self.n_runs += 1
+
+    def _update_detector(self, x: np.ndarray, run: int):
+        """
+        Page-Hinkley下降检验（全部设备一次向量运算）：
+        m_t = Σ(x_i - 均值_i + δ)，M_t = max(m)，M_t - m_t > 阈值时判定下降，
+        之后以当前评分为新基线重新累积
+        """
+        rows = np.flatnonzero(~np.isnan(x))
+        xs = x[rows]
+
+        count = self.ph_count[rows] + 1
+        previous_mean = self.ph_mean[rows]
+        mean = previous_mean + (xs - previous_mean) / count
+        m = self.ph_sum[rows] + xs - mean + self.delta
+        peak = np.maximum(self.ph_max[rows], m)
+
+        detected = (count > self.min_runs) & (peak - m > self.threshold)
+        hit = rows[detected]
+        self.change_run[hit] = run
+        self.change_baseline[hit] = previous_mean[detected]
+        self.change_score[hit] = xs[detected]
+
+        # 检出后重置，当前评分成为新基线
+        count[detected] = 1
+        mean[detected] = xs[detected]
+        m[detected] = 0.0
+        peak[detected] = 0.0
+
+        self.ph_count[rows] = count
+        self.ph_mean[rows] = mean
+        self.ph_sum[rows] = m
+        self.ph_max[rows] = peak
+
+    def _load(self):
+        """读入设备列表和运行记录（末尾不完整的记录视为中断的写入并截掉）"""
+        if self.devices_path.exists():
+            for device_id in self.devices_path.read_text(encoding='utf-8').splitlines():
+                if device_id:
+                    self._add_device(device_id)
+
+        if not self.runs_path.exists():
+            return
+
+        data = self.runs_path.read_bytes()
+        pos = 0
+        while pos + RUN_HEADER.itemsize <= len(data):
+            header = np.frombuffer(data, dtype=RUN_HEADER, count=1, offset=pos)[0]
+            n = int(header['n_devices'])
+            end = pos + RUN_HEADER.itemsize + 4 * n
+            if end > len(data) or n > len(self.devices):
+                break
+            scores = np.frombuffer(data, dtype='<f4', count=n, offset=pos + RUN_HEADER.itemsize)
+            self._add_run(int(header['timestamp']), scores)
+            pos = end
+
+        if pos < len(data):
+            print(f"健康评分历史末尾有不完整记录，已截断: {self.runs_path}")
+            with open(self.runs_path, 'r+b') as f:
+                f.truncate(pos)
+
+        # 版本记录对应的运行次数与实际不符（写入中断）时视为未知版本
+        if self.version_path.exists():
+            runs, _, version = self.version_path.read_text(encoding='utf-8').partition('\n')
+            if runs.strip() == str(self.n_runs) and version:
+                self.last_version = version
+
+    # ---------- 写入 ----------
+
+    def append(self, scores: Dict[str, float], timestamp: Optional[datetime] = None,
+               version: Optional[str] = None) -> List[Dict]:
+        """
+        追加一次运行的全部设备评分
+
+        Args:
+            scores: {设备ID: 健康评分}
+            timestamp: 运行时间，默认为当前时间
+            version: 输入数据版本，与上次运行相同时不追加（报告缓存过期后的重算不产生重复记录）
+
+        Returns:
+            本次新检测到评分骤降的设备（同changes格式）；未追加时返回上次运行检测到的
+        """
+        self.history_dir.mkdir(parents=True, exist_ok=True)
+
+        with self._lock:
+            if version is not None and version == self.last_version:
+                return self._changes(self.n_runs - 1, None)
+
+            changes = self._append(scores, timestamp)
+            if version is not None:
+                tmp_path = self.version_path.with_suffix('.tmp')
+                tmp_path.write_text(f'{self.n_runs}\n{version}', encoding='utf-8')
+                os.replace(tmp_path, self.version_path)
+                self.last_version = version
+            return changes
+
+    def _append(self, scores: Dict[str, float], timestamp: Optional[datetime]) -> List[Dict]:
+        new_devices = [d for d in scores if d not in self._index]
+        for device_id in new_devices:
+            self._add_device(device_id)
+        if new_devices:
+            # 先写设备列表再写运行记录，运行记录引用的设备总是已落盘
+            with open(self.devices_path, 'a', encoding='utf-8') as f:
+                f.write(''.join(f'{d}\n' for d in new_devices))
+
+        row_scores = np.full(len(self.devices), np.nan, dtype=np.float32)
+        for device_id, score in scores.items():
+            if score is not None:
+                row_scores[self._index[device_id]] = score
+
+        ts = np.datetime64(timestamp or datetime.now(), 'ns').astype(np.int64)
+        header = np.array([(ts, len(row_scores))], dtype=RUN_HEADER)
+        with open(self.runs_path, 'ab') as f:
+            f.write(header.tobytes() + row_scores.astype('<f4').tobytes())
+
+        run = self.n_runs
+        self._add_run(int(ts), row_scores)
+        return self._changes(run, None)
+
+    # ---------- 查询 ----------
+
+    def _run_times(self, start: int = 0) -> List[str]:
+        return [str(t) for t in self.timestamps[start:self.n_runs].view('datetime64[ns]').astype('datetime64[s]')]
+
+    def device_series(self, device_id: str, last: Optional[int] = None) -> Dict:
+        """
+        某设备的评分序列
+
+        Args:
+            device_id: 设备ID
+            last: 只取最近N次运行
+        """
+        row = self._index.get(device_id)
+        if row is None:
+            raise ValueError(f"没有设备{device_id}的评分历史")
+
+        with self._lock:
+            start = max(self.n_runs - last, 0) if last else 0
+            values = self.scores[row, start:self.n_runs].copy()
+            times = np.array(self._run_times(start), dtype=object)
+        present = ~np.isnan(values)
+
+        return {
+            'device_id': device_id,
+            'area': area_of(device_id),
+            'timestamps': times[present].tolist(),
+            'scores': [round(float(v), 2) for v in values[present]]
+        }
+
+    def area_series(self, area: str, last: Optional[int] = None) -> Dict:
+        """某区域各次运行的平均评分和最低评分"""
+        rows = self._areas.get(area)
+        if not rows:
+            raise ValueError(f"没有区域{area}的评分历史")
+
+        rows = list(rows)
+        start = max(self.n_runs - last, 0) if last else 0
+        with self._lock:
+            values = self.scores[rows, start:self.n_runs]
+            times = np.array(self._run_times(start), dtype=object)
+
+        # 只统计该区域有评分的运行
+        reported = ~np.isnan(values).all(axis=0)
+        values = values[:, reported]
+
+        return {
+            'area': area,
+            'devices': [self.devices[r] for r in rows],
+            'timestamps': times[reported].tolist(),
+            'mean_scores': [round(float(v), 2) for v in np.nanmean(values, axis=0)],
+            'min_scores': [round(float(v), 2) for v in np.nanmin(values, axis=0)]
+        }
+
+    def changes(self, since_run: int = 0, area: Optional[str] = None) -> List[Dict]:
+        """
+        检测到评分骤降的设备（每个设备只保留最近一次），按下降幅度降序
+
+        Args:
+            since_run: 只返回该运行序号及之后检测到的
+            area: 只返回该区域的设备
+        """
+        with self._lock:
+            return self._changes(since_run, area)
+
+    def _changes(self, since_run: int, area: Optional[str]) -> List[Dict]:
+        n = len(self.devices)
+        rows = np.flatnonzero(self.change_run[:n] >= since_run)
+        if area is not None:
+            rows = np.intersect1d(rows, self._areas.get(area, []))
+
+        drop = self.change_baseline[rows] - self.change_score[rows]
+        rows = rows[np.argsort(-drop, kind='stable')]
+
+        return [
+            {
+                'device_id': self.devices[r],
+                'area': area_of(self.devices[r]),
+                'detected_at': str(np.datetime64(int(self.timestamps[self.change_run[r]]), 'ns')
+                                   .astype('datetime64[s]')),
+                'baseline_score': round(float(self.change_baseline[r]), 2),
+                'score': round(float(self.change_score[r]), 2),
+                'drop': round(float(self.change_baseline[r] - self.change_score[r]), 2)
+            }
+            for r in rows
+        ]
+
+    def recent_run(self, runs: int) -> int:
+        """最近N次运行中最早一次的序号（用于changes的since_run）"""
+        return max(self.n_runs - runs, 0)
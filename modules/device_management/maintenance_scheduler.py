@@ -0,0 +1,387 @@
+"""
+维护排程模块
+把维护建议（工单）分配给各维修班组的多日排程：贪心构造（先排高优先级，同一优先级内选
+路程+工时最短的下一个工单，同楼宇的工单自然连续完成），再做局部搜索（路线内2-opt重排、跨路线前移、
+用未排工单替换低优先级工单），目标是高优先级工单尽早完成、路程时间最少
+"""
+
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# 工单优先级权重（越高越应尽早完成）
+PRIORITY_WEIGHTS = {'high': 3.0, 'medium': 1.0, 'low': 0.5}
+
+# 默认3个班组，工作日 08:00-17:00
+DEFAULT_CREWS = [
+    {'crew_id': f'crew_{i}', 'shift_start': 8.0, 'shift_end': 17.0, 'workdays': [0, 1, 2, 3, 4]}
+    for i in range(1, 4)
+]
+
+# 设备ID中的类型标记 -> 备件类型（高优先级维修工单需要一件对应备件）
+DEVICE_PART_TYPES = {'DOOR': 'door_controller', 'CAM': 'camera', 'SENSOR': 'sensor'}
+
+# 没有楼宇坐标时，不同楼宇之间的路程（小时）
+DEFAULT_TRAVEL_HOURS = 0.5
+
+# 有坐标时：车速（公里/小时）和每次转场的固定耗时（小时）
+TRAVEL_SPEED_KMH = 30.0
+TRAVEL_OVERHEAD_HOURS = 0.25
+
+# 路程时间在目标函数中的权重（相对于1个中优先级工单推迟一整天）
+TRAVEL_COST_WEIGHT = 0.2
+
+
+def part_type_for(device_id: str) -> Optional[str]:
+    """根据设备ID推断备件类型"""
+    upper = str(device_id).upper()
+    for marker, part_type in DEVICE_PART_TYPES.items():
+        if marker in upper:
+            return part_type
+    return None
+
+
+def _format_hour(hour: float) -> str:
+    minutes = int(round(hour * 60))
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+class MaintenanceScheduler:
+    """维护工单排程器（贪心 + 局部搜索）"""
+
+    def __init__(self, crews: Optional[List[Dict]] = None, travel_hours: float = DEFAULT_TRAVEL_HOURS,
+                 time_limit_seconds: float = 5.0):
+        """
+        Args:
+            crews: 班组列表 [{'crew_id', 'shift_start', 'shift_end', 'workdays'}]，时间为小时数
+            travel_hours: 无坐标时不同楼宇间的路程（小时）
+            time_limit_seconds: 局部搜索的时间上限
+        """
+        self.crews = crews or DEFAULT_CREWS
+        self.travel_hours = travel_hours
+        self.time_limit_seconds = time_limit_seconds
+
+    # ---------- 输入整理 ----------
+
+    @staticmethod
+    def load_locations(path: Path) -> Optional[pd.DataFrame]:
+        """读取设备位置表（device_id, building, x_km, y_km），不存在时返回None"""
+        if not Path(path).exists():
+            return None
+        return pd.read_csv(path)
+
+    def _travel_matrix(self, buildings: List[str], locations: Optional[pd.DataFrame]) -> np.ndarray:
+        """楼宇间路程（小时），同一楼宇为0"""
+        n = len(buildings)
+        coords = None
+        if locations is not None and {'building', 'x_km', 'y_km'} <= set(locations.columns):
+            by_building = locations.groupby('building')[['x_km', 'y_km']].mean()
+            if set(buildings) <= set(by_building.index):
+                coords = by_building.loc[buildings].to_numpy(dtype=float)
+
+        if coords is None:
+            travel = np.full((n, n), self.travel_hours)
+        else:
+            distance = np.sqrt(((coords[:, None, :] - coords[None, :, :]) ** 2).sum(axis=2))
+            travel = distance / TRAVEL_SPEED_KMH + TRAVEL_OVERHEAD_HOURS
+
+        np.fill_diagonal(travel, 0.0)
+        return travel
+
+    def _work_slots(self, start_date: datetime, days: int) -> List[Tuple[int, str, Dict]]:
+        """排程周期内的 (第几天, 日期, 班组) 工作班次，按日期排序"""
+        slots = []
+        for day in range(days):
+            date = start_date + timedelta(days=day)
+            for crew in self.crews:
+                if date.weekday() in crew.get('workdays', range(7)):
+                    slots.append((day, date.strftime('%Y-%m-%d'), crew))
+        return slots
+
+    # ---------- 目标函数 ----------
+
+    def _route_times(self, route: List[int], shift_start: float, duration: np.ndarray,
+                     building: np.ndarray, travel: np.ndarray) -> Tuple[np.ndarray, float]:
+        """路线上各工单的完成时间和总路程（班组从第一个工单所在楼宇开始）"""
+        finish = np.empty(len(route))
+        t = shift_start
+        total_travel = 0.0
+        previous = None
+        for k, i in enumerate(route):
+            leg = travel[previous, building[i]] if previous is not None else 0.0
+            t += leg + duration[i]
+            total_travel += leg
+            finish[k] = t
+            previous = building[i]
+        return finish, total_travel
+
+    def _route_cost(self, route: List[int], day: int, crew: Dict, weight: np.ndarray, duration: np.ndarray,
+                    building: np.ndarray, travel: np.ndarray) -> Optional[float]:
+        """
+        路线代价：Σ 权重 × (第几天 + 完成时刻在班次中的比例) + 路程权重 × 路程；超出班次时返回None
+        """
+        if not route:
+            return 0.0
+        shift_start, shift_end = crew['shift_start'], crew['shift_end']
+        finish, total_travel = self._route_times(route, shift_start, duration, building, travel)
+        if finish[-1] > shift_end + 1e-9:
+            return None
+        progress = (finish - shift_start) / (shift_end - shift_start)
+        return float((weight[route] * (day + progress)).sum() + TRAVEL_COST_WEIGHT * total_travel)
+
+    # ---------- 求解 ----------
+
+    def _greedy(self, slots, weight, duration, building, travel, part, stock) -> List[List[int]]:
+        """
+        逐个班次构造路线：每步在能放进剩余班次的工单中先取优先级最高的一档，
+        再选其中 路程+工时 最短者（同楼宇的工单因此连续完成）
+        """
+        remaining = np.ones(len(weight), dtype=bool)
+        routes = []
+
+        for day, _, crew in slots:
+            route = []
+            t = crew['shift_start']
+            location = None
+            while True:
+                available = remaining.copy()
+                if stock is not None:
+                    available &= (part < 0) | (np.asarray(stock)[part] > 0)
+                leg = travel[location, building] if location is not None else np.zeros(len(weight))
+                available &= t + leg + duration <= crew['shift_end'] + 1e-9
+                if not available.any():
+                    break
+
+                # 优先级是硬性次序：低优先级工单不能因为工时短而挤占高优先级工单
+                top = available & (weight == weight[available].max())
+                i = int(np.argmin(np.where(top, leg + duration, np.inf)))
+                route.append(i)
+                t += leg[i] + duration[i]
+                location = building[i]
+                remaining[i] = False
+                if stock is not None and part[i] >= 0:
+                    stock[part[i]] -= 1
+            routes.append(route)
+
+        return routes
+
+    def _improve(self, routes, slots, weight, duration, building, travel, part, stock, deadline) -> int:
+        """局部搜索，返回接受的改进次数"""
+        costs = [self._route_cost(r, day, crew, weight, duration, building, travel)
+                 for r, (day, _, crew) in zip(routes, slots)]
+        scheduled = np.zeros(len(weight), dtype=bool)
+        for r in routes:
+            scheduled[r] = True
+        improvements = 0
+
+        def cost_of(k, route):
+            day, _, crew = slots[k]
+            return self._route_cost(route, day, crew, weight, duration, building, travel)
+
+        improved = True
+        while improved and time.monotonic() < deadline:
+            improved = False
+
+            # 1. 路线内2-opt：翻转一段工单顺序以减少路程、让高权重工单更早完成
+            for k, route in enumerate(routes):
+                for a in range(len(route) - 1):
+                    for b in range(a + 1, len(route)):
+                        candidate = route[:a] + route[a:b + 1][::-1] + route[b + 1:]
+                        cost = cost_of(k, candidate)
+                        if cost is not None and cost < costs[k] - 1e-9:
+                            routes[k], costs[k], route = candidate, cost, candidate
+                            improvements += 1
+                            improved = True
+
+            # 2. 跨路线前移：把较晚班次的工单插入较早班次的最佳位置
+            for source in range(len(routes) - 1, 0, -1):
+                for i in list(routes[source]):
+                    if time.monotonic() >= deadline:
+                        break
+                    reduced = [j for j in routes[source] if j != i]
+                    reduced_cost = cost_of(source, reduced)
+                    best = None
+                    for target in range(source):
+                        if slots[target][0] >= slots[source][0]:
+                            break
+                        for position in range(len(routes[target]) + 1):
+                            candidate = routes[target][:position] + [i] + routes[target][position:]
+                            cost = cost_of(target, candidate)
+                            if cost is None:
+                                continue
+                            gain = costs[source] + costs[target] - reduced_cost - cost
+                            if gain > 1e-9 and (best is None or gain > best[0]):
+                                best = (gain, target, candidate, cost)
+                    if best is not None:
+                        _, target, candidate, cost = best
+                        routes[source], costs[source] = reduced, reduced_cost
+                        routes[target], costs[target] = candidate, cost
+                        improvements += 1
+                        improved = True
+
+            # 3. 未排工单替换已排的低权重工单（按权重从高到低尝试）
+            unscheduled = np.flatnonzero(~scheduled)
+            unscheduled = unscheduled[np.argsort(-weight[unscheduled], kind='stable')]
+            lowest = weight[scheduled].min() if scheduled.any() else np.inf
+            for u in unscheduled:
+                # 只有比已排工单中最低权重更高的工单才可能替换成功
+                if weight[u] <= lowest or time.monotonic() >= deadline:
+                    break
+                best = None
+                for k, route in enumerate(routes):
+                    for position, s in enumerate(route):
+                        if weight[s] >= weight[u]:
+                            continue
+                        if stock is not None and part[u] >= 0 and part[u] != part[s] and stock[part[u]] <= 0:
+                            continue
+                        candidate = route[:position] + [u] + route[position + 1:]
+                        cost = cost_of(k, candidate)
+                        if cost is None:
+                            continue
+                        # 被替换的工单回到未排状态，按排程周期之后完成计入代价
+                        penalty_delta = (weight[s] - weight[u]) * (slots[-1][0] + 1)
+                        gain = costs[k] - cost - penalty_delta
+                        if gain > 1e-9 and (best is None or gain > best[0]):
+                            best = (gain, k, position, s, candidate, cost)
+                if best is not None:
+                    _, k, position, s, candidate, cost = best
+                    routes[k], costs[k] = candidate, cost
+                    scheduled[u], scheduled[s] = True, False
+                    if stock is not None:
+                        if part[s] >= 0:
+                            stock[part[s]] += 1
+                        if part[u] >= 0:
+                            stock[part[u]] -= 1
+                    improvements += 1
+                    improved = True
+
+        return improvements
+
+    def schedule(self, recommendations: List[Dict], days: int = 5, start_date: Optional[datetime] = None,
+                 spare_parts_stock: Optional[Dict[str, int]] = None,
+                 locations: Optional[pd.DataFrame] = None) -> Dict:
+        """
+        生成多日维护排程
+
+        Args:
+            recommendations: generate_maintenance_recommendations的结果（工单）
+            days: 排程天数
+            start_date: 首个排程日，默认为明天
+            spare_parts_stock: 备件库存 {备件类型: 数量}，None表示不限制
+            locations: 设备位置表（device_id, building, x_km, y_km），None时楼宇取设备ID前缀
+
+        Returns:
+            {'start_date', 'days', 'schedule', 'unscheduled', 'summary'}
+        """
+        start = time.monotonic()
+        if start_date is None:
+            start_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+        orders = [r for r in recommendations if r.get('device_id')]
+        device_ids = [str(r['device_id']) for r in orders]
+
+        building_of = {}
+        if locations is not None and 'building' in locations.columns:
+            building_of = dict(zip(locations['device_id'].astype(str), locations['building'].astype(str)))
+        building_names = [building_of.get(d, d.split('_')[0]) for d in device_ids]
+        buildings = sorted(set(building_names))
+        building_index = {b: i for i, b in enumerate(buildings)}
+
+        weight = np.array([PRIORITY_WEIGHTS.get(r.get('priority'), 1.0) for r in orders])
+        duration = np.array([float(r.get('estimated_downtime_hours') or 1.0) for r in orders])
+        building = np.array([building_index[b] for b in building_names], dtype=np.int64)
+        travel = self._travel_matrix(buildings, locations)
+
+        # 高优先级（维修）工单需要备件，常规保养不需要
+        part_names = sorted(set(DEVICE_PART_TYPES.values()))
+        part = np.array([
+            part_names.index(part_type_for(d)) if r.get('priority') == 'high' and part_type_for(d) else -1
+            for d, r in zip(device_ids, orders)
+        ], dtype=np.int64)
+        stock = None
+        if spare_parts_stock is not None:
+            stock = [int(spare_parts_stock.get(name, 0)) for name in part_names]
+
+        slots = self._work_slots(start_date, days)
+        routes = self._greedy(slots, weight, duration, building, travel, part,
+                              list(stock) if stock is not None else None)
+
+        # 局部搜索在贪心结果的库存余量上继续
+        remaining_stock = None
+        if stock is not None:
+            remaining_stock = list(stock)
+            for route in routes:
+                for i in route:
+                    if part[i] >= 0:
+                        remaining_stock[part[i]] -= 1
+        improvements = self._improve(routes, slots, weight, duration, building, travel, part, remaining_stock,
+                                     deadline=start + self.time_limit_seconds)
+
+        # 输出
+        schedule = []
+        scheduled = np.zeros(len(orders), dtype=bool)
+        total_travel = 0.0
+        objective = 0.0
+        for route, (day, date, crew) in zip(routes, slots):
+            if not route:
+                continue
+            finish, route_travel = self._route_times(route, crew['shift_start'], duration, building, travel)
+            objective += self._route_cost(route, day, crew, weight, duration, building, travel)
+            total_travel += route_travel
+            scheduled[route] = True
+
+            tasks = []
+            previous = None
+            for i, end in zip(route, finish):
+                leg = float(travel[previous, building[i]]) if previous is not None else 0.0
+                tasks.append({
+                    'device_id': device_ids[i],
+                    'building': buildings[building[i]],
+                    'priority': orders[i].get('priority'),
+                    'start': _format_hour(end - duration[i]),
+                    'end': _format_hour(end),
+                    'travel_hours': round(leg, 2),
+                    'part_type': part_names[part[i]] if part[i] >= 0 else None,
+                    'recommended_actions': orders[i].get('recommended_actions', [])
+                })
+                previous = building[i]
+
+            schedule.append({
+                'date': date,
+                'crew_id': crew['crew_id'],
+                'tasks': tasks,
+                'work_hours': round(float(duration[route].sum()), 2),
+                'travel_hours': round(float(route_travel), 2)
+            })
+
+        unscheduled = []
+        used = np.bincount(part[scheduled & (part >= 0)], minlength=len(part_names))
+        for i in np.flatnonzero(~scheduled):
+            objective += weight[i] * (slots[-1][0] + 1 if slots else days)
+            short_of_parts = stock is not None and part[i] >= 0 and used[part[i]] >= stock[part[i]]
+            unscheduled.append({
+                'device_id': device_ids[i],
+                'priority': orders[i].get('priority'),
+                'reason': f'备件不足: {part_names[part[i]]}' if short_of_parts else '超出排程周期'
+            })
+
+        return {
+            'start_date': start_date.strftime('%Y-%m-%d'),
+            'days': days,
+            'schedule': schedule,
+            'unscheduled': unscheduled,
+            'summary': {
+                'total_orders': len(orders),
+                'scheduled': int(scheduled.sum()),
+                'unscheduled': len(unscheduled),
+                'high_priority_unscheduled': sum(1 for u in unscheduled if u['priority'] == 'high'),
+                'crew_days': len(schedule),
+                'travel_hours': round(float(total_travel), 2),
+                'objective': round(float(objective), 2),
+                'local_search_moves': improvements,
+                'solve_seconds': round(time.monotonic() - start, 2)
+            }
+        }
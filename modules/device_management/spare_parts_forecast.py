@@ -0,0 +1,162 @@
+"""
+备件需求预测模块
+从设备日志的维护事件推算各类备件在各区域的消耗（每次维护消耗一件该设备对应类型的备件），
+按指数加权的日消耗均值/方差预测需求，结合补货提前期计算动态安全库存、再订货点和建议订货量；
+消耗统计是一次分组计数得到的 (备件×区域, 天) 矩阵运算，库存判断是对整张库存表的向量运算
+"""
+
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from statistics import NormalDist
+from typing import Dict, Optional
+
+from modules.device_management.health_history import area_of
+from modules.device_management.maintenance_scheduler import part_type_for
+
+# 消耗备件的日志事件
+CONSUMPTION_EVENT = 'maintenance'
+
+# 库存表未提供lead_time_days列时的补货提前期（天）
+DEFAULT_LEAD_TIME_DAYS = 14
+
+# 库存表未配置安全库存下限的备件类型
+DEFAULT_SAFETY_STOCK = 5
+
+FORECAST_COLUMNS = ['part_type', 'site', 'consumed', 'daily_demand', 'demand_std']
+
+
+class SparePartsForecaster:
+    """备件消耗预测与再订货计算"""
+
+    def __init__(self, history_days: int = 90, half_life_days: float = 30, service_level: float = 0.95,
+                 review_days: int = 30, lead_time_days: int = DEFAULT_LEAD_TIME_DAYS):
+        """
+        Args:
+            history_days: 统计消耗的历史天数
+            half_life_days: 指数加权半衰期（天），近期消耗权重更高
+            service_level: 补货期内不缺货的目标概率（决定安全库存系数）
+            review_days: 每次订货覆盖的天数（订货补到再订货点+该天数的需求）
+            lead_time_days: 默认补货提前期（天）
+        """
+        self.history_days = history_days
+        self.half_life_days = half_life_days
+        self.service_level = service_level
+        self.review_days = review_days
+        self.lead_time_days = lead_time_days
+        self.z = NormalDist().inv_cdf(service_level)
+
+    def forecast(self, df: pd.DataFrame, end: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        各备件类型在各区域的日需求预测
+
+        Args:
+            df: 设备日志（需要timestamp/device_id/event_type列）
+            end: 统计截止日（含），默认今天
+
+        Returns:
+            DataFrame[part_type, site, consumed(窗口内消耗数), daily_demand, demand_std]
+        """
+        if df.empty:
+            return pd.DataFrame(columns=FORECAST_COLUMNS)
+
+        end_day = pd.Timestamp(end or datetime.now()).normalize()
+        start_day = end_day - timedelta(days=self.history_days - 1)
+        # 日志晚于窗口起点开始时，只按实际有日志的天数统计，避免低估消耗率
+        first_day = max(start_day, df['timestamp'].min().normalize())
+        n_days = max((end_day - first_day).days + 1, 1)
+
+        events = df[(df['event_type'] == CONSUMPTION_EVENT) & (df['timestamp'] >= first_day)
+                    & (df['timestamp'] < end_day + timedelta(days=1))]
+        if events.empty:
+            return pd.DataFrame(columns=FORECAST_COLUMNS)
+
+        # 备件类型和区域只需对不重复的设备ID推断
+        codes, devices = pd.factorize(events['device_id'].astype(str))
+        parts = np.array([part_type_for(d) for d in devices], dtype=object)[codes]
+        sites = np.array([area_of(d) for d in devices], dtype=object)[codes]
+        day = (events['timestamp'].dt.normalize() - first_day).dt.days.to_numpy()
+
+        counts = (
+            pd.DataFrame({'part_type': parts, 'site': sites, 'day': day})
+            .dropna(subset=['part_type'])
+            .groupby(['part_type', 'site', 'day']).size()
+            .unstack('day', fill_value=0)
+            .reindex(columns=range(n_days), fill_value=0)
+        )
+        if counts.empty:
+            return pd.DataFrame(columns=FORECAST_COLUMNS)
+
+        # 指数加权的日消耗均值和方差（最近一天权重为1）
+        matrix = counts.to_numpy(dtype=float)
+        weights = 0.5 ** ((n_days - 1 - np.arange(n_days)) / self.half_life_days)
+        weights /= weights.sum()
+        mean = matrix @ weights
+        var = ((matrix - mean[:, None]) ** 2) @ weights
+
+        result = counts.index.to_frame(index=False)
+        result['consumed'] = matrix.sum(axis=1).astype(int)
+        result['daily_demand'] = mean
+        result['demand_std'] = np.sqrt(var)
+        return result.sort_values('consumed', ascending=False, kind='stable').reset_index(drop=True)
+
+    def reorder_plan(self, inventory: pd.DataFrame, forecast: pd.DataFrame,
+                     safety_stock: Optional[Dict[str, int]] = None) -> pd.DataFrame:
+        """
+        对库存表逐行计算再订货点和建议订货量
+
+        库存表必需列 part_type/quantity；可选列 site（按区域备货，否则汇总全部区域的需求）、
+        lead_time_days（补货提前期）、on_order（已下单未到货数量）
+
+        Args:
+            inventory: 库存表
+            forecast: forecast()的结果
+            safety_stock: 各备件类型的安全库存下限（动态安全库存不低于该值）
+
+        Returns:
+            库存表加上 daily_demand, lead_time_days, lead_time_demand, safety_stock, reorder_point,
+            order_quantity, days_of_cover, alert_level 列
+        """
+        plan = inventory.copy()
+        keys = ['part_type', 'site'] if 'site' in plan.columns else ['part_type']
+
+        # 不分区域备货时，各区域需求相加（区域间独立，方差相加）
+        demand = forecast.assign(demand_var=forecast['demand_std'].astype(float) ** 2)
+        demand = demand.groupby(keys, as_index=False)[['daily_demand', 'demand_var']].sum()
+        plan = plan.merge(demand, on=keys, how='left')
+
+        daily = plan['daily_demand'].fillna(0.0).to_numpy(dtype=float)
+        std = np.sqrt(plan['demand_var'].fillna(0.0).to_numpy(dtype=float))
+        stock = plan['quantity'].to_numpy(dtype=float)
+        on_order = plan['on_order'].fillna(0).to_numpy(dtype=float) if 'on_order' in plan.columns else 0.0
+        lead = (plan['lead_time_days'].fillna(self.lead_time_days).to_numpy(dtype=float)
+                if 'lead_time_days' in plan.columns else np.full(len(plan), float(self.lead_time_days)))
+
+        # 提前期需求 ~ N(d·L, σ²·L)，安全库存取服务水平分位数与配置下限中的较大值
+        lead_demand = daily * lead
+        floor = plan['part_type'].map(safety_stock or {}).fillna(DEFAULT_SAFETY_STOCK).to_numpy(dtype=float)
+        safety = np.maximum(np.ceil(self.z * std * np.sqrt(lead)), floor)
+        reorder_point = np.ceil(lead_demand) + safety
+
+        # 库存位置（现有+在途）不高于再订货点时，订货补到 再订货点 + 一个订货周期的需求
+        position = stock + on_order
+        order_up_to = reorder_point + np.ceil(daily * self.review_days)
+        order_quantity = np.where(position <= reorder_point, np.maximum(order_up_to - position, 0), 0)
+
+        # 现有库存撑不到补货到达或低于安全库存一半为严重，需要订货为警告
+        critical = (stock < lead_demand) | (stock < safety * 0.5)
+        alert_level = np.where(critical, 'critical', np.where(order_quantity > 0, 'warning', None))
+
+        # 只在有需求的备件上做除法（0/0不会产生invalid警告），无需求的备件可用天数为无穷
+        days_of_cover = np.divide(stock, daily, out=np.full_like(stock, np.inf), where=daily > 0)
+
+        plan = plan.drop(columns=['demand_var'])
+        plan['daily_demand'] = daily
+        plan['lead_time_days'] = lead
+        plan['lead_time_demand'] = lead_demand
+        plan['safety_stock'] = safety.astype(int)
+        plan['reorder_point'] = reorder_point.astype(int)
+        plan['order_quantity'] = order_quantity.astype(int)
+        plan['days_of_cover'] = days_of_cover
+        plan['alert_level'] = alert_level
+        return plan
@@ -9,7 +9,7 @@ import json
 from datetime import datetime
 from pathlib import Path
 import hashlib
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterator, Tuple
 import requests
 from bs4 import BeautifulSoup
 import pandas as pd
@@ -18,6 +18,8 @@ import PyPDF2
 import numpy as np
 import os
 
+from .vector_index import IVFFlatIndex
+
 # 导入 Supabase 适配器
 try:
     from .supabase_adapter import get_supabase_adapter
@@ -31,6 +33,17 @@ class KnowledgeBase:
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
         self._init_database()
         
+        # 向量近似最近邻索引（与数据库同目录，启动时只做内存映射）
+        self.vector_index = IVFFlatIndex(self.db_path.parent / f"{self.db_path.stem}_vectors")
+        # 索引未由数据库全量构建过时按需重建：记录重建时的数据库文件版本，
+        # 数据库中没有 embedding（无法标记索引）且未变化时不重复重建
+        self._index_rebuild_version = None
+        
+        # 全部 embedding 的连续矩阵（精确搜索时按需加载，数据库文件变化后重新加载）
+        self._embedding_ids: Optional[np.ndarray] = None
+        self._embedding_matrix: Optional[np.ndarray] = None
+        self._embedding_version = None
+        
         # 初始化 Supabase 支持
         self.supabase = None
         if SUPABASE_SUPPORT:
@@ -57,12 +70,20 @@ class KnowledgeBase:
             external_url TEXT,
             tags TEXT,
             embedding_vector TEXT,
+            embedding_blob BLOB,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             last_crawled_at TIMESTAMP
         )
         """)
         
+        # 旧数据库补充 embedding 列：embedding_blob 为归一化后的 float32 二进制向量，
+        # embedding_vector 为旧版 JSON 文本向量（部分旧库没有此列，迁移和兼容读取都会查询它）
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(knowledge_items)")}
+        for column, column_type in (('embedding_vector', 'TEXT'), ('embedding_blob', 'BLOB')):
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE knowledge_items ADD COLUMN {column} {column_type}")
+        
         # 创建索引
         cursor.execute("""
         CREATE INDEX IF NOT EXISTS idx_content_type 
@@ -451,6 +472,9 @@ class KnowledgeBase:
         conn.commit()
         conn.close()
         
+        if success:
+            self.vector_index.remove(knowledge_id)
+        
         return success
     
     def generate_rag_response(self, query: str, ai_client, model: str = "deepseek-chat") -> str:
@@ -603,19 +627,19 @@ class KnowledgeBase:
                 conn.close()
                 return False
             
-            # 存储为 JSON 字符串
-            embedding_json = json.dumps(embedding)
-            
-            # 更新数据库
+            # 存储为归一化的 float32 二进制（1536维约6KB，JSON 文本约20KB）
             cursor.execute("""
             UPDATE knowledge_items 
-            SET embedding_vector = ?, updated_at = CURRENT_TIMESTAMP
+            SET embedding_blob = ?, embedding_vector = NULL, updated_at = CURRENT_TIMESTAMP
             WHERE id = ?
-            """, (embedding_json, item_id))
+            """, (self._pack_embedding(embedding), item_id))
             
             conn.commit()
             conn.close()
             
+            # 增量更新向量索引
+            self.vector_index.add(item_id, embedding)
+            
             print(f"✅ 已为知识条目 {item_id} 生成 embedding")
             return True
         
@@ -625,17 +649,19 @@ class KnowledgeBase:
     
     def update_all_embeddings(self) -> Dict[str, int]:
         """
-        为所有没有 embedding 的知识条目生成向量
+        为所有没有 embedding 的知识条目生成向量（旧的 JSON 格式向量先转换，不重新生成）
         返回统计信息
         """
         try:
+            self.migrate_embeddings(vacuum=False)
+            
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
             # 查找所有没有 embedding 的条目
             cursor.execute("""
             SELECT id FROM knowledge_items 
-            WHERE embedding_vector IS NULL OR embedding_vector = ''
+            WHERE embedding_blob IS NULL AND (embedding_vector IS NULL OR embedding_vector = '')
             """)
             
             items_to_update = cursor.fetchall()
@@ -660,14 +686,174 @@ class KnowledgeBase:
             print(f"批量更新 embeddings 失败: {e}")
             return {'total': 0, 'success': 0, 'failed': 0}
     
-    def vector_search(self, query: str, limit: int = 5, threshold: float = 0.5) -> List[Dict]:
+    @staticmethod
+    def _pack_embedding(embedding: List[float]) -> bytes:
+        """embedding -> 归一化后的 float32 二进制（小端）"""
+        vector = np.asarray(embedding, dtype='<f4')
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm > 0 else vector).astype('<f4').tobytes()
+    
+    def _iter_embeddings(self, batch_size: int = 10000) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
         """
-        基于向量相似度的语义搜索
+        分批读取全部 embedding（兼容尚未迁移的 JSON 格式），跳过与首个向量维度不同的条目
+        
+        Yields:
+            (条目ID数组, (n, dim) float32 矩阵)
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("""
+        SELECT id, embedding_blob, embedding_vector FROM knowledge_items
+        WHERE embedding_blob IS NOT NULL OR (embedding_vector IS NOT NULL AND embedding_vector != '')
+        ORDER BY id
+        """)
+        
+        dim = None
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                
+                item_ids, blobs = [], []
+                for item_id, blob, embedding_json in rows:
+                    if blob is None:
+                        try:
+                            blob = self._pack_embedding(json.loads(embedding_json))
+                        except (TypeError, ValueError):
+                            continue
+                    dim = dim or len(blob) // 4
+                    if len(blob) != dim * 4:
+                        print(f"知识条目 {item_id} 的 embedding 维度与其他条目不同，已跳过")
+                        continue
+                    item_ids.append(item_id)
+                    blobs.append(blob)
+                
+                if item_ids:
+                    matrix = np.frombuffer(b''.join(blobs), dtype='<f4').reshape(len(item_ids), dim)
+                    yield np.array(item_ids, dtype=np.int64), matrix
+        finally:
+            conn.close()
+    
+    def _load_embedding_matrix(self) -> Tuple[np.ndarray, np.ndarray]:
+        """全部 embedding 的连续 float32 矩阵（已归一化），数据库文件未变化时复用"""
+        stat = self.db_path.stat()
+        version = (stat.st_mtime_ns, stat.st_size)
+        if self._embedding_matrix is None or self._embedding_version != version:
+            batches = list(self._iter_embeddings())
+            if batches:
+                self._embedding_ids = np.concatenate([ids for ids, _ in batches])
+                self._embedding_matrix = np.concatenate([matrix for _, matrix in batches])
+            else:
+                self._embedding_ids = np.zeros(0, dtype=np.int64)
+                self._embedding_matrix = np.zeros((0, 0), dtype=np.float32)
+            self._embedding_version = version
+        return self._embedding_ids, self._embedding_matrix
+    
+    def _exact_search(self, query_embedding: List[float], k: int) -> List[Tuple[int, float]]:
+        """精确搜索：一次矩阵-向量乘积得到与全部条目的余弦相似度"""
+        item_ids, matrix = self._load_embedding_matrix()
+        if not len(item_ids):
+            return []
+        
+        query = np.frombuffer(self._pack_embedding(query_embedding), dtype='<f4')
+        scores = matrix @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(item_ids[i]), float(scores[i])) for i in top]
+    
+    def migrate_embeddings(self, batch_size: int = 1000, vacuum: bool = True) -> Dict[str, int]:
+        """
+        把 JSON 文本格式的 embedding 转换为 float32 二进制（embedding_blob），并清空 JSON 列，
+        转换后的向量同时写入向量索引
+        
+        Args:
+            batch_size: 每批转换的条目数（每批提交一次）
+            vacuum: 转换后是否 VACUUM 回收 JSON 文本占用的空间
+        
+        Returns:
+            {'migrated': 转换条数, 'failed': 无法解析（已清空，待重新生成）的条数}
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        migrated = failed = 0
+        last_id = 0
+        while True:
+            cursor.execute("""
+            SELECT id, embedding_vector FROM knowledge_items
+            WHERE id > ? AND embedding_blob IS NULL
+              AND embedding_vector IS NOT NULL AND embedding_vector != ''
+            ORDER BY id
+            LIMIT ?
+            """, (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            
+            # 无法解析的 JSON 也清空，之后由 update_all_embeddings 重新生成
+            updates = []
+            indexed_ids, indexed_vectors = [], []
+            for item_id, embedding_json in rows:
+                try:
+                    blob = self._pack_embedding(json.loads(embedding_json))
+                    updates.append((blob, item_id))
+                    indexed_ids.append(item_id)
+                    indexed_vectors.append(np.frombuffer(blob, dtype='<f4'))
+                    migrated += 1
+                except (TypeError, ValueError):
+                    updates.append((None, item_id))
+                    failed += 1
+            
+            cursor.executemany("""
+            UPDATE knowledge_items SET embedding_blob = ?, embedding_vector = NULL WHERE id = ?
+            """, updates)
+            conn.commit()
+            
+            if indexed_ids:
+                self.vector_index.add_many(indexed_ids, np.vstack(indexed_vectors), train=False)
+            
+            last_id = rows[-1][0]
+        
+        if vacuum and (migrated or failed):
+            conn.execute("VACUUM")
+        conn.close()
+        
+        if migrated:
+            self.vector_index.train()
+        
+        if migrated or failed:
+            print(f"✅ embedding 已转换为二进制格式: {migrated} 条，无法解析: {failed} 条")
+        return {'migrated': migrated, 'failed': failed}
+    
+    def rebuild_vector_index(self, batch_size: int = 10000) -> int:
+        """
+        由数据库中已有的 embedding 重建向量索引（分批读取，最后统一聚类）
+        
+        Returns:
+            索引中的条目数
+        """
+        self.vector_index.clear()
+        
+        for item_ids, matrix in self._iter_embeddings(batch_size):
+            self.vector_index.add_many(item_ids.tolist(), matrix, train=False)
+        
+        self.vector_index.train()
+        self.vector_index.mark_complete()
+        
+        print(f"✅ 向量索引已重建: {self.vector_index.size} 条")
+        return self.vector_index.size
+    
+    def vector_search(self, query: str, limit: int = 5, threshold: float = 0.5, exact: bool = False) -> List[Dict]:
+        """
+        基于向量相似度的语义搜索（通过向量索引查询 top-k，只读取命中条目）
         
         Args:
             query: 查询文本
             limit: 返回结果数量
             threshold: 相似度阈值（0-1），低于此值的结果会被过滤
+            exact: 对全部条目精确计算相似度（不使用近似索引）
         
         Returns:
             按相似度排序的知识条目列表
@@ -679,51 +865,58 @@ class KnowledgeBase:
                 print("无法生成查询 embedding，回退到关键词搜索")
                 return self.search_knowledge(query, limit)
             
-            # 2. 获取所有有 embedding 的知识条目
+            # 2. 查询最相似的条目（索引未由数据库全量构建过时先重建），过滤低相似度结果
+            #    多取一倍候选：索引中可能残留已被直接从数据库删除的条目，过滤后仍能凑满 limit 条
+            k = limit * 2
+            if exact:
+                candidates = self._exact_search(query_embedding, k)
+            else:
+                # 只增量写入过的索引（如旧库上新增了一条）缺少已有条目，需由数据库全量构建
+                if not self.vector_index.complete:
+                    stat = self.db_path.stat()
+                    version = (stat.st_mtime_ns, stat.st_size)
+                    if self._index_rebuild_version != version:
+                        self.rebuild_vector_index()
+                        self._index_rebuild_version = version
+                candidates = self.vector_index.search(query_embedding, k=k)
+            hits = [(item_id, similarity) for item_id, similarity in candidates if similarity >= threshold]
+            if not hits:
+                return []
+            
+            # 3. 读取命中条目，按相似度降序返回
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
-            cursor.execute("""
-            SELECT id, title, content, content_type, file_path, external_url, tags, 
-                   embedding_vector, created_at
+            placeholders = ','.join('?' * len(hits))
+            cursor.execute(f"""
+            SELECT id, title, content, content_type, file_path, external_url, tags, created_at
             FROM knowledge_items
-            WHERE embedding_vector IS NOT NULL AND embedding_vector != ''
-            """)
-            
-            results = []
-            for row in cursor.fetchall():
-                item_id, title, content, content_type, file_path, external_url, tags, embedding_json, created_at = row
-                
-                # 解析 embedding
-                try:
-                    item_embedding = json.loads(embedding_json)
-                except:
-                    continue
-                
-                # 计算相似度
-                similarity = self.cosine_similarity(query_embedding, item_embedding)
-                
-                # 过滤低相似度结果
-                if similarity >= threshold:
-                    results.append({
-                        'id': item_id,
-                        'title': title,
-                        'content': content,
-                        'content_type': content_type,
-                        'file_path': file_path,
-                        'external_url': external_url,
-                        'tags': tags,
-                        'created_at': created_at,
-                        'similarity': similarity
-                    })
+            WHERE id IN ({placeholders})
+            """, [item_id for item_id, _ in hits])
             
+            items = {row[0]: row for row in cursor.fetchall()}
             conn.close()
             
-            # 3. 按相似度降序排序
-            results.sort(key=lambda x: x['similarity'], reverse=True)
-            
-            # 4. 返回 top-k 结果
-            return results[:limit]
+            results = []
+            for item_id, similarity in hits:
+                if item_id not in items:
+                    continue
+                _, title, content, content_type, file_path, external_url, tags, created_at = items[item_id]
+                results.append({
+                    'id': item_id,
+                    'title': title,
+                    'content': content,
+                    'content_type': content_type,
+                    'file_path': file_path,
+                    'external_url': external_url,
+                    'tags': tags,
+                    'created_at': created_at,
+                    'similarity': similarity
+                })
+                if len(results) >= limit:
+                    break
+            
+            return results
         
         except Exception as e:
             print(f"向量搜索失败: {e}")
@@ -0,0 +1,104 @@
+"""
+结果缓存模块
+按 (键, 数据版本) 缓存耗时计算的结果：数据版本变化或超过有效期时重新计算，
+同一键同一版本的并发请求只执行一次计算（single-flight），其余请求等待并共享结果
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class VersionedResultCache:
+    """带数据版本和有效期的结果缓存（线程安全）"""
+
+    def __init__(self, ttl_seconds: float = 300):
+        """
+        Args:
+            ttl_seconds: 结果有效期（秒），数据版本不变时超过有效期也重新计算
+        """
+        self.ttl_seconds = ttl_seconds
+
+        # {键: (数据版本, 结果, 计算完成时间)}
+        self._entries: Dict[Hashable, Tuple[Hashable, Any, float]] = {}
+        # {键: (数据版本, Future)} 正在进行的计算
+        self._in_flight: Dict[Hashable, Tuple[Hashable, Future]] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    def get(self, key: Hashable, version: Hashable, compute: Callable[[], Any],
+            ttl_seconds: Optional[float] = None) -> Any:
+        """
+        取缓存结果，缺失、过期或版本不同时计算
+
+        Args:
+            key: 缓存键（通常为计算参数）
+            version: 输入数据版本（如源文件修改时间），与缓存不同时视为失效
+            compute: 计算函数
+            ttl_seconds: 覆盖默认有效期
+
+        Returns:
+            计算结果（多个调用方共享同一对象，调用方不应修改）
+        """
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version and time.monotonic() - entry[2] <= ttl:
+                self.hits += 1
+                return entry[1]
+
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None and in_flight[0] == version:
+                # 相同输入的计算正在进行，等待其结果
+                self.shared += 1
+                future = in_flight[1]
+                owner = False
+            else:
+                self.misses += 1
+                future = Future()
+                self._in_flight[key] = (version, future)
+                owner = True
+
+        if not owner:
+            return future.result()
+
+        try:
+            result = compute()
+        except BaseException as e:
+            # 失败不缓存，等待中的请求收到同一异常
+            with self._lock:
+                if self._in_flight.get(key, (None, None))[1] is future:
+                    del self._in_flight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._entries[key] = (version, result, time.monotonic())
+            if self._in_flight.get(key, (None, None))[1] is future:
+                del self._in_flight[key]
+        future.set_result(result)
+
+        return result
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """清除某个键或全部缓存（不影响正在进行的计算）"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'in_flight': len(self._in_flight),
+                'hits': self.hits,
+                'misses': self.misses,
+                'shared': self.shared
+            }
@@ -0,0 +1,353 @@
+"""
+向量近似最近邻索引（IVF-Flat）
+向量归一化后以float32存放在内存映射文件中（vectors.f32，每行一个条目，启动时只映射不读取），
+k-means聚类中心把向量划分为若干倒排列表，查询时只扫描与查询向量最接近的n_probe个列表，
+内积即余弦相似度；新增/更新的向量直接写入映射文件并加入所属列表，无需重建索引，
+条目数增长到训练时的数倍后重新聚类
+"""
+
+import json
+import os
+import threading
+import numpy as np
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+# 条目少于此数量时不聚类，查询逐条精确比较
+MIN_TRAIN_SIZE = 1024
+
+# 条目数达到上次训练时的N倍后重新聚类（倒排列表过长会拖慢查询）
+RETRAIN_GROWTH = 4
+
+# k-means参数：每个聚类中心的训练样本数、迭代次数
+TRAIN_SAMPLES_PER_LIST = 32
+KMEANS_ITERATIONS = 10
+
+# 分批计算向量与聚类中心的内积，限制临时矩阵的内存
+ASSIGN_BATCH = 8192
+
+# 已删除条目的列表编号
+DELETED = -1
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """按行L2归一化（零向量保持为零）"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+class IVFFlatIndex:
+    """基于倒排列表的余弦相似度近似最近邻索引"""
+
+    def __init__(self, index_dir: str, n_probe: int = 16):
+        """
+        Args:
+            index_dir: 索引目录（meta.json、vectors.f32、rows.i64、centroids.npy）
+            n_probe: 每次查询扫描的倒排列表数（越大召回越高、越慢）
+        """
+        self.index_dir = Path(index_dir)
+        self.meta_path = self.index_dir / 'meta.json'
+        self.vectors_path = self.index_dir / 'vectors.f32'
+        self.rows_path = self.index_dir / 'rows.i64'
+        self.centroids_path = self.index_dir / 'centroids.npy'
+        self.n_probe = n_probe
+
+        # 多个页面/线程共用同一个知识库对象
+        self._lock = threading.RLock()
+        self._open()
+
+    # ---------- 存储 ----------
+
+    def _reset(self):
+        self.dim: Optional[int] = None
+        self.count = 0          # 已使用的行数（含已删除）
+        self.capacity = 0
+        self.trained_size = 0   # 上次聚类时的条目数
+        self.complete = False   # 是否由数据源全量构建过（之后的增删均已同步到索引）
+        self.vectors: Optional[np.memmap] = None
+        self.rows: Optional[np.memmap] = None   # 每行 (条目ID, 列表编号)
+        self.centroids: Optional[np.ndarray] = None
+        self._row_of = {}
+        self._lists: List[np.ndarray] = []
+        self._meta_mtime = None
+
+    def _open(self):
+        """映射索引文件，按列表编号重建倒排列表（只读取行信息，不读取向量）"""
+        with self._lock:
+            self._reset()
+            if not self.meta_path.exists():
+                return
+
+            try:
+                meta = json.loads(self.meta_path.read_text(encoding='utf-8'))
+                self.dim = meta['dim']
+                self.count = meta['count']
+                self.capacity = meta['capacity']
+                self.trained_size = meta['trained_size']
+                self.complete = meta.get('complete', False)
+                self._map()
+                if self.centroids_path.exists():
+                    self.centroids = np.load(self.centroids_path, allow_pickle=False)
+            except Exception as e:
+                print(f"读取向量索引失败，需重建 {self.index_dir}: {e}")
+                self._reset()
+                return
+
+            self._meta_mtime = self.meta_path.stat().st_mtime_ns
+            rows = np.asarray(self.rows[:self.count])
+            live = np.flatnonzero(rows[:, 1] != DELETED)
+            self._row_of = dict(zip(rows[live, 0].tolist(), live.tolist()))
+            self._build_lists(live, rows[live, 1])
+
+    def _map(self):
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r+', shape=(self.capacity, self.dim))
+        self.rows = np.memmap(self.rows_path, dtype=np.int64, mode='r+', shape=(self.capacity, 2))
+
+    def _build_lists(self, rows: np.ndarray, list_no: np.ndarray):
+        n_lists = len(self.centroids) if self.centroids is not None else 1
+        order = np.argsort(list_no, kind='stable')
+        bounds = np.cumsum(np.bincount(list_no, minlength=n_lists))
+        self._lists = np.split(rows[order], bounds[:-1])
+
+    def _ensure_capacity(self, n: int):
+        """映射文件按容量翻倍扩展"""
+        if n <= self.capacity:
+            return
+
+        capacity = max(n, self.capacity * 2, 1024)
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.rows.flush()
+            self.vectors = self.rows = None
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        for path, row_bytes in ((self.vectors_path, self.dim * 4), (self.rows_path, 16)):
+            with open(path, 'ab') as f:
+                f.truncate(capacity * row_bytes)
+        self.capacity = capacity
+        self._map()
+
+    def _write_meta(self):
+        """原子写入元数据（其他进程据其修改时间判断是否需要重新映射）"""
+        self.vectors.flush()
+        self.rows.flush()
+        meta = {'dim': self.dim, 'count': self.count, 'capacity': self.capacity,
+                'trained_size': self.trained_size, 'complete': self.complete}
+        tmp_path = self.meta_path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(meta), encoding='utf-8')
+        os.replace(tmp_path, self.meta_path)
+        self._meta_mtime = self.meta_path.stat().st_mtime_ns
+
+    def _refresh(self):
+        """其他进程更新了索引时重新映射"""
+        try:
+            mtime = self.meta_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._meta_mtime:
+            self._open()
+
+    @property
+    def size(self) -> int:
+        """有效条目数"""
+        return len(self._row_of)
+
+    # ---------- 写入 ----------
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        """向量所属的倒排列表（内积最大的聚类中心）"""
+        if self.centroids is None:
+            return np.zeros(len(vectors), dtype=np.int64)
+        return np.concatenate([
+            np.argmax(vectors[i:i + ASSIGN_BATCH] @ self.centroids.T, axis=1)
+            for i in range(0, len(vectors), ASSIGN_BATCH)
+        ]) if len(vectors) else np.zeros(0, dtype=np.int64)
+
+    def add_many(self, item_ids: List[int], vectors: np.ndarray, train: bool = True):
+        """
+        批量新增或更新向量（已存在的条目原位覆盖）
+
+        Args:
+            item_ids: 条目ID
+            vectors: (n, dim) 向量，无需预先归一化
+            train: 条目数达到阈值时是否立即（重新）聚类
+
+        Raises:
+            ValueError: 向量维度与索引不一致
+        """
+        vectors = _normalize(vectors)
+        if vectors.ndim != 2 or len(vectors) != len(item_ids):
+            raise ValueError("向量数量与条目ID数量不一致")
+        if not len(item_ids):
+            return
+
+        with self._lock:
+            self._refresh()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"向量维度{vectors.shape[1]}与索引维度{self.dim}不一致，请重建索引")
+
+            # 同一批内重复的ID以最后一次为准
+            last = {int(item_id): i for i, item_id in enumerate(item_ids)}
+            item_ids, vectors = list(last), vectors[list(last.values())]
+
+            rows = np.empty(len(item_ids), dtype=np.int64)
+            new_count = self.count
+            for i, item_id in enumerate(item_ids):
+                row = self._row_of.get(item_id)
+                if row is None:
+                    row = self._row_of[item_id] = new_count
+                    new_count += 1
+                else:
+                    self._remove_from_list(row)
+                rows[i] = row
+
+            self._ensure_capacity(new_count)
+            self.count = new_count
+
+            list_no = self._assign(vectors)
+            order = np.argsort(rows)
+            self.vectors[rows[order]] = vectors[order]
+            self.rows[rows[order]] = np.column_stack([np.array(item_ids, dtype=np.int64), list_no])[order]
+            if not self._lists:
+                self._build_lists(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+            for no in np.unique(list_no):
+                self._lists[no] = np.concatenate([self._lists[no], rows[list_no == no]])
+
+            self._write_meta()
+
+            if train and self._needs_training():
+                self.train()
+
+    def add(self, item_id: int, vector: List[float]):
+        """新增或更新单个条目的向量"""
+        self.add_many([item_id], np.asarray(vector, dtype=np.float32)[None, :])
+
+    def _remove_from_list(self, row: int):
+        no = int(self.rows[row, 1])
+        if no != DELETED and no < len(self._lists):
+            self._lists[no] = self._lists[no][self._lists[no] != row]
+
+    def remove(self, item_id: int) -> bool:
+        """删除条目（所在行标记为已删除，空间在重建时回收）"""
+        with self._lock:
+            self._refresh()
+            row = self._row_of.pop(int(item_id), None)
+            if row is None:
+                return False
+            self._remove_from_list(row)
+            self.rows[row, 1] = DELETED
+            self._write_meta()
+            return True
+
+    def clear(self):
+        """删除全部索引文件"""
+        with self._lock:
+            self.vectors = self.rows = None
+            for path in (self.meta_path, self.vectors_path, self.rows_path, self.centroids_path):
+                path.unlink(missing_ok=True)
+            self._reset()
+
+    def mark_complete(self) -> bool:
+        """
+        标记索引已包含数据源中的全部条目（全量构建完成后调用）
+
+        Returns:
+            是否已标记（索引为空时没有元数据文件，无法标记）
+        """
+        with self._lock:
+            self._refresh()
+            if self.vectors is None:
+                return False
+            self.complete = True
+            self._write_meta()
+            return True
+
+    # ---------- 聚类 ----------
+
+    def _needs_training(self) -> bool:
+        if self.centroids is None:
+            return self.size >= MIN_TRAIN_SIZE
+        return self.size >= self.trained_size * RETRAIN_GROWTH
+
+    def train(self, seed: int = 0):
+        """
+        对抽样向量做球面k-means（聚类中心数约为2·sqrt(N)），再把全部向量重新分配到倒排列表
+        """
+        with self._lock:
+            live = np.array(sorted(self._row_of.values()), dtype=np.int64)
+            if len(live) < MIN_TRAIN_SIZE:
+                return
+
+            n_lists = int(np.clip(2 * np.sqrt(len(live)), 16, 4096))
+            rng = np.random.default_rng(seed)
+            sample_rows = np.sort(rng.choice(live, size=min(len(live), n_lists * TRAIN_SAMPLES_PER_LIST),
+                                             replace=False))
+            sample = np.asarray(self.vectors[sample_rows])
+            print(f"向量索引聚类: {len(live)}条向量，{n_lists}个倒排列表")
+
+            centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+            for _ in range(KMEANS_ITERATIONS):
+                self.centroids = centroids
+                assign = self._assign(sample)
+                # 按所属聚类排序后分段求和，空的聚类保留原中心
+                counts = np.bincount(assign, minlength=n_lists)
+                starts = np.cumsum(counts) - counts
+                nonempty = counts > 0
+                sums = centroids.copy()
+                sums[nonempty] = np.add.reduceat(sample[np.argsort(assign, kind='stable')],
+                                                 starts[nonempty], axis=0)
+                centroids = _normalize(sums)
+
+            self.centroids = centroids
+            list_no = np.concatenate([
+                self._assign(np.asarray(self.vectors[live[i:i + ASSIGN_BATCH]]))
+                for i in range(0, len(live), ASSIGN_BATCH)
+            ])
+            self.rows[live, 1] = list_no
+            self._build_lists(live, list_no)
+
+            tmp_path = self.centroids_path.with_suffix('.tmp')
+            with open(tmp_path, 'wb') as f:
+                np.save(f, centroids)
+            os.replace(tmp_path, self.centroids_path)
+
+            self.trained_size = len(live)
+            self._write_meta()
+
+    # ---------- 查询 ----------
+
+    def search(self, query: List[float], k: int = 5, n_probe: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        查询与query余弦相似度最高的k个条目
+
+        Returns:
+            [(条目ID, 相似度)]，按相似度降序
+        """
+        q = _normalize(np.asarray(query, dtype=np.float32))
+
+        with self._lock:
+            self._refresh()
+            if not self._row_of:
+                return []
+            if len(q) != self.dim:
+                raise ValueError(f"查询向量维度{len(q)}与索引维度{self.dim}不一致")
+
+            if self.centroids is None:
+                probes = range(len(self._lists))
+            else:
+                n_probe = min(n_probe or self.n_probe, len(self.centroids))
+                probes = np.argpartition(-(self.centroids @ q), n_probe - 1)[:n_probe]
+
+            rows = np.concatenate([self._lists[p] for p in probes])
+            if not len(rows):
+                return []
+            rows.sort()  # 按行号顺序读取映射文件
+
+            scores = np.asarray(self.vectors[rows]) @ q
+            k = min(k, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind='stable')]
+
+            return [(int(self.rows[rows[i], 0]), float(scores[i])) for i in top]
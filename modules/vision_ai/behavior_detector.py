@@ -112,6 +112,9 @@ class BehaviorDetector:
         )
         """)
         
+        # 报警关联按时间范围查询检测结果
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_detection_results_timestamp ON detection_results(timestamp)")
+        
         conn.commit()
         conn.close()
     
@@ -28,10 +28,27 @@ def init_database(db_path='./security_ops.db'):
         response_time INTEGER,
         is_false_alarm BOOLEAN,
         risk_level TEXT,
+        source_file TEXT,
         created_at DATETIME DEFAULT CURRENT_TIMESTAMP
     )
     ''')
     
+    # 旧版本创建的报警表补充source_file列
+    alarm_columns = {row[1] for row in cursor.execute('PRAGMA table_info(alarms)')}
+    if 'source_file' not in alarm_columns:
+        cursor.execute('ALTER TABLE alarms ADD COLUMN source_file TEXT')
+    
+    # 创建报警导入记录表（按源文件幂等导入）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS alarm_ingest_log (
+        source_file TEXT PRIMARY KEY,
+        mtime_ns INTEGER,
+        size INTEGER,
+        row_count INTEGER,
+        ingested_at DATETIME
+    )
+    ''')
+    
     # 创建设备状态表
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS device_status (
@@ -89,6 +106,8 @@ def init_database(db_path='./security_ops.db'):
     # 创建索引
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_alarms_timestamp ON alarms(timestamp)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_alarms_device ON alarms(device_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_alarms_device_timestamp ON alarms(device_id, timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_alarms_source ON alarms(source_file)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_device_status_timestamp ON device_status(timestamp)')
     
     conn.commit()
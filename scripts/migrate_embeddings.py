@@ -0,0 +1,40 @@
+"""
+知识库 embedding 迁移脚本
+把 knowledge_items.embedding_vector 中的 JSON 文本向量转换为 float32 二进制（embedding_blob），
+回收 JSON 文本占用的空间，并重建向量索引
+"""
+
+import argparse
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from modules.knowledge_base import KnowledgeBase
+
+
+def migrate_embeddings(db_path='data/knowledge_base.db', rebuild_index=True):
+    """迁移 embedding 存储格式"""
+    if not Path(db_path).exists():
+        print(f"❌ 数据库不存在: {db_path}")
+        return
+
+    size_before = Path(db_path).stat().st_size
+    kb = KnowledgeBase(db_path)
+    result = kb.migrate_embeddings()
+    size_after = Path(db_path).stat().st_size
+
+    print(f"✅ 迁移完成: {result['migrated']} 条，无法解析: {result['failed']} 条")
+    print(f"📦 数据库大小: {size_before / 1024 / 1024:.1f} MB -> {size_after / 1024 / 1024:.1f} MB")
+
+    if rebuild_index:
+        kb.rebuild_vector_index()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='知识库 embedding 迁移为 float32 二进制')
+    parser.add_argument('--db', type=str, default='data/knowledge_base.db', help='知识库数据库路径')
+    parser.add_argument('--skip-index', action='store_true', help='不重建向量索引')
+
+    args = parser.parse_args()
+    migrate_embeddings(args.db, rebuild_index=not args.skip_index)
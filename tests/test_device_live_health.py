@@ -0,0 +1,56 @@
+"""
+实时遥测健康评分测试：新上线设备、心跳稀疏设备的在线时间占比不超过1，健康评分不超过100
+"""
+
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from modules.device_management.device_monitor import DeviceMonitor
+
+
+@pytest.fixture
+def monitor(tmp_path):
+    return DeviceMonitor(data_dir=str(tmp_path / 'devices'), output_dir=str(tmp_path / 'reports'))
+
+
+def test_new_device_single_heartbeat(monitor):
+    monitor.telemetry.record({'device_id': 'AREA1_DOOR001', 'timestamp': datetime.now().isoformat(),
+                              'status': 'online'})
+
+    health = {d['device_id']: d for d in monitor.live_device_health()}['AREA1_DOOR001']
+
+    assert health['uptime_ratio'] == pytest.approx(1.0)
+    assert 0 <= health['health_score'] <= 100
+
+
+def test_sparse_heartbeats(monitor):
+    now = datetime.now()
+    sample_seconds = monitor.telemetry.sample_seconds
+    # 三次心跳间隔30分钟：在线时长 3 × 5分钟，时间跨度 60分钟 + 最后一次心跳的5分钟
+    for minutes in (60, 30, 0):
+        monitor.telemetry.record({'device_id': 'AREA2_CAM001', 'status': 'online',
+                                  'timestamp': (now - timedelta(minutes=minutes)).isoformat()})
+
+    health = {d['device_id']: d for d in monitor.live_device_health()}['AREA2_CAM001']
+
+    assert health['uptime_ratio'] == pytest.approx(3 * sample_seconds / (3600 + sample_seconds), abs=1e-3)
+    assert 0 <= health['health_score'] <= 100
+
+
+def test_fleet_average_bounded(monitor):
+    now = datetime.now()
+    monitor.telemetry.record({'device_id': 'AREA1_DOOR001', 'timestamp': now.isoformat(), 'status': 'online'})
+    for i in range(12):
+        monitor.telemetry.record({'device_id': 'AREA1_DOOR002', 'status': 'online',
+                                  'timestamp': (now - timedelta(seconds=monitor.telemetry.sample_seconds * i)).isoformat()})
+
+    device_health = monitor.live_device_health()
+
+    assert len(device_health) == 2
+    assert all(0 <= d['uptime_ratio'] <= 1 for d in device_health)
+    assert all(0 <= d['health_score'] <= 100 for d in device_health)